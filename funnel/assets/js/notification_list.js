@@ -9,7 +9,7 @@ const Notification = {
         return {
           notifications: [],
           eventids: [],
-          next_num: 1,
+          next_cursor: '',
           waitingForResponse: false,
           markReadUrl,
           observer: '',
@@ -17,7 +17,7 @@ const Notification = {
         };
       },
       methods: {
-        fetchResult(page, refresh = false) {
+        fetchResult(cursor, refresh = false) {
           if (!refresh) {
             // Stop observing the lazy loader element
             notificationApp.observer.unobserve(notificationApp.lazyLoader);
@@ -27,18 +27,15 @@ const Notification = {
             $.ajax({
               type: 'GET',
               data: {
-                page,
+                cursor,
               },
               timeout: window.Hasgeek.Config.ajaxTimeout,
               dataType: 'json',
               success(data) {
                 notificationApp.addNotifications(data.notifications, refresh);
                 if (!refresh) {
-                  if (data.next_num) {
-                    notificationApp.next_num = data.next_num;
-                  } else {
-                    notificationApp.next_num = 0;
-                  }
+                  // A null cursor indicates there are no more notifications
+                  notificationApp.next_cursor = data.next_cursor;
                   // Start observing the lazy loader element to fetch next page when it comes into viewport
                   notificationApp.lazyoad();
                 }
@@ -78,7 +75,9 @@ const Notification = {
         handleObserver(entries) {
           entries.forEach((entry) => {
             if (entry.isIntersecting) {
-              this.fetchResult(notificationApp.next_num);
+              if (notificationApp.next_cursor !== null) {
+                this.fetchResult(notificationApp.next_cursor);
+              }
             }
           });
         },
@@ -124,7 +123,7 @@ const Notification = {
         this.lazyLoader = document.querySelector('.js-lazy-loader');
         this.lazyoad();
         window.setInterval(() => {
-          this.fetchResult(1, true);
+          this.fetchResult('', true);
         }, window.Hasgeek.Config.refreshInterval);
       },
       updated() {
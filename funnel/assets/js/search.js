@@ -50,13 +50,18 @@ const Search = {
           this.fetchResult(searchType);
         }
       },
-      fetchResult(searchType, page = 1) {
+      fetchResult(searchType, cursor = '', page = null) {
         const url = `${this.get('pagePath')}?q=${this.get(
           'queryString'
         )}&type=${searchType}`;
+        // Results are fetched by cursor, except when continuing from page numbered
+        // results that were rendered into the page
+        const pageQuery = page
+          ? `page=${page}`
+          : `cursor=${encodeURIComponent(cursor)}`;
         $.ajax({
           type: 'GET',
-          url: `${url}&page=${page}`,
+          url: `${url}&${pageQuery}`,
           timeout: window.Hasgeek.Config.ajaxTimeout,
           dataType: 'json',
           success(data) {
@@ -65,14 +70,14 @@ const Search = {
               data.results,
               url,
               data.counts,
-              page
+              cursor || page > 1
             );
           },
         });
       },
-      activateTab(searchType, result = '', url = '', tabs = '', page) {
+      activateTab(searchType, result = '', url = '', tabs = '', append = false) {
         if (result) {
-          if (page > 1) {
+          if (append) {
             const existingResults = this.get(`results.${searchType}`);
             const searchResults = [];
             searchResults.push(...existingResults.items);
@@ -106,9 +111,11 @@ const Search = {
       },
       updateMetaTags(searchType, url = '') {
         const q = this.get('queryString');
-        const { count } = this.get(`results.${searchType}`);
+        const { count, exact } = this.get('tabs').find(
+          (tab) => tab.type === searchType
+        );
         const title = `Search results: ${q}`;
-        const description = `${count} results found for "${q}"`;
+        const description = `${count}${exact ? '' : '+'} results found for "${q}"`;
 
         $('title').html(title);
         $('meta[name=DC\\.title]').attr('content', title);
@@ -135,9 +142,12 @@ const Search = {
       handleObserver(entries) {
         entries.forEach((entry) => {
           if (entry.isIntersecting) {
+            const nextCursor = entry.target.getAttribute('data-next-cursor');
             const nextPage = entry.target.getAttribute('data-next-page');
-            if (nextPage) {
-              this.fetchResult(this.get('activeTab'), nextPage);
+            if (nextCursor) {
+              this.fetchResult(this.get('activeTab'), nextCursor);
+            } else if (nextPage) {
+              this.fetchResult(this.get('activeTab'), '', nextPage);
             }
           }
         });
@@ -3,7 +3,10 @@ from __future__ import annotations
 from collections import namedtuple
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from io import StringIO
+from itertools import islice
+from textwrap import dedent
+from typing import Dict, Iterable, Optional
 from urllib.parse import urljoin
 import csv
 import os
@@ -12,13 +15,14 @@ import time
 import zipfile
 
 from flask.cli import AppGroup
+import click
 
 from progressbar import ProgressBar
 from unidecode import unidecode
 import progressbar.widgets
 import requests
 
-from coaster.utils import getbool
+from coaster.utils import getbool, make_name
 
 from .. import app
 from ..models import (
@@ -26,6 +30,7 @@ from ..models import (
     GeoAdmin2Code,
     GeoAltName,
     GeoCountryInfo,
+    GeoGazetteer,
     GeoName,
     db,
 )
@@ -204,9 +209,8 @@ def load_country_info(fd):
     db.session.commit()
 
 
-def load_geonames(fd):
-    """Load geonames matching fixed criteria from the given file descriptor."""
-    progress = get_progressbar()
+def read_geonames(fd):
+    """Read geonames matching fixed criteria, sorted by importance."""
     print("Loading geonames...")  # noqa: T001
     size = sum(1 for line in fd)
     fd.seek(0)  # Return to start
@@ -288,6 +292,13 @@ def load_geonames(fd):
             reverse=True,
         )
     ]
+    return geonames
+
+
+def load_geonames(fd):
+    """Load geonames matching fixed criteria from the given file descriptor."""
+    progress = get_progressbar()
+    geonames = read_geonames(fd)
     GeoName.query.all()  # Load all data into session cache for faster lookup
 
     print(f"Processing {len(geonames)} records...")  # noqa: T001
@@ -386,6 +397,252 @@ def load_alt_names(fd):
     db.session.commit()
 
 
+# --- Bulk loading ---------------------------------------------------------------------
+
+#: Number of rows sent to the database in each COPY
+BULK_BATCH_SIZE = 50000
+
+
+def copy_value(value) -> str:
+    """Render a value for PostgreSQL's COPY text format."""
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def copy_rows(cursor, table: str, columns: Iterable[str], rows) -> int:
+    """Load rows into a table with COPY, in batches. Returns the number of rows."""
+    statement = f'COPY {table} ({", ".join(columns)}) FROM STDIN'
+    count = 0
+    for batch in chunked(rows, BULK_BATCH_SIZE):
+        buffer = StringIO()
+        for row in batch:
+            buffer.write('\t'.join(copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        count += len(batch)
+    return count
+
+
+def chunked(iterable, size: int):
+    """Yield lists of up to `size` items from the iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def bulk_load_geonames(fd):
+    """
+    Load geonames using COPY into a staging table and a single upsert.
+
+    Unique URL names are assigned in memory in order of importance, matching
+    :meth:`GeoName.make_name`, instead of querying for each candidate name.
+    """
+    geonames = read_geonames(fd)
+    connection = db.get_engine(app, bind='geoname').raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SELECT id, name FROM geo_name')
+        names_by_id: Dict[int, str] = dict(cursor.fetchall())
+        ids_by_name: Dict[str, int] = {
+            name: geonameid for geonameid, name in names_by_id.items()
+        }
+
+        def make_geoname_name(geonameid: int, usetitle: str) -> str:
+            name = str(
+                make_name(
+                    usetitle,
+                    maxlength=250,
+                    checkused=lambda c: ids_by_name.get(c, geonameid) != geonameid,
+                )
+            )
+            old_name = names_by_id.get(geonameid)
+            if old_name is not None and old_name != name:
+                del ids_by_name[old_name]
+            names_by_id[geonameid] = name
+            ids_by_name[name] = geonameid
+            return name
+
+        def transform():
+            for item in geonames:
+                if not item.geonameid:
+                    continue
+                geonameid = int(item.geonameid)
+                ascii_title = item.ascii_title or unidecode(item.title or '').replace(
+                    '@', 'a'
+                )
+                yield (
+                    geonameid,
+                    make_geoname_name(
+                        geonameid,
+                        GeoName.name_title(ascii_title, item.fclass, item.fcode),
+                    ),
+                    item.title or '',
+                    ascii_title,
+                    Decimal(item.latitude) or None,
+                    Decimal(item.longitude) or None,
+                    item.fclass or None,
+                    item.fcode or None,
+                    item.country_id or None,
+                    item.cc2 or None,
+                    item.admin1 or None,
+                    item.admin2 or None,
+                    item.admin3 or None,
+                    item.admin4 or None,
+                    int(item.population) if item.population else None,
+                    int(item.elevation) if item.elevation else None,
+                    int(item.dem) if item.dem else None,
+                    item.timezone or None,
+                    item.moddate or None,
+                )
+
+        columns = [
+            'id',
+            'name',
+            'title',
+            'ascii_title',
+            'latitude',
+            'longitude',
+            'fclass',
+            'fcode',
+            'country',
+            'cc2',
+            'admin1',
+            'admin2',
+            'admin3',
+            'admin4',
+            'population',
+            'elevation',
+            'dem',
+            'timezone',
+            'moddate',
+        ]
+        cursor.execute(
+            'CREATE TEMPORARY TABLE geo_name_staging ON COMMIT DROP AS'
+            f' SELECT {", ".join(columns)} FROM geo_name WITH NO DATA'
+        )
+        print("Copying geonames...")  # noqa: T001
+        count = copy_rows(cursor, 'geo_name_staging', columns, transform())
+        print(f"Merging {count} records...")  # noqa: T001
+        # Move names being taken over by another record out of the way, as the unique
+        # constraint on name is checked for each row in the upsert
+        cursor.execute(
+            dedent(
+                """
+                UPDATE geo_name SET name = '~' || geo_name.id
+                FROM geo_name_staging
+                WHERE geo_name.name = geo_name_staging.name
+                AND geo_name.id != geo_name_staging.id
+                """
+            )
+        )
+        updates = ', '.join(
+            f'{column} = EXCLUDED.{column}' for column in columns if column != 'id'
+        )
+        cursor.execute(
+            dedent(
+                f"""
+                INSERT INTO geo_name (
+                    created_at, updated_at, admin1_id, admin2_id, {", ".join(columns)}
+                )
+                SELECT
+                    now(), now(), geo_admin1_code.id, geo_admin2_code.id,
+                    {", ".join(f"geo_name_staging.{column}" for column in columns)}
+                FROM geo_name_staging
+                LEFT JOIN geo_admin1_code ON (
+                    geo_admin1_code.country = geo_name_staging.country
+                    AND geo_admin1_code.admin1_code = geo_name_staging.admin1
+                )
+                LEFT JOIN geo_admin2_code ON (
+                    geo_admin2_code.country = geo_name_staging.country
+                    AND geo_admin2_code.admin1_code = geo_name_staging.admin1
+                    AND geo_admin2_code.admin2_code = geo_name_staging.admin2
+                )
+                ON CONFLICT (id) DO UPDATE SET
+                    updated_at = now(),
+                    admin1_id = EXCLUDED.admin1_id,
+                    admin2_id = EXCLUDED.admin2_id,
+                    {updates}
+                """
+            )
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def bulk_load_alt_names(fd):
+    """Load alternative names using COPY into a staging table and a single upsert."""
+    print("Loading alternate names...")  # noqa: T001
+    connection = db.get_engine(app, bind='geoname').raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SELECT id FROM geo_name')
+        geonameids = {row[0] for row in cursor.fetchall()}
+
+        def transform():
+            for row in csv.reader(fd, delimiter='\t'):
+                if row[0].startswith('#') or not row[1]:
+                    continue
+                item = GeoAltNameRecord(*row[: len(GeoAltNameRecord._fields)])
+                if int(item.geonameid) not in geonameids:
+                    continue
+                yield (
+                    int(item.id),
+                    int(item.geonameid),
+                    item.lang or None,
+                    item.title,
+                    getbool(item.is_preferred_name) or False,
+                    getbool(item.is_short_name) or False,
+                    getbool(item.is_colloquial) or False,
+                    getbool(item.is_historic) or False,
+                )
+
+        columns = [
+            'id',
+            'geonameid',
+            'lang',
+            'title',
+            'is_preferred_name',
+            'is_short_name',
+            'is_colloquial',
+            'is_historic',
+        ]
+        cursor.execute(
+            'CREATE TEMPORARY TABLE geo_alt_name_staging ON COMMIT DROP AS'
+            f' SELECT {", ".join(columns)} FROM geo_alt_name WITH NO DATA'
+        )
+        count = copy_rows(cursor, 'geo_alt_name_staging', columns, transform())
+        print(f"Merging {count} records...")  # noqa: T001
+        updates = ', '.join(
+            f'{column} = EXCLUDED.{column}' for column in columns if column != 'id'
+        )
+        cursor.execute(
+            dedent(
+                f"""
+                INSERT INTO geo_alt_name (created_at, updated_at, {", ".join(columns)})
+                SELECT now(), now(), {", ".join(columns)} FROM geo_alt_name_staging
+                ON CONFLICT (id) DO UPDATE SET updated_at = now(), {updates}
+                WHERE ({", ".join(f"geo_alt_name.{column}" for column in columns)})
+                IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in columns)})
+                """
+            )
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
 def load_admin1_codes(fd):
     """Load admin1 codes from the given file descriptor."""
     print("Loading admin1 codes...")  # noqa: T001
@@ -452,7 +709,12 @@ def download():
 
 
 @geo.command('process')
-def process():
+@click.option(
+    '--bulk',
+    is_flag=True,
+    help="Load geonames and alternate names with COPY and bulk upserts",
+)
+def process(bulk):
     """Process downloaded geonames data."""
     with open('geoname_data/countryInfo.txt', newline='') as fd:
         load_country_info(fd)
@@ -461,11 +723,20 @@ def process():
     with open('geoname_data/admin2Codes.txt', newline='') as fd:
         load_admin2_codes(fd)
     with open('geoname_data/IN.txt', newline='') as fd:
-        load_geonames(fd)
+        (bulk_load_geonames if bulk else load_geonames)(fd)
     with open('geoname_data/allCountries.txt', newline='') as fd:
-        load_geonames(fd)
+        (bulk_load_geonames if bulk else load_geonames)(fd)
     with open('geoname_data/alternateNames.txt', newline='') as fd:
-        load_alt_names(fd)
+        (bulk_load_alt_names if bulk else load_alt_names)(fd)
+
+
+@geo.command('gazetteer')
+@click.argument('path', default='geoname_data/gazetteer.pickle')
+def gazetteer(path):
+    """Save a gazetteer of geoname titles for use with GEONAME_GAZETTEER."""
+    print("Building gazetteer...")  # noqa: T001
+    GeoGazetteer.from_database().save(path)
+    print(f"Saved to {path}")  # noqa: T001
 
 
 app.cli.add_command(geo)
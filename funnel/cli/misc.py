@@ -3,7 +3,8 @@ from __future__ import annotations
 from baseframe import baseframe_translations
 
 from .. import app, models
-from ..models import db
+from ..models import SearchDocument, db
+from ..views.search import search_document_upsert, search_providers
 
 
 @app.shell_context_processor
@@ -32,3 +33,12 @@ CREATE EXTENSION IF NOT EXISTS hll;
 def baseframe_translations_path():
     """Show path to Baseframe translations."""
     print(baseframe_translations.dirname)  # noqa: T001
+
+
+@app.cli.command('reindex_search')
+def reindex_search():
+    """Rebuild search documents for all searchable objects."""
+    db.session.execute(SearchDocument.__table__.delete())
+    for stype in search_providers:
+        db.session.execute(search_document_upsert(stype))
+    db.session.commit()
@@ -14,7 +14,12 @@ from coaster.utils import midnight_to_utc, utcnow
 
 from .. import app, models
 from ..models import db
+from ..views.api.email_events import process_ses_event_queue
+from ..views.login_session import flush_user_session_access
 from ..views.notification import dispatch_notification
+from ..views.notification_feed import reconcile_notification_unread_counts
+from ..views.project_listing import warm_project_listings
+from ..views.shortlink import count_shortlink_clicks
 
 # --- Data sources ---------------------------------------------------------------------
 
@@ -70,6 +75,44 @@ def phoneclaims():
     db.session.commit()
 
 
+@periodic.command('user_session_access')
+def user_session_access():
+    """Write user session access recorded in Redis to the database (1m)."""
+    flush_user_session_access()
+
+
+@periodic.command('ses_events')
+def ses_events():
+    """Apply SES delivery events queued in Redis to email addresses (1m)."""
+    process_ses_event_queue()
+
+
+@periodic.command('shortlink_clicks')
+def shortlink_clicks():
+    """Add shortlink clicks recorded in Redis to hourly counts (1m)."""
+    count_shortlink_clicks()
+
+
+@periodic.command('notification_unread')
+def notification_unread():
+    """Correct unread notification counters in Redis against the database (1h)."""
+    reconcile_notification_unread_counts()
+
+
+@periodic.command('project_next_session')
+def project_next_session():
+    """Refresh the cached next session timestamp for projects (5m)."""
+    models.Project.refresh_next_session_at()
+    db.session.commit()
+
+
+@periodic.command('project_listings')
+def project_listings():
+    """Render project listings that have expired as projects go live or end (1m)."""
+    with app.test_request_context():
+        warm_project_listings(timedelta(minutes=2))
+
+
 @periodic.command('project_starting_alert')
 def project_starting_alert():
     """Send notifications for projects that are about to start schedule (5m)."""
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
 from ..utils import extract_twitter_handle
@@ -18,6 +20,9 @@ class ExplaraAPI:
     Reference : https://developers.explara.com/api-document
     """
 
+    #: Maximum number of records Explara returns in one request
+    batch_size = 50
+
     def __init__(self, access_token) -> None:
         self.access_token = access_token
         self.headers = {'Authorization': 'Bearer ' + self.access_token}
@@ -26,38 +31,53 @@ class ExplaraAPI:
     def url_for(self, endpoint):
         return self.base_url.format(endpoint)
 
-    def get_orders(self, explara_eventid):
+    def get_attendees(self, explara_eventid, from_record):
+        """Get one batch of orders, starting from the given record."""
+        payload = {
+            'eventId': explara_eventid,
+            'fromRecord': from_record,
+            'toRecord': from_record + self.batch_size,
+        }
+        attendees = (
+            requests.post(
+                self.url_for('attendee-list'), headers=self.headers, data=payload
+            )
+            .json()
+            .get('attendee')
+        )
+        if not attendees:
+            return []
+        # after the first batch, subsequent batches are dicts with batch no. as key.
+        if isinstance(attendees, dict):
+            return list(attendees.values())
+        return attendees
+
+    def get_orders(self, explara_eventid, concurrency=8):
         """
         Get the entire dump of orders for a given eventid in batches.
 
         Batches are of size 50, owing to the restriction imposed by Explara's API.
         Explara does not make any assurances w.r.t the order; hence no order is assumed and
-        the entire dump is retrieved.
+        the entire dump is retrieved. Batches are requested `concurrency` at a time,
+        until an empty batch is received.
         """
         ticket_orders = []
-        completed = False
         from_record = 0
-        to_record = 50
-        while not completed:
-            payload = {
-                'eventId': explara_eventid,
-                'fromRecord': from_record,
-                'toRecord': to_record,
-            }
-            attendee_response = requests.post(
-                self.url_for('attendee-list'), headers=self.headers, data=payload
-            ).json()
-            if not attendee_response.get('attendee'):
-                completed = True
-            elif isinstance(attendee_response.get('attendee'), list):
-                ticket_orders.extend(attendee_response['attendee'])
-            # after the first batch, subsequent batches are dicts with batch no. as key.
-            elif isinstance(attendee_response.get('attendee'), dict):
-                ticket_orders.extend(list(attendee_response['attendee'].values()))
-            from_record = to_record
-            to_record += 50
-
-        return ticket_orders
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                batches = executor.map(
+                    lambda batch_from: self.get_attendees(explara_eventid, batch_from),
+                    range(
+                        from_record,
+                        from_record + concurrency * self.batch_size,
+                        self.batch_size,
+                    ),
+                )
+                for batch in batches:
+                    if not batch:
+                        return ticket_orders
+                    ticket_orders.extend(batch)
+                from_record += concurrency * self.batch_size
 
     def get_tickets(self, explara_eventid):
         tickets = []
@@ -7,7 +7,7 @@ from baseframe.forms.sqlalchemy import QuerySelectField
 from coaster.auth import current_auth
 import baseframe.forms as forms
 
-from ..models import Project, Proposal
+from ..models import Project, ProjectLabelIndex, Proposal
 from .helpers import nullable_strip_filters, video_url_validator
 
 __all__ = [
@@ -29,6 +29,8 @@ __all__ = [
 
 def proposal_label_form(project: Project, proposal: Optional[Proposal]):
     """Return a label form for the given project and proposal."""
+    # Load all labels and options at once, for the form and the proposal's values
+    ProjectLabelIndex.for_project(project)
     if not project.labels:
         return
 
@@ -65,6 +67,8 @@ def proposal_label_form(project: Project, proposal: Optional[Proposal]):
 
 def proposal_label_admin_form(project: Project, proposal: Optional[Proposal]):
     """Return a label form to use in admin panel for given project and proposal."""
+    # Load all labels and options at once, for the form and the proposal's values
+    ProjectLabelIndex.for_project(project)
 
     class ProposalLabelAdminForm(forms.Form):
         pass
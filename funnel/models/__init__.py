@@ -67,4 +67,5 @@ from .site_membership import *  # isort:skip
 from .moderation import *  # isort:skip
 from .notification_types import *  # isort:skip
 from .commentset_membership import *  # isort:skip
+from .search_document import *  # isort:skip
 from .geoname import *  # isort:skip
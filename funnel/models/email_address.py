@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import List, Optional, Set, Union, cast, overload
+from typing import Collection, List, Optional, Sequence, Set, Union, cast, overload
 import hashlib
 import unicodedata
 
@@ -370,6 +370,67 @@ class EmailAddress(BaseMixin, db.Model):
         """Record fact of an email message being sent to this address."""
         self.delivery_state_at = db.func.utcnow()
 
+    @classmethod
+    def mark_sent_batch(cls, email_address_ids: Collection[int]) -> None:
+        """Record fact of email messages being sent to these addresses, in bulk."""
+        cls.mark_delivery_state_batch_ids(email_address_ids, EMAIL_DELIVERY_STATE.SENT)
+
+    @staticmethod
+    def _batch_ids(email_addresses: Sequence[EmailAddress]) -> Set[int]:
+        """Return ids of these addresses, without refreshing expired instances."""
+        db.session.flush()  # Ensure new addresses have ids
+        return {db.inspect(ea).identity[0] for ea in email_addresses}
+
+    @classmethod
+    def _expire_batch(
+        cls, email_address_ids: Collection[int], attrs: List[str]
+    ) -> None:
+        """Expire attributes of instances in the session that were updated in bulk."""
+        mapper = db.inspect(cls)
+        for idv in email_address_ids:
+            ea = db.session.identity_map.get(
+                mapper.identity_key_from_primary_key([idv])
+            )
+            if ea is not None:
+                db.session.expire(ea, attrs)
+
+    @classmethod
+    def mark_delivery_state_batch(
+        cls, email_addresses: Sequence[EmailAddress], delivery_state: int
+    ) -> None:
+        """Set the delivery state of these addresses in a single update."""
+        if email_addresses:
+            cls.mark_delivery_state_batch_ids(
+                cls._batch_ids(email_addresses), delivery_state
+            )
+
+    @classmethod
+    def mark_delivery_state_batch_ids(
+        cls, email_address_ids: Collection[int], delivery_state: int
+    ) -> None:
+        """Set the delivery state of addresses with these ids in a single update."""
+        if not email_address_ids:
+            return
+        cls.query.filter(cls.id.in_(email_address_ids)).update(
+            {
+                cls._delivery_state: delivery_state,
+                cls.delivery_state_at: db.func.utcnow(),
+            },
+            synchronize_session=False,
+        )
+        cls._expire_batch(email_address_ids, ['_delivery_state', 'delivery_state_at'])
+
+    @classmethod
+    def mark_active_batch(cls, email_addresses: Sequence[EmailAddress]) -> None:
+        """Record timestamp of recipient activity for these addresses, in bulk."""
+        if not email_addresses:
+            return
+        email_address_ids = cls._batch_ids(email_addresses)
+        cls.query.filter(cls.id.in_(email_address_ids)).update(
+            {cls.active_at: db.func.utcnow()}, synchronize_session=False
+        )
+        cls._expire_batch(email_address_ids, ['active_at'])
+
     def mark_active(self) -> None:
         """Record timestamp of recipient activity."""
         self.active_at = db.func.utcnow()
@@ -1,18 +1,30 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional, Union, cast
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+import os
+import pickle  # skipcq: BAN-B403
 import re
 
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import joinedload
 
+from flask import current_app
+
 from coaster.sqlalchemy import Query
 from coaster.utils import make_name
 
 from . import BaseMixin, BaseNameMixin, db
-from .helpers import quote_like
 
-__all__ = ['GeoName', 'GeoCountryInfo', 'GeoAdmin1Code', 'GeoAdmin2Code', 'GeoAltName']
+__all__ = [
+    'GeoName',
+    'GeoCountryInfo',
+    'GeoAdmin1Code',
+    'GeoAdmin2Code',
+    'GeoAltName',
+    'GeoGazetteer',
+]
 
 
 NOWORDS_RE = re.compile(r'(\W+)', re.UNICODE)
@@ -249,15 +261,20 @@ class GeoName(BaseNameMixin, db.Model):
 
     @property
     def use_title(self) -> str:
-        usetitle = self.ascii_title
-        if self.fclass == 'A' and self.fcode.startswith('PCL'):
+        return self.name_title(self.ascii_title, self.fclass, self.fcode)
+
+    @staticmethod
+    def name_title(ascii_title: str, fclass: str, fcode: str) -> str:
+        """Return the title to make a URL name from, for the given record details."""
+        usetitle = ascii_title
+        if fclass == 'A' and fcode.startswith('PCL'):
             if 'of the' in usetitle:
                 usetitle = usetitle.split('of the')[-1].strip()
             elif 'of The' in usetitle:
                 usetitle = usetitle.split('of The')[-1].strip()
             elif 'of' in usetitle:
                 usetitle = usetitle.split('of')[-1].strip()
-        elif self.fclass == 'A' and self.fcode == 'ADM1':
+        elif fclass == 'A' and fcode == 'ADM1':
             usetitle = (
                 usetitle.replace('State of', '')
                 .replace('Union Territory of', '')
@@ -370,33 +387,18 @@ class GeoName(BaseNameMixin, db.Model):
 
         :param lang: Limit results to names in this language
         """
-        results = set()
         if isinstance(titles, str):
             titles = [titles]
+        gazetteer = GeoGazetteer.get()
+        geonameids = set()
         for title in titles:
-            if lang:
-                results.update(
-                    [
-                        r.geoname
-                        for r in GeoAltName.query.filter(
-                            db.func.lower(GeoAltName.title) == title.lower(),
-                            GeoAltName.lang == lang,
-                        ).all()
-                        if r.geoname
-                    ]
-                )
-            else:
-                results.update(
-                    [
-                        r.geoname
-                        for r in GeoAltName.query.filter(
-                            db.func.lower(GeoAltName.title) == title.lower()
-                        ).all()
-                        if r.geoname
-                    ]
-                )
+            geonameids.update(
+                geonameid
+                for geonameid, alt_lang in gazetteer.lookup(title)
+                if not lang or alt_lang == lang
+            )
         return sorted(
-            results,
+            cls.query.filter(cls.id.in_(geonameids)),
             key=lambda g: ({'A': 1, 'P': 2}.get(g.fclass, 0), g.population),
             reverse=True,
         )
@@ -418,8 +420,8 @@ class GeoName(BaseNameMixin, db.Model):
         :param bias: Country codes (ISO two letter) to prioritize locations from
         """
         special = [s.lower() for s in special] if special else []
-        if bias is None:
-            bias = []
+        bias_rank = {v: k for k, v in enumerate(reversed(bias or []))}
+        gazetteer = GeoGazetteer.get()
         tokens = NOWORDS_RE.split(q)
         while '' in tokens:
             tokens.remove('')  # Remove blank tokens from beginning and end
@@ -430,105 +432,73 @@ class GeoName(BaseNameMixin, db.Model):
         while counter < limit:
             token = tokens[counter]
             # Do a case-insensitive match
-            ltoken = token.lower()
+            ltoken = ltokens[counter]
             # Ignore punctuation, only query for tokens containing text
             # Special-case 'or' and 'in' to prevent matching against Oregon and Indiana
             if ltoken not in ('or', 'in', 'to', 'the') and WORDS_RE.match(token):
-                # Find a GeoAltName matching token, add GeoAltName.geoname to results
+                # Find the longest names starting at this token
+                maxmatch, matches = gazetteer.match_tokens(ltokens[counter:])
                 if lang:
-                    matches = (
-                        GeoAltName.query.filter(
-                            db.func.lower(GeoAltName.title).like(ltoken)
-                        )
-                        .filter(
-                            db.or_(GeoAltName.lang == lang, GeoAltName.lang.is_(None))
-                        )
-                        .options(
-                            joinedload('geoname').joinedload('country'),
-                            joinedload('geoname').joinedload('admin1code'),
-                            joinedload('geoname').joinedload('admin2code'),
-                        )
-                        .all()
-                    )
-                else:
-                    matches = (
-                        GeoAltName.query.filter(
-                            db.func.lower(GeoAltName.title).like(quote_like(ltoken))
-                        )
-                        .options(
-                            joinedload('geoname').joinedload('country'),
-                            joinedload('geoname').joinedload('admin1code'),
-                            joinedload('geoname').joinedload('admin2code'),
-                        )
-                        .all()
-                    )
+                    matches = [m for m in matches if m[1] is None or m[1] == lang]
                 if not matches:
                     # This token didn't match anything, move on
                     results.append({'token': token})
                 else:
-                    # Now filter through the matches to see if there are exact matches
-                    candidates = [
-                        (NOWORDS_RE.split(m.title.lower()), m) for m in matches
-                    ]
-                    fullmatch = []
-                    for mtokens, match in candidates:
-                        if mtokens == ltokens[counter : counter + len(mtokens)]:
-                            fullmatch.append((len(mtokens), match))
-                    if fullmatch:
-                        maxmatch = max(f[0] for f in fullmatch)
-                        accepted = list({f[1] for f in fullmatch if f[0] == maxmatch})
-                        # Filter accepted down to one match.
-                        # Sort by (a) bias, (b) language match, (c) city over state and
-                        # (d) population
-                        accepted.sort(
-                            key=lambda a: (
-                                {
-                                    v: k
-                                    for k, v in enumerate(
-                                        reversed(cast(List[str], bias))
-                                    )
-                                }.get(a.geoname.country_id, -1),
-                                {lang: 0}.get(a.lang, 1),
-                                {'A': 1, 'P': 2}.get(a.geoname.fclass, 0),
-                                a.geoname.population,
-                            ),
-                            reverse=True,
-                        )
-                        results.append(
-                            {
-                                'token': ''.join(tokens[counter : counter + maxmatch]),
-                                'geoname': accepted[0].geoname,
-                            }
-                        )
-                        counter += maxmatch - 1
-                    else:
-                        results.append({'token': token})
+                    # Filter matches down to one. The gazetteer ranks matches by city
+                    # over state and population, so sort by (a) bias and (b) language
+                    # match. Python's sort is stable and retains the earlier ranking
+                    geonameid = sorted(
+                        matches,
+                        key=lambda m: (
+                            gazetteer.bias_rank(m[0], bias_rank),
+                            {lang: 0}.get(m[1], 1),
+                        ),
+                        reverse=True,
+                    )[0][0]
+                    results.append(
+                        {
+                            'token': ''.join(tokens[counter : counter + maxmatch]),
+                            'geoname': geonameid,
+                        }
+                    )
+                    counter += maxmatch - 1
             else:
                 results.append({'token': token})
 
             if ltoken in special:
                 results[-1]['special'] = True
             counter += 1
+
+        # Load all matched geonames at once
+        geonameids = {r['geoname'] for r in results if 'geoname' in r}
+        if geonameids:
+            geonames = {
+                geoname.id: geoname
+                for geoname in cls.query.filter(cls.id.in_(geonameids)).options(
+                    joinedload('country'),
+                    joinedload('admin1code'),
+                    joinedload('admin2code'),
+                )
+            }
+            for r in results:
+                if 'geoname' in r:
+                    r['geoname'] = geonames[r['geoname']]
         return results
 
     @classmethod
-    def autocomplete(cls, q: str, lang: Optional[str] = None) -> Query:
+    def autocomplete(
+        cls, q: str, lang: Optional[str] = None, limit: int = 100
+    ) -> Query:
         """
         Autocomplete a geoname record.
 
         :param q: Partial title to complete
         :param lang: Limit results to names in this language
+        :param limit: Maximum number of results
         """
-        query = (
-            cls.query.join(cls.alternate_titles)
-            .filter(db.func.lower(GeoAltName.title).like(quote_like(q.lower())))
-            .order_by(db.desc(cls.population))
-        )
-        if lang:
-            query = query.filter(
-                db.or_(GeoAltName.lang.is_(None), GeoAltName.lang == lang)
-            )
-        return query
+        return cls.query.filter(
+            cls.id.in_(GeoGazetteer.get().complete(q, lang, limit))
+        ).order_by(db.desc(cls.population))
 
 
 class GeoAltName(BaseMixin, db.Model):
@@ -575,3 +545,165 @@ class GeoAltName(BaseMixin, db.Model):
             'is_colloquial': self.is_colloquial,
             'is_historic': self.is_historic,
         }
+
+
+class GeoGazetteer:
+    """
+    In-memory index of :class:`GeoAltName` titles, for lookups without queries.
+
+    Titles are kept lowercased in a sorted list, each mapped to the geonames that have
+    that title, ranked by city over state and then by population. The gazetteer is
+    loaded once per process, from a file made by the ``flask geoname gazetteer``
+    command if ``GEONAME_GAZETTEER`` is configured, or from the geoname database.
+    """
+
+    _instance: Optional[GeoGazetteer] = None
+    _lock = Lock()
+
+    def __init__(
+        self,
+        geonames: Dict[int, Tuple[Optional[str], Tuple[int, int]]],
+        names: Dict[str, List[Tuple[int, Optional[str]]]],
+    ) -> None:
+        #: geonameid: (country code, rank for sorting)
+        self.geonames = geonames
+        #: Sorted lowercase titles
+        self.titles: List[str] = sorted(names)
+        #: (geonameid, lang) for each title, in the same order as titles
+        self.entries: List[Tuple[Tuple[int, Optional[str]], ...]] = [
+            tuple(
+                sorted(
+                    names[title],
+                    key=lambda entry: geonames[entry[0]][1],
+                    reverse=True,
+                )
+            )
+            for title in self.titles
+        ]
+        #: Title tokens for multi-word titles, keyed by first token
+        self.phrases: Dict[str, List[Tuple[List[str], int]]] = {}
+        for index, title in enumerate(self.titles):
+            tokens = NOWORDS_RE.split(title)
+            if len(tokens) > 1:
+                self.phrases.setdefault(tokens[0], []).append((tokens, index))
+
+    @classmethod
+    def from_rows(
+        cls,
+        geoname_rows: Iterable[Tuple[int, Optional[str], Optional[str], Optional[int]]],
+        alt_name_rows: Iterable[Tuple[int, Optional[str], str]],
+    ) -> GeoGazetteer:
+        """
+        Make a gazetteer from database rows.
+
+        :param geoname_rows: (geonameid, country code, feature class, population)
+        :param alt_name_rows: (geonameid, lang, title)
+        """
+        geonames = {
+            geonameid: (
+                country_id,
+                ({'A': 1, 'P': 2}.get(fclass or '', 0), population or 0),
+            )
+            for geonameid, country_id, fclass, population in geoname_rows
+        }
+        names: Dict[str, List[Tuple[int, Optional[str]]]] = {}
+        for geonameid, lang, title in alt_name_rows:
+            if geonameid in geonames:
+                names.setdefault(title.lower(), []).append((geonameid, lang or None))
+        return cls(geonames, names)
+
+    @classmethod
+    def from_database(cls) -> GeoGazetteer:
+        """Make a gazetteer from the geoname database."""
+        return cls.from_rows(
+            db.session.query(
+                GeoName.id, GeoName.country_id, GeoName.fclass, GeoName.population
+            ).yield_per(10000),
+            db.session.query(
+                GeoAltName.geonameid, GeoAltName.lang, GeoAltName.title
+            ).yield_per(10000),
+        )
+
+    def save(self, path: str) -> None:
+        """Save the gazetteer to a file, replacing any existing file."""
+        with open(path + '.tmp', 'wb') as fd:
+            pickle.dump(self, fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str) -> GeoGazetteer:
+        """Load a gazetteer saved by :meth:`save`."""
+        with open(path, 'rb') as fd:
+            return pickle.load(fd)  # nosec  # skipcq: BAN-B301
+
+    @classmethod
+    def get(cls) -> GeoGazetteer:
+        """Return the gazetteer for this process, loading it on first use."""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    path = current_app.config.get('GEONAME_GAZETTEER')
+                    if path and os.path.exists(path):
+                        cls._instance = cls.load(path)
+                    else:
+                        cls._instance = cls.from_database()
+        return cls._instance
+
+    @classmethod
+    def reset(cls) -> None:
+        """Discard the loaded gazetteer, causing it to be loaded again on next use."""
+        cls._instance = None
+
+    def lookup(self, title: str) -> Tuple[Tuple[int, Optional[str]], ...]:
+        """Return ranked (geonameid, lang) pairs for a title, ignoring case."""
+        title = title.lower()
+        index = bisect_left(self.titles, title)
+        if index < len(self.titles) and self.titles[index] == title:
+            return self.entries[index]
+        return ()
+
+    def match_tokens(
+        self, ltokens: List[str]
+    ) -> Tuple[int, List[Tuple[int, Optional[str]]]]:
+        """
+        Find the longest titles matching the start of the given lowercase tokens.
+
+        Returns the number of tokens matched and ranked (geonameid, lang) pairs of all
+        titles of that length.
+        """
+        maxmatch = 0
+        matches: List[Tuple[int, Optional[str]]] = []
+        for tokens, index in self.phrases.get(ltokens[0], ()):
+            if len(tokens) >= maxmatch and tokens == ltokens[: len(tokens)]:
+                if len(tokens) > maxmatch:
+                    maxmatch = len(tokens)
+                    matches = []
+                matches.extend(self.entries[index])
+        if not matches:
+            matches = list(self.lookup(ltokens[0]))
+            maxmatch = 1 if matches else 0
+        return maxmatch, matches
+
+    def complete(self, prefix: str, lang: Optional[str] = None, limit: int = 100):
+        """Return ids of the largest geonames with a title starting with prefix."""
+        prefix = prefix.lower()
+        if not prefix:
+            return []
+        geonameids = set()
+        index = bisect_left(self.titles, prefix)
+        while index < len(self.titles) and self.titles[index].startswith(prefix):
+            geonameids.update(
+                geonameid
+                for geonameid, alt_lang in self.entries[index]
+                if not lang or alt_lang is None or alt_lang == lang
+            )
+            index += 1
+        return sorted(
+            geonameids,
+            key=lambda geonameid: self.geonames[geonameid][1][1],
+            reverse=True,
+        )[:limit]
+
+    def bias_rank(self, geonameid: int, bias_rank: Dict[str, int]) -> int:
+        """Return the rank of a geoname's country in the given bias ranking."""
+        return bias_rank.get(self.geonames[geonameid][0], -1)
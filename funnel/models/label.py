@@ -1,6 +1,12 @@
 from __future__ import annotations
 
+from itertools import chain
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event
 from sqlalchemy.ext.orderinglist import ordering_list
+from sqlalchemy.orm import Session as DatabaseSession
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.sql import case, exists
 
 from coaster.sqlalchemy import with_roles
@@ -292,6 +298,78 @@ class Label(BaseScopedNameMixin, db.Model):
 add_search_trigger(Label, 'search_vector')
 
 
+class ProjectLabelIndex:
+    """
+    Index of a project's labels by name, including options and archived labels.
+
+    The index is loaded in a single query and cached in the database session, so it
+    lasts for a request. It is discarded when a label in the project is edited, or when
+    the transaction ends. Loading the index also populates :attr:`Label.options` and
+    :attr:`Label.main_label`, so these and the flags that depend on them can be read
+    without further queries.
+    """
+
+    def __init__(self, labels: Iterable[Label]) -> None:
+        labels = sorted(labels, key=lambda label: label.seq)
+        #: All labels, by name
+        self.by_name: Dict[str, Label] = {label.name: label for label in labels}
+        by_id = {label.id: label for label in labels}
+        options: Dict[int, List[Label]] = {label.id: [] for label in labels}
+        for label in labels:
+            if label.main_label_id is not None:
+                options[label.main_label_id].append(label)
+        for label in labels:
+            # Don't replace relationships that are loaded, as they may have changes
+            unloaded = db.inspect(label).unloaded
+            if 'options' in unloaded:
+                set_committed_value(label, 'options', options[label.id])
+            if 'main_label' in unloaded:
+                set_committed_value(label, 'main_label', by_id.get(label.main_label_id))
+
+    @classmethod
+    def for_project(cls, project: Project) -> ProjectLabelIndex:
+        """Return the label index for a project, loading it if required."""
+        indexes = db.session.info.setdefault('label_index', {})
+        index = indexes.get(project.id)
+        if index is None:
+            index = cls(Label.query.filter(Label.project_id == project.id))
+            indexes[project.id] = index
+        return index
+
+    def get(self, name: str) -> Optional[Label]:
+        """Return the label with the given name, if it exists."""
+        return self.by_name.get(name)
+
+
+def _label_edited(label: Label) -> bool:
+    """Confirm if a label has changes other than the proposals it is applied to."""
+    return any(
+        attr.history.has_changes()
+        for attr in db.inspect(label).attrs
+        if attr.key != 'proposals'
+    )
+
+
+@event.listens_for(DatabaseSession, 'after_flush')
+def _label_index_discard_edited(session, flush_context):
+    """Discard the label index of projects with labels edited in this flush."""
+    indexes = session.info.get('label_index')
+    if indexes:
+        for obj in chain(session.new, session.deleted):
+            if isinstance(obj, Label):
+                indexes.pop(obj.project_id, None)
+        for obj in session.dirty:
+            if isinstance(obj, Label) and _label_edited(obj):
+                indexes.pop(obj.project_id, None)
+
+
+@event.listens_for(DatabaseSession, 'after_commit')
+@event.listens_for(DatabaseSession, 'after_rollback')
+def _label_index_discard(session):
+    """Discard label indexes when the transaction ends, as labels are expired."""
+    session.info.pop('label_index', None)
+
+
 class ProposalLabelProxyWrapper:
     def __init__(self, obj) -> None:
         object.__setattr__(self, '_obj', obj)
@@ -305,9 +383,7 @@ class ProposalLabelProxyWrapper:
         # 3. If this is a parent label:
         # 3a. If the proposal has one of the options set, return its name. If not, return None
 
-        label = Label.query.filter(
-            Label.name == name, Label.project == self._obj.project
-        ).one_or_none()
+        label = ProjectLabelIndex.for_project(self._obj.project).get(name)
         if label is None:
             raise AttributeError
 
@@ -321,12 +397,9 @@ class ProposalLabelProxyWrapper:
 
     def __setattr__(self, name, value):
         """Set an attribute."""
-        label = Label.query.filter(
-            Label.name == name,
-            Label.project == self._obj.project,
-            Label._archived.is_(False),
-        ).one_or_none()
-        if label is None:
+        index = ProjectLabelIndex.for_project(self._obj.project)
+        label = index.get(name)
+        if label is None or label._archived:
             raise AttributeError
 
         if not label.has_options:
@@ -339,10 +412,12 @@ class ProposalLabelProxyWrapper:
             else:
                 raise ValueError("This label can only be set to True or False")
         else:
-            option_label = Label.query.filter_by(
-                main_label=label, _archived=False, name=value
-            ).one_or_none()
-            if option_label is None:
+            option_label = index.get(value) if isinstance(value, str) else None
+            if (
+                option_label is None
+                or option_label.main_label is not label
+                or option_label._archived
+            ):
                 raise ValueError("Invalid option for this label")
 
             # Scan for conflicting labels and remove them. Iterate over a copy
@@ -74,11 +74,14 @@ is supported using an unusual primary and foreign key structure the in
 """
 from __future__ import annotations
 
+from collections import Counter, defaultdict
 from types import SimpleNamespace
 from typing import (
     Callable,
     Dict,
     Generator,
+    Iterable,
+    List,
     NamedTuple,
     Optional,
     Sequence,
@@ -91,6 +94,8 @@ from typing import (
 from uuid import UUID, uuid4
 
 from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.collections import column_mapped_collection
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -121,6 +126,7 @@ __all__ = [
     'NotificationPreferences',
     'UserNotification',
     'NotificationFor',
+    'NotificationTransportResolver',
     'notification_type_registry',
     'notification_web_types',
 ]
@@ -533,6 +539,82 @@ class Notification(NoIdMixin, db.Model):
                 db.session.add(user_notification)
                 yield user_notification
 
+    def recipient_ids(self, role: str) -> Optional[Query]:
+        """
+        Return a query of ids of users having the given role, for :meth:`dispatch_bulk`.
+
+        Subclasses may override this for roles that can be resolved entirely in SQL.
+        The query must select a single column of user ids. The default implementation
+        returns None, causing the role to be resolved in Python using
+        :meth:`~coaster.sqlalchemy.roles.RoleMixin.actors_with`.
+        """
+        return None
+
+    def dispatch_bulk(self) -> List[int]:
+        """
+        Create :class:`UserNotification` rows in bulk and return recipient user ids.
+
+        This is a set-based alternative to :meth:`dispatch`. Recipients for each role
+        are resolved using :meth:`recipient_ids` where available, and are inserted with
+        one ``INSERT ... SELECT ... ON CONFLICT DO NOTHING`` per role. Roles are
+        processed in order of priority, so a user with multiple roles is only notified
+        for the first, and a re-dispatch skips users who were already notified.
+
+        This method bypasses the ORM session. The caller must commit.
+        """
+        sql_roles = {}
+        for role in self.roles:
+            query = self.recipient_ids(role)
+            if query is not None:
+                sql_roles[role] = query
+
+        # Roles that can't be expressed in SQL are resolved in a single pass over
+        # `actors_with`, collecting user ids only
+        python_roles = [role for role in self.roles if role not in sql_roles]
+        actor_ids: Dict[str, List[int]] = {role: [] for role in python_roles}
+        if python_roles:
+            for user, role in self.role_provider_obj.actors_with(
+                python_roles, with_role=True
+            ):
+                actor_ids[role].append(user.id)
+
+        recipient_ids: List[int] = []
+        for role in self.roles:
+            if role in sql_roles:
+                user_filter = User.id.in_(sql_roles[role])
+            elif actor_ids[role]:
+                user_filter = User.id.in_(actor_ids[role])
+            else:
+                continue
+            conditions = [
+                user_filter,
+                # Don't notify inactive (suspended, merged) users
+                User.state.ACTIVE,
+            ]
+            if self.exclude_actor and self.user_id is not None:
+                conditions.append(User.id != self.user_id)
+            user_notification_table = UserNotification.__table__
+            statement = (
+                pg_insert(user_notification_table)
+                .from_select(
+                    ['eventid', 'notification_id', 'user_id', 'role'],
+                    db.select(
+                        [
+                            db.literal(self.eventid, UUIDType(binary=False)),
+                            db.literal(self.id, UUIDType(binary=False)),
+                            User.id,
+                            db.literal(role, db.Unicode),
+                        ]
+                    ).where(*conditions),
+                )
+                .on_conflict_do_nothing()
+                .returning(user_notification_table.c.user_id)
+            )
+            recipient_ids.extend(row.user_id for row in db.session.execute(statement))
+        if self.type in notification_web_types:
+            UserNotification.record_unread_change(recipient_ids, 1)
+        return recipient_ids
+
     # Make :attr:`type_` available under the name `type`, but declare this at the very
     # end of the class to avoid conflicts with the Python `type` global that is
     # used for type-hinting
@@ -926,6 +1008,7 @@ class UserNotification(UserNotificationMixin, NoIdMixin, db.Model):
                     db.load_only(
                         UserNotification.user_id,
                         UserNotification.eventid,
+                        UserNotification.read_at,
                         UserNotification.revoked_at,
                         UserNotification.rollupid,
                     )
@@ -934,6 +1017,161 @@ class UserNotification(UserNotificationMixin, NoIdMixin, db.Model):
                 previous.is_revoked = True
                 previous.rollupid = self.rollupid
 
+    @classmethod
+    def get_batch(
+        cls, identities: Sequence[Tuple[int, UUID]]
+    ) -> List[UserNotification]:
+        """
+        Load user notifications for the given identities in a single query.
+
+        Returns user notifications in the order of ``identities``, skipping any that no
+        longer exist.
+        """
+        loaded = {
+            un.identity: un
+            for un in cls.query.filter(
+                db.tuple_(cls.user_id, cls.eventid).in_(
+                    [tuple(identity) for identity in identities]
+                )
+            ).options(db.joinedload(cls.notification))
+        }
+        return [
+            loaded[tuple(identity)]
+            for identity in identities
+            if tuple(identity) in loaded
+        ]
+
+    @classmethod
+    def rollup_previous_batch(
+        cls, identities: Sequence[Tuple[int, UUID]]
+    ) -> List[UserNotification]:
+        """
+        Rollup prior instances for a batch of user notifications.
+
+        This is a set-based equivalent of calling :meth:`rollup_previous` on each user
+        notification in turn. Rollup ids are looked up with one query per group of
+        (notification type, document, role), and revocations and new rollup ids are
+        written with grouped UPDATE statements. User notifications that share a
+        rollup chain (same user, type, document and role) are processed in separate
+        rounds, in the order given, to match the per-row logic.
+
+        Returns the loaded user notifications in the order of ``identities``, skipping
+        any that no longer exist. The caller must commit.
+        """
+        user_notifications = cls.get_batch(identities)
+
+        # We can only rollup fragments within a document, and only if we've not
+        # already been revoked or rolled up
+        pending = [
+            un
+            for un in user_notifications
+            if un.notification.fragment_model
+            and not un.is_revoked
+            and un.rollupid is None
+        ]
+        processed: List[UserNotification] = []
+        while pending:
+            chains = set()
+            this_round = []
+            next_round = []
+            for un in pending:
+                chain = (
+                    un.user_id,
+                    un.notification.type,
+                    un.notification.document_uuid,
+                    un.role,
+                )
+                if chain in chains:
+                    next_round.append(un)
+                else:
+                    chains.add(chain)
+                    this_round.append(un)
+            cls._rollup_round(this_round, processed)
+            processed.extend(this_round)
+            pending = next_round
+        return user_notifications
+
+    @classmethod
+    def _rollup_round(
+        cls, batch: List[UserNotification], processed: List[UserNotification]
+    ) -> None:
+        """Rollup a batch of user notifications that share no rollup chains."""
+        groups = defaultdict(list)
+        for un in batch:
+            groups[
+                (un.notification.type, un.notification.document_uuid, un.role)
+            ].append(un)
+
+        rollupids: Dict[Tuple[int, UUID], UUID] = {}
+        for (notification_type, document_uuid, role), group in groups.items():
+            # For rollup: find most recent unread that has a rollupid, per user. Reuse
+            # that id so that the current notification becomes the latest in that batch
+            # of rolled up notifications. If none, this is the start of a new batch
+            existing = dict(
+                db.session.query(cls.user_id, cls.rollupid)
+                .join(Notification)
+                .filter(
+                    cls.user_id.in_([un.user_id for un in group]),
+                    Notification.type == notification_type,
+                    Notification.document_uuid == document_uuid,
+                    cls.role == role,
+                    cls.read_at.is_(None),
+                    cls.revoked_at.is_(None),
+                    cls.rollupid.isnot(None),
+                )
+                .distinct(cls.user_id)
+                .order_by(cls.user_id, cls.created_at.asc())
+            )
+            for un in group:
+                rollupids[un.identity] = existing.get(un.user_id) or uuid4()
+
+            if existing:
+                # Revoke all previous unread sharing the rollupid. The notifications
+                # in this batch don't have a rollupid yet, so they're not affected
+                revoke_keys = list(existing.items())
+                revoked_rows = db.session.execute(
+                    db.update(cls.__table__)
+                    .where(
+                        cls.eventid == Notification.eventid,
+                        cls.notification_id == Notification.id,
+                        db.tuple_(cls.user_id, cls.rollupid).in_(revoke_keys),
+                        Notification.type == notification_type,
+                        Notification.document_uuid == document_uuid,
+                        cls.role == role,
+                        cls.revoked_at.is_(None),
+                    )
+                    .values(revoked_at=db.func.utcnow())
+                    .returning(cls.user_id, cls.read_at)
+                ).all()
+                if notification_type in notification_web_types:
+                    cls.record_unread_change(
+                        [row.user_id for row in revoked_rows if row.read_at is None],
+                        -1,
+                    )
+                revoked = set(revoke_keys)
+                for un in processed:
+                    if (un.user_id, un.rollupid) in revoked:
+                        db.session.expire(un, ['revoked_at'])
+
+        cls.query.filter(
+            db.tuple_(cls.user_id, cls.eventid).in_(list(rollupids))
+        ).update(
+            {
+                'rollupid': db.case(
+                    [
+                        (
+                            db.and_(cls.user_id == user_id, cls.eventid == eventid),
+                            db.literal(rollupid, UUIDType(binary=False)),
+                        )
+                        for (user_id, eventid), rollupid in rollupids.items()
+                    ]
+                )
+            },
+            synchronize_session=False,
+        )
+        for un in batch:
+            set_committed_value(un, 'rollupid', rollupids[un.identity])
+
     def rolledup_fragments(self) -> Optional[Query]:
         """Return all fragments in the rolled up batch as a base query."""
         if not self.notification.fragment_model:
@@ -968,6 +1206,21 @@ class UserNotification(UserNotificationMixin, NoIdMixin, db.Model):
             query = query.filter(UserNotification.read_at.is_(None))
         return query.order_by(Notification.created_at.desc())
 
+    @classmethod
+    def unread_counts_for_ids(cls, user_ids: Iterable[int]) -> Dict[int, int]:
+        """Return unread counts for users by id, omitting users with none."""
+        return dict(
+            db.session.query(cls.user_id, db.func.count())
+            .join(Notification)
+            .filter(
+                Notification.type.in_(notification_web_types),
+                cls.user_id.in_(user_ids),
+                cls.read_at.is_(None),
+                cls.revoked_at.is_(None),
+            )
+            .group_by(cls.user_id)
+        )
+
     @classmethod
     def unread_count_for(cls, user: User) -> int:
         return (
@@ -981,6 +1234,19 @@ class UserNotification(UserNotificationMixin, NoIdMixin, db.Model):
             .count()
         )
 
+    @staticmethod
+    def record_unread_change(user_ids: Iterable[int], delta: int) -> None:
+        """
+        Record a change in the unread count of users, made without the ORM.
+
+        Changes are collected in the database session, for the unread counters in Redis
+        to be updated when the transaction is committed. Changes made through the ORM
+        are found when the session is flushed, and must not be recorded here.
+        """
+        changes = db.session.info.setdefault('user_notification_unread', Counter())
+        for user_id in user_ids:
+            changes[user_id] += delta
+
     @classmethod
     def migrate_user(cls, old_user: User, new_user: User) -> OptionalMigratedTables:
         for user_notification in cls.query.filter_by(user_id=old_user.id).all():
@@ -1088,44 +1354,47 @@ class NotificationPreferences(BaseMixin, db.Model):
             f')'
         )
 
+    #: Pairs of preference attribute and corresponding default in the notification type
+    transport_attrs = (
+        ('by_email', 'default_email'),
+        ('by_sms', 'default_sms'),
+        ('by_webpush', 'default_webpush'),
+        ('by_telegram', 'default_telegram'),
+        ('by_whatsapp', 'default_whatsapp'),
+    )
+
+    @classmethod
+    def defaults_for(
+        cls, notification_type: str, existing: Sequence[NotificationPreferences]
+    ) -> Dict[str, bool]:
+        """Return default preferences for a type, given the user's existing prefs."""
+        if not existing:
+            # No existing preferences. Get defaults from notification type's class
+            if notification_type and notification_type in notification_type_registry:
+                type_cls = notification_type_registry[notification_type]
+                return {
+                    t_attr: getattr(type_cls, d_attr)
+                    for t_attr, d_attr in cls.transport_attrs
+                }
+            # No notification type class either. Turn on everything.
+            return {t_attr: True for t_attr, _d_attr in cls.transport_attrs}
+        # If this transport is enabled for any existing notification type, also enable
+        # here.
+        return {
+            t_attr: any(getattr(np, t_attr) for np in existing)
+            for t_attr, _d_attr in cls.transport_attrs
+        }
+
     def set_defaults(self) -> None:
         """Set defaults based on the type's defaults, and previous user prefs."""
-        transport_attrs = (
-            ('by_email', 'default_email'),
-            ('by_sms', 'default_sms'),
-            ('by_webpush', 'default_webpush'),
-            ('by_telegram', 'default_telegram'),
-            ('by_whatsapp', 'default_whatsapp'),
-        )
         with db.session.no_autoflush:
-            if not self.user.notification_preferences:
-                # No existing preferences. Get defaults from notification type's class
-                if (
-                    self.notification_type
-                    and self.notification_type in notification_type_registry
-                ):
-                    type_cls = notification_type_registry[self.notification_type]
-                    for t_attr, d_attr in transport_attrs:
-                        if getattr(self, t_attr) is None:
-                            setattr(self, t_attr, getattr(type_cls, d_attr))
-                else:
-                    # No notification type class either. Turn on everything.
-                    for t_attr, _d_attr in transport_attrs:
-                        if getattr(self, t_attr) is None:
-                            setattr(self, t_attr, True)
-            else:
-                for t_attr, _d_attr in transport_attrs:
-                    if getattr(self, t_attr) is None:
-                        # If this transport is enabled for any existing notification
-                        # type, also enable here.
-                        setattr(
-                            self,
-                            t_attr,
-                            any(
-                                getattr(np, t_attr)
-                                for np in self.user.notification_preferences.values()
-                            ),
-                        )
+            defaults = self.defaults_for(
+                self.notification_type,
+                list(self.user.notification_preferences.values()),
+            )
+            for t_attr, value in defaults.items():
+                if getattr(self, t_attr) is None:
+                    setattr(self, t_attr, value)
 
     @with_roles(call={'owner'})
     def by_transport(self, transport: str) -> bool:
@@ -1164,6 +1433,16 @@ class NotificationPreferences(BaseMixin, db.Model):
         return value
 
 
+#: Defaults for the main preferences, the veto switch for each transport
+main_notification_defaults = {
+    'by_email': True,
+    'by_sms': False,
+    'by_webpush': False,
+    'by_telegram': False,
+    'by_whatsapp': False,
+}
+
+
 @reopen(User)
 class __User:
     all_notifications = with_roles(
@@ -1199,19 +1478,187 @@ class __User:
     def main_notification_preferences(self) -> NotificationPreferences:
         if not self._main_notification_preferences:
             main = NotificationPreferences(
-                user=self,
-                notification_type='',
-                by_email=True,
-                by_sms=False,
-                by_webpush=False,
-                by_telegram=False,
-                by_whatsapp=False,
+                user=self, notification_type='', **main_notification_defaults
             )
             db.session.add(main)
             return main
         return self._main_notification_preferences
 
 
+# --- Batch helpers --------------------------------------------------------------------
+
+
+class NotificationTransportResolver:
+    """
+    Resolve notification preferences and transport addresses for a batch of users.
+
+    All preference rows, and the primary email address and phone number of each user,
+    are loaded in a few queries and placed on the user objects, so subsequent access to
+    :attr:`User.notification_preferences`, :attr:`User.main_notification_preferences`,
+    :attr:`User.email` and :attr:`User.phone` does not require lazy loads. Missing
+    preference rows for the given notification types are created in bulk. The caller
+    must commit.
+
+    Usage::
+
+        resolver = NotificationTransportResolver.for_user_notifications(queue)
+        if resolver.has_transport(user_notification, 'email'):
+            ...
+    """
+
+    #: Transports with addresses in the user's contact details, as (model, primary)
+    address_transports = {
+        'email': (UserEmail, 'primary_email'),
+        'sms': (UserPhone, 'primary_phone'),
+    }
+
+    def __init__(
+        self, user_ids: Sequence[int], notification_types: Sequence[str] = ()
+    ) -> None:
+        self.users: Dict[int, User] = {
+            user.id: user
+            for user in User.query.filter(User.id.in_(user_ids)).options(
+                db.selectinload(User.notification_preferences),
+                db.joinedload(User.primary_email),
+                db.joinedload(User.primary_phone),
+            )
+        }
+        self._create_preferences(set(notification_types))
+        for user in self.users.values():
+            set_committed_value(
+                user,
+                '_main_notification_preferences',
+                user.notification_preferences.get(''),
+            )
+        self.addresses: Dict[str, Dict[int, Union[UserEmail, UserPhone]]] = {
+            transport: self._load_addresses(transport)
+            for transport in self.address_transports
+        }
+
+    @classmethod
+    def for_user_notifications(
+        cls, user_notifications: Sequence[UserNotification]
+    ) -> NotificationTransportResolver:
+        """Return a resolver for the recipients of the given user notifications."""
+        return cls(
+            list({un.user_id for un in user_notifications}),
+            list({un.notification_type for un in user_notifications}),
+        )
+
+    def _create_preferences(self, notification_types: Set[str]) -> None:
+        """Create missing main and per-type preference rows in bulk."""
+        rows = []
+        for user in self.users.values():
+            existing = dict(user.notification_preferences)
+            if '' not in existing:
+                rows.append(
+                    dict(
+                        main_notification_defaults,
+                        user_id=user.id,
+                        notification_type='',
+                    )
+                )
+                # Per-type defaults are based on existing preferences, including main
+                existing[''] = SimpleNamespace(**main_notification_defaults)
+            for notification_type in notification_types:
+                if notification_type not in existing:
+                    rows.append(
+                        dict(
+                            NotificationPreferences.defaults_for(
+                                notification_type, list(existing.values())
+                            ),
+                            user_id=user.id,
+                            notification_type=notification_type,
+                        )
+                    )
+        if not rows:
+            return
+        # A parallel worker may have inserted a conflicting row. Use theirs
+        db.session.execute(
+            pg_insert(NotificationPreferences.__table__)
+            .values(rows)
+            .on_conflict_do_nothing()
+        )
+        affected = {row['user_id'] for row in rows}
+        preferences = defaultdict(list)
+        for prefs in NotificationPreferences.query.filter(
+            NotificationPreferences.user_id.in_(affected)
+        ):
+            preferences[prefs.user_id].append(prefs)
+        for user_id in affected:
+            set_committed_value(
+                self.users[user_id], 'notification_preferences', preferences[user_id]
+            )
+
+    def _load_addresses(self, transport: str) -> Dict[int, Union[UserEmail, UserPhone]]:
+        """Load the address for a transport for all users, preferring primary."""
+        model, primary_attr = self.address_transports[transport]
+        addresses = {}
+        missing = []
+        for user in self.users.values():
+            primary = getattr(user, primary_attr)
+            if primary is not None:
+                addresses[user.id] = primary
+            else:
+                missing.append(user.id)
+        if missing:
+            # No primary? Maybe there's one that's not set as primary
+            for address in (
+                model.query.filter(model.user_id.in_(missing))
+                .distinct(model.user_id)
+                .order_by(model.user_id, model.created_at)
+            ):
+                addresses[address.user_id] = address
+        return addresses
+
+    def main_preferences(self, user: User) -> NotificationPreferences:
+        """Return the user's main preferences."""
+        return self.users[user.id].notification_preferences['']
+
+    def preferences(
+        self, user: User, notification_type: str
+    ) -> NotificationPreferences:
+        """Return the user's preferences for a notification type."""
+        return self.users[user.id].notification_preferences[notification_type]
+
+    def address(
+        self, user: User, transport: str
+    ) -> Optional[Union[UserEmail, UserPhone]]:
+        """Return the user's address for a transport, if they have one."""
+        if transport in self.address_transports:
+            if not user.state.ACTIVE:
+                return None
+            return self.addresses[transport].get(user.id)
+        return user.transport_for(transport, None)
+
+    def has_transport(
+        self, user_notification: UserNotification, transport: str
+    ) -> bool:
+        """Return whether the requested transport is an option, from memory."""
+        return bool(
+            user_notification.notification.allow_transport(transport)
+            and self.main_preferences(user_notification.user).by_transport(transport)
+            and self.preferences(
+                user_notification.user, user_notification.notification_type
+            ).by_transport(transport)
+            and self.address(user_notification.user, transport) is not None
+        )
+
+    def transport_for(
+        self, user_notification: UserNotification, transport: str
+    ) -> Optional[Union[UserEmail, UserPhone]]:
+        """Return the transport address for a user notification, from memory."""
+        if (
+            user_notification.notification.allow_transport(transport)
+            and self.main_preferences(user_notification.user).by_transport(transport)
+            and self.preferences(
+                user_notification.user, user_notification.notification_type
+            ).by_transport(transport)
+        ):
+            return self.address(user_notification.user, transport)
+        return None
+
+
 # --- Signal handlers ------------------------------------------------------------------
 
 
@@ -1,6 +1,9 @@
 from __future__ import annotations
 
+from typing import Optional
+
 from baseframe import __
+from coaster.sqlalchemy import Query
 from funnel.models.moderation import CommentModeratorReport
 
 from . import db
@@ -13,6 +16,7 @@ from .project_membership import ProjectCrewMembership
 from .proposal import Proposal
 from .rsvp import Rsvp
 from .session import Session
+from .sync_ticket import TicketParticipant
 from .update import Update
 from .user import Organization, User
 
@@ -50,6 +54,33 @@ class DocumentHasProfile:
         return self.document.profile
 
 
+class ProjectRolesInSql:
+    """Resolve project crew and participant roles in SQL for bulk dispatch."""
+
+    role_provider_obj: db.Model
+
+    def recipient_ids(self, role: str) -> Optional[Query]:
+        project = self.role_provider_obj.project
+        crew_ids = db.session.query(ProjectCrewMembership.user_id).filter(
+            ProjectCrewMembership.project_id == project.id,
+            ProjectCrewMembership.is_active,
+        )
+        if role == 'project_crew':
+            return crew_ids
+        if role == 'project_participant':
+            # Crew are also participants, as are registered users and ticket holders
+            return crew_ids.union(
+                db.session.query(Rsvp.user_id).filter(
+                    Rsvp.project_id == project.id, Rsvp.state.YES
+                ),
+                db.session.query(TicketParticipant.user_id).filter(
+                    TicketParticipant.project_id == project.id,
+                    TicketParticipant.user_id.isnot(None),
+                ),
+            )
+        return None
+
+
 # --- Account notifications ------------------------------------------------------------
 
 
@@ -99,7 +130,7 @@ class RegistrationCancellationNotification(DocumentHasProject, Notification):
     allow_web = False
 
 
-class NewUpdateNotification(DocumentHasProject, Notification):
+class NewUpdateNotification(ProjectRolesInSql, DocumentHasProject, Notification):
     """Notifications of new updates."""
 
     __mapper_args__ = {'polymorphic_identity': 'update_new'}
@@ -136,7 +167,7 @@ class ProposalSubmittedNotification(DocumentHasProject, Notification):
     default_whatsapp = False
 
 
-class ProjectStartingNotification(DocumentHasProfile, Notification):
+class ProjectStartingNotification(ProjectRolesInSql, DocumentHasProfile, Notification):
     """Notification of a session about to start."""
 
     __mapper_args__ = {'polymorphic_identity': 'project_starting'}
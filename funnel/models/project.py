@@ -168,6 +168,12 @@ class Project(UuidMixin, BaseScopedNameMixin, db.Model):
         write={'editor'},
         datasets={'primary', 'without_parent', 'related'},
     )
+    #: Start time of the next session, cached from sessions and refreshed periodically
+    #: by :meth:`refresh_next_session_at` as sessions pass
+    next_session_at = with_roles(
+        db.Column(db.TIMESTAMP(timezone=True), nullable=True, index=True),
+        read={'all'},
+    )
 
     cfp_start_at = db.Column(db.TIMESTAMP(timezone=True), nullable=True, index=True)
     cfp_end_at = db.Column(db.TIMESTAMP(timezone=True), nullable=True, index=True)
@@ -637,6 +643,10 @@ class Project(UuidMixin, BaseScopedNameMixin, db.Model):
         """Update cached timestamps from sessions."""
         self.start_at = self.schedule_start_at
         self.end_at = self.schedule_end_at
+        next_session = self.next_session_from(utcnow())
+        self.next_session_at = (
+            next_session.start_at if next_session is not None else None
+        )
 
     def roles_for(self, actor: Optional[User], anchors: Iterable = ()) -> Set:
         roles = super().roles_for(actor, anchors)
@@ -8,15 +8,16 @@ from werkzeug.utils import cached_property
 from typing_extensions import Literal
 
 from baseframe import __
-from coaster.sqlalchemy import StateManager, with_roles
+from coaster.sqlalchemy import Query, StateManager, with_roles
 from coaster.utils import LabeledEnum
 
 from ..typing import OptionalMigratedTables
 from . import NoIdMixin, UuidMixin, db
+from .email_address import EmailAddress
 from .helpers import reopen
 from .project import Project
 from .project_membership import project_child_role_map
-from .user import User, UserEmail
+from .user import User, UserEmail, UserEmailClaim, user_email_primary_table
 
 __all__ = ['Rsvp', 'RSVP_STATUS']
 
@@ -196,6 +197,61 @@ class __Project:
             .filter(User.state.ACTIVE, Rsvp._state == status)  # skipcq: PYL-W0212
         )
 
+    def rsvps_export(self, status: str) -> Query:
+        """
+        Return a query of (fullname, email, created_at) for RSVPs, for export.
+
+        The email address is the user's primary email address, or any other email
+        address, or an unverified email address, or a blank string, selected in the
+        same query instead of loading each user's email relationships.
+        """
+        primary_email = (
+            db.select([EmailAddress.email])
+            .select_from(user_email_primary_table)
+            .join(UserEmail, UserEmail.id == user_email_primary_table.c.user_email_id)
+            .join(EmailAddress, EmailAddress.id == UserEmail.email_address_id)
+            .where(user_email_primary_table.c.user_id == User.id)
+            .correlate(User)
+            .scalar_subquery()
+        )
+        any_email = (
+            db.select([EmailAddress.email])
+            .select_from(UserEmail)
+            .join(EmailAddress, EmailAddress.id == UserEmail.email_address_id)
+            .where(UserEmail.user_id == User.id)
+            .order_by(UserEmail.created_at)
+            .limit(1)
+            .correlate(User)
+            .scalar_subquery()
+        )
+        claimed_email = (
+            db.select([EmailAddress.email])
+            .select_from(UserEmailClaim)
+            .join(EmailAddress, EmailAddress.id == UserEmailClaim.email_address_id)
+            .where(UserEmailClaim.user_id == User.id)
+            .order_by(UserEmailClaim.created_at)
+            .limit(1)
+            .correlate(User)
+            .scalar_subquery()
+        )
+        return (
+            db.session.query(
+                User.fullname,
+                db.func.coalesce(primary_email, any_email, claimed_email, '').label(
+                    'email'
+                ),
+                Rsvp.created_at,
+            )
+            .select_from(Rsvp)
+            .join(User, Rsvp.user_id == User.id)
+            .filter(
+                Rsvp.project == self,
+                User.state.ACTIVE,
+                Rsvp._state == status,  # skipcq: PYL-W0212
+            )
+            .order_by(Rsvp.created_at)
+        )
+
     def rsvp_counts(self) -> Dict[str, int]:
         return dict(
             db.session.query(Rsvp._state, db.func.count(Rsvp._state))
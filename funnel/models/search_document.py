@@ -0,0 +1,57 @@
+"""Denormalized search documents for site, profile and project search."""
+
+from __future__ import annotations
+
+from . import TSVectorType, db
+
+__all__ = ['SearchDocument']
+
+
+class SearchDocument(db.Model):
+    """
+    Search document for a searchable object.
+
+    Each document has the object's visibility in each search scope precomputed, so that
+    a search in any scope is a single indexed scan of this table. Documents are written
+    by :mod:`funnel.views.search`, which refreshes them whenever a searchable object is
+    written, and can be rebuilt with ``flask reindex_search``.
+    """
+
+    __tablename__ = 'search_document'
+
+    #: Type of object, as used in search (``project``, ``submission``, etc)
+    type = db.Column(db.Unicode, nullable=False, primary_key=True)  # noqa: A003
+    #: Id of object in the model's table
+    object_id = db.Column(db.Integer, nullable=False, primary_key=True)
+    #: Profile this object is in (the profile itself for profiles)
+    profile_id = db.Column(
+        None, db.ForeignKey('profile.id', ondelete='CASCADE'), nullable=True, index=True
+    )
+    #: Project this object is in (the project itself for projects)
+    project_id = db.Column(
+        None, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=True, index=True
+    )
+    #: Is this object visible in site-wide search?
+    visible_site = db.Column(db.Boolean, nullable=False)
+    #: Is this object visible when searching within its profile?
+    visible_profile = db.Column(db.Boolean, nullable=False)
+    #: Is this object visible when searching within its project?
+    visible_project = db.Column(db.Boolean, nullable=False)
+    #: Search vector, including related text such as an author's name
+    search_vector = db.deferred(
+        db.Column(TSVectorType(regconfig='english'), nullable=False)
+    )
+    #: Title of the object, for highlighting (null if the object has no title)
+    title = db.Column(db.UnicodeText, nullable=True)
+    #: Text of the object, for highlighting
+    hltext = db.deferred(db.Column(db.UnicodeText, nullable=False))
+    #: Object's creation timestamp, for ordering
+    created_at = db.Column(db.TIMESTAMP(timezone=True), nullable=False)
+
+    __table_args__ = (
+        db.Index(
+            'ix_search_document_search_vector',
+            'search_vector',
+            postgresql_using='gin',
+        ),
+    )
@@ -275,26 +275,17 @@ TypeProject = Type[Project]
 class __Project:
     # Project schedule column expressions. Guide:
     # https://docs.sqlalchemy.org/en/13/orm/mapped_sql_expr.html#using-column-property
+    # These are deferred as they are correlated subqueries. Their values are cached in
+    # `start_at` and `end_at` by :meth:`update_schedule_timestamps`, and listings
+    # should use those columns instead
     schedule_start_at = with_roles(
         db.column_property(
             db.select([db.func.min(Session.start_at)])
             .where(Session.start_at.isnot(None))
             .where(Session.project_id == Project.id)
             .correlate_except(Session)
-            .scalar_subquery()
-        ),
-        read={'all'},
-        datasets={'primary', 'without_parent'},
-    )
-
-    next_session_at = with_roles(
-        db.column_property(
-            db.select([db.func.min(Session.start_at)])
-            .where(Session.start_at.isnot(None))
-            .where(Session.start_at >= db.func.utcnow())
-            .where(Session.project_id == Project.id)
-            .correlate_except(Session)
-            .scalar_subquery()
+            .scalar_subquery(),
+            deferred=True,
         ),
         read={'all'},
     )
@@ -305,13 +296,13 @@ class __Project:
             .where(Session.end_at.isnot(None))
             .where(Session.project_id == Project.id)
             .correlate_except(Session)
-            .scalar_subquery()
+            .scalar_subquery(),
+            deferred=True,
         ),
         read={'all'},
-        datasets={'primary', 'without_parent'},
     )
 
-    @with_roles(read={'all'}, datasets={'primary', 'without_parent'})
+    @with_roles(read={'all'})
     @cached_property
     def schedule_start_at_localized(self):
         return (
@@ -320,7 +311,7 @@ class __Project:
             else None
         )
 
-    @with_roles(read={'all'}, datasets={'primary', 'without_parent'})
+    @with_roles(read={'all'})
     @cached_property
     def schedule_end_at_localized(self):
         return (
@@ -396,6 +387,32 @@ class __Project:
             .first()
         )
 
+    @classmethod
+    def refresh_next_session_at(cls, timestamp: Optional[datetime] = None) -> int:
+        """
+        Recompute :attr:`next_session_at` for projects whose next session has started.
+
+        Changes to sessions update this value via :meth:`update_schedule_timestamps`,
+        so only projects with a cached timestamp in the past need a refresh. Returns
+        the number of projects updated.
+        """
+        cls = cast(TypeProject, cls)
+        if timestamp is None:
+            timestamp = utcnow()
+        return cls.query.filter(
+            cls.next_session_at.isnot(None), cls.next_session_at < timestamp
+        ).update(
+            {
+                cls.next_session_at: db.select([db.func.min(Session.start_at)])
+                .where(Session.start_at.isnot(None))
+                .where(Session.start_at >= timestamp)
+                .where(Session.project_id == cls.id)
+                .correlate_except(Session)
+                .scalar_subquery()
+            },
+            synchronize_session=False,
+        )
+
     @with_roles(call={'all'})
     def next_starting_at(
         self, timestamp: Optional[datetime] = None
@@ -4,10 +4,12 @@ from __future__ import annotations
 
 from base64 import urlsafe_b64decode, urlsafe_b64encode
 from os import urandom
-from typing import Iterable, Optional, Union, overload
+from typing import Dict, Iterable, List, Optional, Union, overload
 import hashlib
+import json
 import re
 
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import Comparator
 
@@ -21,7 +23,7 @@ from . import NoIdMixin, UrlType, db, hybrid_property
 from .helpers import profanity
 from .user import User
 
-__all__ = ['Shortlink']
+__all__ = ['Shortlink', 'ShortlinkClickCount']
 
 
 # --- Constants ------------------------------------------------------------------------
@@ -335,6 +337,88 @@ class Shortlink(NoIdMixin, db.Model):
                 shortlink.id = random_bigint(shorter)
         return shortlink
 
+    @classmethod
+    def new_many(
+        cls,
+        urls: Iterable[Union[str, furl]],
+        *,
+        shorter: bool = False,
+        reuse: bool = False,
+        actor: Optional[User] = None,
+    ) -> List[Shortlink]:
+        """
+        Create shortlinks for many URLs at once, returning them in the same order.
+
+        This is the bulk equivalent of :meth:`new`. Reusable shortlinks are found with
+        a single query, and new shortlinks are inserted in a single statement that
+        skips colliding ids, retrying only for those URLs.
+        """
+        url_list = [url_normalize(str(url)) for url in urls]
+        shortlinks: Dict[Union[int, str], Shortlink] = {}
+        if reuse:
+            query = cls.query.filter(
+                Shortlink.url.in_(set(url_list)), Shortlink.enabled.is_(True)
+            )
+            if shorter:
+                query = query.filter(
+                    Shortlink.id > 0, Shortlink.id < SHORT_LINK_ID_UPPER_BOUND
+                )
+            for existing in query:
+                # Loaded URLs are unhashable furl objects, so key them as strings
+                shortlinks.setdefault(str(existing.url), existing)
+            # Reused shortlinks are looked up by URL, new ones by position
+            pending = {url: url for url in url_list if url not in shortlinks}
+        else:
+            pending = dict(enumerate(url_list))
+
+        user_id = actor.id if actor is not None else None
+        created_ids: Dict[Union[int, str], int] = {}
+        while pending:
+            candidates: Dict[int, Union[int, str]] = {}
+            for key in pending:
+                idv = random_bigint(shorter)
+                while idv in candidates or profanity.contains_profanity(
+                    bigint_to_name(idv)
+                ):
+                    idv = random_bigint(shorter)
+                candidates[idv] = key
+            inserted = db.session.execute(
+                pg_insert(cls.__table__)
+                .values(
+                    [
+                        {
+                            'id': idv,
+                            'url': pending[key],
+                            'user_id': user_id,
+                            'enabled': True,
+                        }
+                        for idv, key in candidates.items()
+                    ]
+                )
+                .on_conflict_do_nothing()
+                .returning(cls.__table__.c.id)
+            ).scalars()
+            for idv in inserted:
+                key = candidates[idv]
+                created_ids[key] = idv
+                del pending[key]
+        if created_ids:
+            created = {
+                obj.id: obj
+                for obj in cls.query.filter(cls.id.in_(created_ids.values()))
+            }
+            for key, idv in created_ids.items():
+                shortlinks[key] = created[idv]
+            # Rows inserted through Core are not seen by the session's flush, so add
+            # them to the shortlinks that are cached after commit, in the format of
+            # :func:`funnel.views.shortlink.shortlink_cache_value`
+            written = db.session.info.setdefault('shortlink_written', {})
+            for obj in created.values():
+                written[obj.id] = json.dumps([str(obj.url), obj.enabled])
+        if reuse:
+            return [shortlinks[url] for url in url_list]
+        return [shortlinks[index] for index in range(len(url_list))]
+
     @classmethod
     def name_available(cls, name: str) -> bool:
         """Check if a name is available to use for a new shortlink."""
@@ -368,3 +452,34 @@ class Shortlink(NoIdMixin, db.Model):
         if obj is not None and (ignore_enabled or obj.enabled):
             return obj
         return None
+
+
+class ShortlinkClickCount(db.Model):
+    """Hourly count of clicks on a shortlink, by the visitor's origin and client."""
+
+    __tablename__ = 'shortlink_click_count'
+
+    #: Shortlink that was clicked
+    shortlink_id = db.Column(
+        None,
+        db.ForeignKey('shortlink.id', ondelete='CASCADE'),
+        primary_key=True,
+    )
+    shortlink = db.relationship(Shortlink)
+    #: Start of the hour in which the clicks happened
+    hour = db.Column(db.TIMESTAMP(timezone=True), primary_key=True)
+    #: Host name in the HTTP Referer header, or blank
+    referrer = db.Column(db.Unicode(253), primary_key=True, default='')
+    #: Type of client: `mobile`, `tablet`, `desktop`, `bot` or `other`
+    ua_class = db.Column(db.Unicode(7), primary_key=True)
+    #: ISO country code from GeoIP, or blank if unknown
+    country = db.Column(db.Unicode(2), primary_key=True, default='')
+    #: Number of clicks
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        """Return string representation of self."""
+        return (
+            f'ShortlinkClickCount(shortlink_id={self.shortlink_id!r},'
+            f' hour={self.hour!r}, count={self.count!r})'
+        )
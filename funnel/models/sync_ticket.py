@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-from typing import Iterable, Optional, Set
+from typing import Iterable, List, Optional, Set
 import base64
+import hashlib
+import json
 import os
 
 from . import BaseMixin, BaseScopedNameMixin, UuidMixin, db, with_roles
-from .email_address import EmailAddress, EmailAddressMixin
+from .email_address import EmailAddress, EmailAddressMixin, email_blake2b160_hash
 from .helpers import reopen
 from .project import Project
 from .project_membership import project_child_role_map
@@ -33,6 +35,22 @@ def make_private_key():
     return make_key()[:8]
 
 
+def ticket_digest(ticket_dict: dict, ticket_events: Iterable) -> bytes:
+    """
+    Return a digest of a ticket from a ticket source.
+
+    The ticket type's events are included so that tickets are processed again when
+    the events they grant access to change.
+    """
+    return hashlib.blake2b(
+        json.dumps(
+            [ticket_dict, sorted(ticket_event.id for ticket_event in ticket_events)],
+            sort_keys=True,
+        ).encode(),
+        digest_size=16,
+    ).digest()
+
+
 ticket_event_ticket_type = db.Table(
     'ticket_event_ticket_type',
     db.Model.metadata,
@@ -306,9 +324,10 @@ class TicketParticipant(EmailAddressMixin, UuidMixin, BaseMixin, db.Model):
     @classmethod
     def checkin_list(cls, ticket_event):
         """
-        Return ticket participant details as a comma separated string.
+        Return a query of ticket participant details for a ticket event.
 
-        Also includes associated ticket types.
+        Also includes associated ticket types as a comma separated string. The query
+        can be iterated with :meth:`~sqlalchemy.orm.Query.yield_per` for exports.
 
         FIXME: This is bad design and should be replaced with a saner mechanism.
         """
@@ -342,7 +361,7 @@ class TicketParticipant(EmailAddressMixin, UuidMixin, BaseMixin, db.Model):
             .filter(TicketEventParticipant.ticket_event_id == ticket_event.id)
             .order_by(TicketParticipant.fullname)
         )
-        return query.all()
+        return query
 
 
 class TicketEventParticipant(BaseMixin, db.Model):
@@ -422,27 +441,149 @@ class TicketClient(BaseMixin, db.Model):
 
     __roles__ = {'all': {'call': {'url_for'}}}
 
-    def import_from_list(self, ticket_list):
-        """Batch upsert tickets and their associated ticket types and participants."""
+    def import_from_list(
+        self, ticket_list: List[dict], chunk_size: int = 500, commit: bool = False
+    ) -> int:
+        """
+        Batch upsert tickets and their associated ticket types and participants.
+
+        Tickets that have not changed since the last import are skipped. The rest are
+        processed in chunks, with ticket types, email addresses, participants and
+        tickets looked up once per chunk. Returns the number of tickets processed.
+
+        :param ticket_list: Tickets from the ticket source
+        :param chunk_size: Number of tickets to process at a time
+        :param commit: Commit the database session after each chunk
+        """
+        ticket_types = {
+            ticket_type.title: ticket_type
+            for ticket_type in TicketType.query.filter(
+                TicketType.project == self.project
+            ).options(db.selectinload(TicketType.ticket_events))
+        }
+        digests = {
+            (order_no, ticket_no): digest
+            for order_no, ticket_no, digest in db.session.query(
+                SyncTicket.order_no, SyncTicket.ticket_no, SyncTicket.digest
+            ).filter(SyncTicket.ticket_client == self)
+        }
+        changed = []
         for ticket_dict in ticket_list:
-            ticket_type = TicketType.upsert(
-                self.project, current_title=ticket_dict['ticket_type']
+            ticket_type = ticket_types.get(ticket_dict['ticket_type'])
+            digest = ticket_digest(
+                ticket_dict, ticket_type.ticket_events if ticket_type else ()
             )
-
-            ticket_participant = TicketParticipant.upsert(
-                self.project,
-                ticket_dict['email'],
-                fullname=ticket_dict['fullname'],
-                phone=ticket_dict['phone'],
-                twitter=ticket_dict['twitter'],
-                company=ticket_dict['company'],
-                job_title=ticket_dict['job_title'],
-                city=ticket_dict['city'],
+            if (
+                digests.get((ticket_dict.get('order_no'), ticket_dict.get('ticket_no')))
+                != digest
+            ):
+                changed.append((ticket_dict, digest))
+
+        for offset in range(0, len(changed), chunk_size):
+            self._import_chunk(changed[offset : offset + chunk_size], ticket_types)
+            if commit:
+                db.session.commit()
+        return len(changed)
+
+    def _import_chunk(self, chunk, ticket_types):
+        """Upsert a chunk of `(ticket_dict, digest)` pairs."""
+        project = self.project
+        email_hashes = {
+            email_blake2b160_hash(ticket_dict['email'])
+            for ticket_dict, _digest in chunk
+            if EmailAddress.is_valid_email_address(ticket_dict['email'])
+        }
+        email_addresses = {}
+        users = {}
+        participants = {}
+        if email_hashes:
+            email_addresses = {
+                email_address.blake2b160: email_address
+                for email_address in EmailAddress.query.filter(
+                    EmailAddress.blake2b160.in_(email_hashes)
+                )
+            }
+            users = {
+                useremail.email_address.blake2b160: useremail.user
+                for useremail in UserEmail.query.join(EmailAddress)
+                .filter(EmailAddress.blake2b160.in_(email_hashes))
+                .options(
+                    db.contains_eager(UserEmail.email_address),
+                    db.joinedload(UserEmail.user),
+                )
+            }
+            participants = {
+                ticket_participant.email_address.blake2b160: ticket_participant
+                for ticket_participant in TicketParticipant.query.join(EmailAddress)
+                .filter(
+                    TicketParticipant.project == project,
+                    EmailAddress.blake2b160.in_(email_hashes),
+                )
+                .options(
+                    db.contains_eager(TicketParticipant.email_address),
+                    db.selectinload(TicketParticipant.ticket_events),
+                )
+            }
+        tickets = {
+            (ticket.order_no, ticket.ticket_no): ticket
+            for ticket in SyncTicket.query.filter(
+                SyncTicket.ticket_client == self,
+                db.tuple_(SyncTicket.order_no, SyncTicket.ticket_no).in_(
+                    [
+                        (ticket_dict.get('order_no'), ticket_dict.get('ticket_no'))
+                        for ticket_dict, _digest in chunk
+                    ]
+                ),
+            ).options(
+                db.joinedload(SyncTicket.ticket_participant).selectinload(
+                    TicketParticipant.ticket_events
+                )
             )
+        }
 
-            ticket = SyncTicket.get(
-                self, ticket_dict.get('order_no'), ticket_dict.get('ticket_no')
-            )
+        for ticket_dict, digest in chunk:
+            ticket_type = ticket_types.get(ticket_dict['ticket_type'])
+            if ticket_type is None:
+                ticket_type = TicketType(
+                    parent=project, title=ticket_dict['ticket_type']
+                )
+                db.session.add(ticket_type)
+                ticket_types[ticket_type.title] = ticket_type
+
+            fields = {
+                'fullname': ticket_dict['fullname'],
+                'phone': ticket_dict['phone'],
+                'twitter': ticket_dict['twitter'],
+                'company': ticket_dict['company'],
+                'job_title': ticket_dict['job_title'],
+                'city': ticket_dict['city'],
+            }
+            email = ticket_dict['email']
+            if not EmailAddress.is_valid_email_address(email):
+                # Let the regular path report the problem with this address
+                ticket_participant = TicketParticipant.upsert(project, email, **fields)
+            else:
+                email_hash = email_blake2b160_hash(email)
+                ticket_participant = participants.get(email_hash)
+                if ticket_participant is not None:
+                    ticket_participant.user = users.get(email_hash)
+                    ticket_participant._set_fields(fields)
+                else:
+                    email_address = email_addresses.get(email_hash)
+                    if email_address is not None and not email_address.is_blocked:
+                        # Skip the lookup in :meth:`EmailAddress.add_for`
+                        fields['email_address'] = email_address
+                    else:
+                        fields['email'] = email
+                    with db.session.no_autoflush:
+                        ticket_participant = TicketParticipant(
+                            project=project, user=users.get(email_hash), **fields
+                        )
+                    db.session.add(ticket_participant)
+                    participants[email_hash] = ticket_participant
+
+            ticket_key = (ticket_dict.get('order_no'), ticket_dict.get('ticket_no'))
+            ticket = tickets.get(ticket_key)
             if ticket and (
                 ticket.ticket_participant != ticket_participant
                 or ticket_dict.get('status') == 'cancelled'
@@ -452,16 +593,25 @@ class TicketClient(BaseMixin, db.Model):
                 ticket.ticket_participant.remove_events(ticket_type.ticket_events)
 
             if ticket_dict.get('status') == 'confirmed':
-                ticket = SyncTicket.upsert(
-                    self,
-                    ticket_dict.get('order_no'),
-                    ticket_dict.get('ticket_no'),
-                    ticket_participant=ticket_participant,
-                    ticket_type=ticket_type,
-                )
+                if ticket is not None:
+                    ticket.ticket_participant = ticket_participant
+                    ticket.ticket_type = ticket_type
+                else:
+                    ticket = SyncTicket(
+                        ticket_client=self,
+                        order_no=ticket_key[0],
+                        ticket_no=ticket_key[1],
+                        ticket_participant=ticket_participant,
+                        ticket_type=ticket_type,
+                    )
+                    db.session.add(ticket)
+                    tickets[ticket_key] = ticket
                 # Ensure that the new or updated participant has access to events
                 ticket.ticket_participant.add_events(ticket_type.ticket_events)
 
+            if ticket is not None:
+                ticket.digest = digest
+
 
 class SyncTicket(BaseMixin, db.Model):
     """Model for a ticket that was bought elsewhere, like Boxoffice or Explara."""
@@ -487,6 +637,8 @@ class SyncTicket(BaseMixin, db.Model):
     ticket_client = db.relationship(
         TicketClient, backref=db.backref('sync_tickets', cascade='all')
     )
+    #: Digest of the ticket's details at the last import, to skip unchanged tickets
+    digest = db.Column(db.LargeBinary, nullable=True)
     __table_args__ = (db.UniqueConstraint('ticket_client_id', 'order_no', 'ticket_no'),)
 
     @classmethod
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+from datetime import datetime
 from enum import Enum, IntFlag
-from typing import Dict, Pattern, Sequence, cast
+from typing import Any, Dict, Optional, Pattern, Sequence, cast
 import base64
+import hashlib
+import os
 import re
+import tempfile
 
 from cryptography import x509
 from cryptography.exceptions import InvalidSignature
@@ -11,6 +15,7 @@ from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
 from cryptography.hazmat.primitives.asymmetric.rsa import RSAPublicKey
 from cryptography.hazmat.primitives.hashes import SHA1
+from redis.exceptions import RedisError
 import requests
 
 __all__ = [
@@ -70,6 +75,9 @@ class SnsValidator:
 
     :param cert_regex: Certificate URL compiled regex
     :param sig_version: Signature version (default: 1)
+    :param cache: Redis client to share signing certificates between processes
+    :param cache_dir: Folder to save signing certificates in, for use when the cache
+        is empty and before fetching from AWS
     """
 
     #: Regular expression for certificate URL
@@ -84,10 +92,14 @@ class SnsValidator:
         topics: Sequence[str] = (),
         cert_regex: Pattern[str] = CERT_URL_REGEX,
         sig_version: str = SIGNATURE_VERSION,
+        cache: Any = None,
+        cache_dir: Optional[str] = None,
     ) -> None:
         self.topics = topics
         self.cert_regex = cert_regex
         self.sig_version = sig_version
+        self.cache = cache
+        self.cache_dir = cache_dir
         #: Cache of public keys (per Python process)
         self.public_keys: Dict[str, RSAPublicKey] = {}
 
@@ -156,13 +168,96 @@ class SnsValidator:
         pairs = [f'{key}\n{message.get(key)}' for key in keys]
         return '\n'.join(pairs) + '\n'
 
+    @staticmethod
+    def _load_certificate(pem: bytes) -> Optional[x509.Certificate]:
+        """Load a PEM certificate, returning None if it has expired."""
+        cert = x509.load_pem_x509_certificate(pem, default_backend())
+        if cert.not_valid_after <= datetime.utcnow():
+            return None
+        return cert
+
+    def _cache_path(self, url: str) -> Optional[str]:
+        """Return the path of the file to save the certificate at a URL in."""
+        if not self.cache_dir:
+            return None
+        return os.path.join(
+            self.cache_dir, hashlib.sha256(url.encode()).hexdigest() + '.pem'
+        )
+
+    def _save_certificate(self, url: str, pem: bytes, cert: x509.Certificate) -> None:
+        """Save a certificate to the shared cache and the cache folder."""
+        if self.cache is not None:
+            timeout = int((cert.not_valid_after - datetime.utcnow()).total_seconds())
+            if timeout > 0:
+                try:
+                    self.cache.set(f'sns/certificate/{url}', pem.decode(), ex=timeout)
+                except RedisError:
+                    # The shared cache is an optimization; the cache folder or a
+                    # fetch from AWS will do if it is unavailable
+                    pass
+        path = self._cache_path(url)
+        if path and not os.path.exists(path):
+            tmp_path = None
+            try:
+                os.makedirs(cast(str, self.cache_dir), exist_ok=True)
+                # Write to a unique name and move it into place, so that concurrent
+                # workers never read a partly written file
+                with tempfile.NamedTemporaryFile(
+                    dir=self.cache_dir, suffix='.tmp', delete=False
+                ) as fd:
+                    tmp_path = fd.name
+                    fd.write(pem)
+                os.replace(tmp_path, path)
+            except OSError:
+                # The cache folder is also an optimization. The certificate will be
+                # fetched again if it can't be saved
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+
+    def _get_certificate(self, url: str) -> x509.Certificate:
+        """
+        Get the signing certificate at a URL.
+
+        Looks in the shared cache, then the cache folder, and finally fetches it from
+        AWS, saving it to the caches. Expired certificates are not used. The shared
+        cache is skipped if it is unavailable.
+        """
+        if self.cache is not None:
+            try:
+                cached = self.cache.get(f'sns/certificate/{url}')
+            except RedisError:
+                cached = None
+            if cached:
+                pem = cached.encode() if isinstance(cached, str) else cached
+                cert = self._load_certificate(pem)
+                if cert is not None:
+                    self._save_certificate(url, pem, cert)
+                    return cert
+        path = self._cache_path(url)
+        if path and os.path.exists(path):
+            with open(path, 'rb') as fd:
+                pem = fd.read()
+            cert = self._load_certificate(pem)
+            if cert is not None:
+                self._save_certificate(url, pem, cert)
+                return cert
+        try:
+            pem = requests.get(url, timeout=30).content
+        except requests.exceptions.RequestException as exc:
+            raise SnsSignatureFailureError(exc)
+        cert = self._load_certificate(pem)
+        if cert is None:
+            raise SnsSignatureFailureError("Signing certificate has expired")
+        self._save_certificate(url, pem, cert)
+        return cert
+
     def _get_public_key(self, message: Dict[str, str]) -> RSAPublicKey:
         """
         Get the public key using an internal per-process cache.
 
         Every message has a signing URL which has a PEM file. We need to get the public
         key of the PEM. To avoid getting it for every message, we can cache it
-        internally.
+        internally, and across processes in :attr:`cache` and :attr:`cache_dir`.
 
         :param message: SNS Message
         :return: Public Key
@@ -170,13 +265,9 @@ class SnsValidator:
         url = message['SigningCertURL']
         public_key = self.public_keys.get(url)
         if not public_key:
-            try:
-                pem = requests.get(url, timeout=30).content
-                cert = x509.load_pem_x509_certificate(pem, default_backend())
-                public_key = cast(RSAPublicKey, cert.public_key())
-                self.public_keys[url] = public_key
-            except requests.exceptions.RequestException as exc:
-                raise SnsSignatureFailureError(exc)
+            cert = self._get_certificate(url)
+            public_key = cast(RSAPublicKey, cert.public_key())
+            self.public_keys[url] = public_key
         return public_key
 
     def _check_signature(self, message: Dict[str, str]) -> None:
@@ -3,23 +3,26 @@
 from __future__ import annotations
 
 from email.utils import formataddr, getaddresses, parseaddr
-from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple, Union
 
 from flask import current_app
 from flask_mailman import EmailMultiAlternatives
 from flask_mailman.message import sanitize_address
 
 from html2text import html2text
+from markupsafe import escape
 from premailer import transform
 
 from baseframe import statsd
 
-from ... import app
-from ...models import EmailAddress, EmailAddressBlockedError, User
+from ... import app, mail
+from ...models import EmailAddress, EmailAddressBlockedError, User, db
 from ..exc import TransportRecipientError
 
 __all__ = [
     'EmailAttachment',
+    'EmailBatch',
     'jsonld_confirm_action',
     'jsonld_view_action',
     'process_recipient',
@@ -108,6 +111,132 @@ def process_recipient(recipient: EmailRecipient) -> str:
     return formataddr((realname, emailaddr))
 
 
+@lru_cache(maxsize=32)
+def render_alternatives(content: str, base_url: str) -> Tuple[str, str]:
+    """
+    Render plain text and CSS-inlined HTML versions of email content.
+
+    Results are cached, as the same content is typically sent to many recipients.
+    """
+    return html2text(content), transform(content, base_url=base_url)
+
+
+def substitution_placeholder(index: int) -> str:
+    """Return a placeholder for a per-recipient substitution in email content."""
+    # Placeholders are absolute URLs so that premailer will leave them untouched when
+    # they appear in links
+    return f'https://substitution.invalid/{index}'
+
+
+class EmailBatch:
+    """
+    Send a batch of email messages over a single connection to the mail server.
+
+    Sent status is recorded on :class:`EmailAddress` in a single UPDATE when the batch
+    is closed, including when it exits with an exception, as addresses are only
+    collected after their message is sent. The caller must commit the database session
+    after the batch is closed.
+
+    Usage::
+
+        with EmailBatch() as batch:
+            for recipient in recipients:
+                batch.send(subject, [recipient], content, substitutions=[url])
+    """
+
+    def __init__(self) -> None:
+        self.connection = mail.get_connection()
+        self.email_address_ids: Set[int] = set()
+
+    def __enter__(self) -> EmailBatch:
+        self.connection.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.connection.close()
+        self.mark_sent()
+
+    def mark_sent(self) -> None:
+        """Mark addresses as having received an email and update statistics."""
+        # This will only track emails sent by *this app*. However SES events will track
+        # statistics across all apps and hence the difference between this counter and
+        # SES event counters will be emails sent by other apps.
+        if self.email_address_ids:
+            statsd.incr('email_address.sent', count=len(self.email_address_ids))
+            EmailAddress.mark_sent_batch(self.email_address_ids)
+            self.email_address_ids = set()
+
+    def send(
+        self,
+        subject: str,
+        to: List[EmailRecipient],
+        content: str,
+        attachments: List[EmailAttachment] = None,
+        from_email: EmailRecipient = None,
+        headers: dict = None,
+        substitutions: Sequence[str] = (),
+    ) -> str:
+        """
+        Send an email within this batch. Parameters are as for :func:`send_email`.
+
+        :param list substitutions: Strings in the content that are specific to this
+            recipient, such as an unsubscribe URL. These are substituted after
+            rendering, so that the rendered HTML can be shared across recipients
+        """
+        # Parse recipients and convert as needed
+        to = [process_recipient(recipient) for recipient in to]
+        if from_email:
+            from_email = process_recipient(from_email)
+        substitutions = [value for value in substitutions if value]
+        for index, value in enumerate(substitutions):
+            content = content.replace(
+                str(escape(value)), substitution_placeholder(index)
+            ).replace(value, substitution_placeholder(index))
+        body, html = render_alternatives(
+            content, f'https://{app.config["DEFAULT_DOMAIN"]}/'
+        )
+        for index, value in enumerate(substitutions):
+            body = body.replace(substitution_placeholder(index), value)
+            html = html.replace(substitution_placeholder(index), str(escape(value)))
+        msg = EmailMultiAlternatives(
+            subject=subject,
+            to=to,
+            body=body,
+            from_email=from_email,
+            headers=headers,
+            alternatives=[(html, 'text/html')],
+            connection=self.connection,
+        )
+        if attachments:
+            for attachment in attachments:
+                msg.attach(
+                    content=attachment.content,
+                    filename=attachment.filename,
+                    mimetype=attachment.mimetype,
+                )
+        try:
+            # If an EmailAddress is blocked, this line will throw an exception
+            emails = [
+                EmailAddress.add(email)
+                for name, email in getaddresses(msg.recipients())
+            ]
+        except EmailAddressBlockedError as exc:
+            raise TransportRecipientError(exc)
+        # FIXME: This won't raise an exception on delivery_state.HARD_FAIL. We need to
+        # do catch that, remove the recipient, and notify the user via the upcoming
+        # notification centre. (Raise a TransportRecipientError)
+
+        result = msg.send()
+        # Keep ids, as the address instances may be expired by the time the batch is
+        # closed, and would have to be reloaded one at a time
+        if any(email.id is None for email in emails):
+            db.session.flush()
+        self.email_address_ids.update(email.id for email in emails)
+
+        # FIXME: 'result' is a number. Why? We need message-id
+        return str(result)
+
+
 def send_email(
     subject: str,
     to: List[EmailRecipient],
@@ -127,47 +256,12 @@ def send_email(
     :param from_email: Email sender, same format as email recipient
     :param dict headers: Optional extra email headers (for List-Unsubscribe, etc)
     """
-    # Parse recipients and convert as needed
-    to = [process_recipient(recipient) for recipient in to]
-    if from_email:
-        from_email = process_recipient(from_email)
-    body = html2text(content)
-    html = transform(content, base_url=f'https://{app.config["DEFAULT_DOMAIN"]}/')
-    msg = EmailMultiAlternatives(
-        subject=subject,
-        to=to,
-        body=body,
-        from_email=from_email,
-        headers=headers,
-        alternatives=[(html, 'text/html')],
-    )
-    if attachments:
-        for attachment in attachments:
-            msg.attach(
-                content=attachment.content,
-                filename=attachment.filename,
-                mimetype=attachment.mimetype,
-            )
-    try:
-        # If an EmailAddress is blocked, this line will throw an exception
-        emails = [
-            EmailAddress.add(email) for name, email in getaddresses(msg.recipients())
-        ]
-    except EmailAddressBlockedError as exc:
-        raise TransportRecipientError(exc)
-    # FIXME: This won't raise an exception on delivery_state.HARD_FAIL. We need to do
-    # catch that, remove the recipient, and notify the user via the upcoming
-    # notification centre. (Raise a TransportRecipientError)
-
-    result = msg.send()
-
-    # After sending, mark the address as having received an email and also update the
-    # statistics counters. Note that this will only track emails sent by *this app*.
-    # However SES events will track statistics across all apps and hence the difference
-    # between this counter and SES event counters will be emails sent by other apps.
-    statsd.incr('email_address.sent', count=len(emails))
-    for ea in emails:
-        ea.mark_sent()
-
-    # FIXME: 'result' is a number. Why? We need message-id
-    return str(result)
+    with EmailBatch() as batch:
+        return batch.send(
+            subject=subject,
+            to=to,
+            content=content,
+            attachments=attachments,
+            from_email=from_email,
+            headers=headers,
+        )
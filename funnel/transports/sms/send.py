@@ -2,6 +2,9 @@
 
 from __future__ import annotations
 
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple, Type
+import threading
+
 from flask import url_for
 import itsdangerous
 
@@ -15,6 +18,7 @@ from ... import app
 from ...serializers import token_serializer
 from ..exc import (
     TransportConnectionError,
+    TransportError,
     TransportRecipientError,
     TransportTransactionError,
 )
@@ -26,8 +30,32 @@ __all__ = [
     'send_via_exotel',
     'send_via_twilio',
     'send',
+    'SmsResult',
+    'SmsBatch',
 ]
 
+# Connections to providers are kept per thread, as neither a requests session nor a
+# Twilio client is documented as thread-safe
+_pool = threading.local()
+
+
+def exotel_session() -> requests.Session:
+    """Return this thread's HTTP session for Exotel, keeping connections open."""
+    session = getattr(_pool, 'exotel', None)
+    if session is None:
+        session = _pool.exotel = requests.Session()
+    return session
+
+
+def twilio_client() -> Client:
+    """Return this thread's Twilio client, which keeps connections open."""
+    account = app.config['SMS_TWILIO_SID']
+    token = app.config['SMS_TWILIO_TOKEN']
+    client = getattr(_pool, 'twilio', None)
+    if client is None or (client.username, client.password) != (account, token):
+        client = _pool.twilio = Client(account, token)
+    return client
+
 
 def make_exotel_token(to: str) -> str:
     """
@@ -88,7 +116,7 @@ def send_via_exotel(phone: str, message: SmsTemplate, callback: bool = True) ->
             secret_token=make_exotel_token(phone),
         )
     try:
-        r = requests.post(
+        r = exotel_session().post(
             f'https://twilix.exotel.in/v1/Accounts/{sid}/Sms/send.json',
             auth=(sid, token),
             data=payload,
@@ -119,14 +147,12 @@ def send_via_twilio(phone: str, message: SmsTemplate, callback: bool = True) ->
     :param callback: Whether to request a status callback
     :return: Transaction id
     """
-    # Get SID, Token and From (these are required to make any calls)
-    account = app.config['SMS_TWILIO_SID']
-    token = app.config['SMS_TWILIO_TOKEN']
+    # Get From (SID and Token are required by the client to make any calls)
     sender = app.config['SMS_TWILIO_FROM']
 
     # Send (This uses the routing API to deliver SMS via a Low Latency Location).
     # See https://www.twilio.com/docs/global-infrastructure/edge-locations
-    client = Client(account, token)
+    client = twilio_client()
 
     # Error evaluation is needed as API may fail for a variety of reasons.
     try:
@@ -186,3 +212,71 @@ def send(phone: str, message: SmsTemplate, callback: bool = True) -> str:
         if phone.startswith(prefix):
             return sender(phone, message, callback)
     raise TransportRecipientError(_("No service provider available for this recipient"))
+
+
+class SmsResult(NamedTuple):
+    """Result of sending one message in a :class:`SmsBatch`."""
+
+    phone: str
+    #: Transaction id, if the message was sent
+    transactionid: Optional[str]
+    #: Error, if the message was not sent
+    error: Optional[TransportError]
+
+
+class SmsBatch:
+    """
+    Send a batch of SMS messages over connections kept open across the batch.
+
+    DLT registration of each template type is checked once per batch, and templates
+    that are missing an entity or template id are logged.
+
+    Usage::
+
+        with SmsBatch() as batch:
+            for phone, message in messages:
+                batch.send(phone, message)
+
+    :param callback: Whether to request status callbacks
+    """
+
+    def __init__(self, callback: bool = True) -> None:
+        self.callback = callback
+        self.validated: Set[Type[SmsTemplate]] = set()
+
+    def __enter__(self) -> SmsBatch:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.validated = set()
+
+    def validate(self, message: SmsTemplate) -> None:
+        """Check if the message's template type is registered, once per type."""
+        cls = type(message)
+        if cls not in self.validated:
+            self.validated.add(cls)
+            if not cls.registered_entityid or not cls.registered_templateid:
+                app.logger.warning(
+                    "SMS template %s is missing a DLT entity id or template id",
+                    cls.__name__,
+                )
+
+    def send(self, phone: str, message: SmsTemplate) -> str:
+        """Send an SMS within this batch. Parameters are as for :func:`send`."""
+        self.validate(message)
+        return send(phone, message, self.callback)
+
+    def send_many(self, messages: Iterable[Tuple[str, SmsTemplate]]) -> List[SmsResult]:
+        """
+        Send SMS messages to phone numbers, continuing past failed messages.
+
+        :param messages: Pairs of phone number and message
+        :return: Result of each message, in order
+        """
+        results = []
+        for phone, message in messages:
+            try:
+                results.append(SmsResult(phone, self.send(phone, message), None))
+            except TransportError as exc:
+                results.append(SmsResult(phone, None, exc))
+        return results
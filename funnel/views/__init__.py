@@ -27,6 +27,7 @@ from . import (
     organization,
     profile,
     project,
+    project_listing,
     proposal,
     schedule,
     search,
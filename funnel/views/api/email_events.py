@@ -1,17 +1,19 @@
 from __future__ import annotations
 
 from email.utils import parseaddr
-from typing import List
+from typing import Dict, Iterable, List, Set, Tuple
 
 from flask import request
 
+from redis.exceptions import LockError
 import requests
 
 from baseframe import statsd
 from coaster.views import render_with
 
-from ... import app
-from ...models import EmailAddress, db
+from ... import app, redis_store
+from ...models import EMAIL_DELIVERY_STATE, EmailAddress, db
+from ...models.email_address import email_blake2b160_hash
 from ...transports.email.aws_ses import (
     SesEvent,
     SesProcessorAbc,
@@ -20,6 +22,19 @@ from ...transports.email.aws_ses import (
     SnsValidatorError,
 )
 
+#: Redis list of SES event messages waiting to be processed
+ses_event_queue_key = 'email_address/ses_events'
+#: Redis list of SES event messages that could not be processed, for inspection
+ses_event_failed_key = 'email_address/ses_events/failed'
+#: Redis lock held while processing the queue, so that overlapping runs don't process
+#: the same events
+ses_event_lock_key = 'email_address/ses_events/lock'
+#: Limit on the length of the queue and the failed list, in case they are not
+#: processed. The oldest events are dropped first
+SES_EVENT_QUEUE_MAXLEN = 100000
+#: Seconds a run may hold the lock for each batch, after which it is released
+SES_EVENT_LOCK_TIMEOUT = 300
+
 
 class SesProcessor(SesProcessorAbc):
     """SES message processor."""
@@ -45,15 +60,26 @@ class SesProcessor(SesProcessorAbc):
             email_address = EmailAddress.add(emailaddr)
         return email_address
 
+    def _mark(self, address: str, action: str) -> None:
+        """
+        Record an event for an email address.
+
+        :param address: Email address, optionally with a name
+        :param action: One of `sent`, `soft_fail`, `hard_fail`, `active` or `blocked`
+        """
+        if action == 'blocked':
+            EmailAddress.mark_blocked(address)
+        else:
+            getattr(self._email_address(address), f'mark_{action}')()
+
     def bounce(self, ses_event: SesEvent) -> None:
         """Record an SES email bounce event."""
         assert ses_event.bounce is not None  # nosec
         for bounced in ses_event.bounce.bounced_recipients:
-            email_address = self._email_address(bounced.email)
-            if ses_event.bounce.is_hard_bounce:
-                email_address.mark_hard_fail()
-            else:
-                email_address.mark_soft_fail()
+            self._mark(
+                bounced.email,
+                'hard_fail' if ses_event.bounce.is_hard_bounce else 'soft_fail',
+            )
 
         statsd.incr(
             'email_address.event',
@@ -65,8 +91,7 @@ class SesProcessor(SesProcessorAbc):
         """Record an SES email delayed event."""
         assert ses_event.delivery_delay is not None  # nosec
         for failed in ses_event.delivery_delay.delayed_recipients:
-            email_address = self._email_address(failed.email)
-            email_address.mark_soft_fail()
+            self._mark(failed.email, 'soft_fail')
 
         statsd.incr(
             'email_address.event',
@@ -89,10 +114,9 @@ class SesProcessor(SesProcessorAbc):
         if len(ses_event.complaint.complained_recipients) == 1:
             for complained in ses_event.complaint.complained_recipients:
                 if ses_event.complaint.complaint_feedback_type == 'not-spam':
-                    email_address = self._email_address(complained.email)
-                    email_address.mark_active()
+                    self._mark(complained.email, 'active')
                 elif ses_event.complaint.complaint_feedback_type == 'abuse':
-                    EmailAddress.mark_blocked(complained.email)
+                    self._mark(complained.email, 'blocked')
                 else:
                     # TODO: Process 'auth-failure', 'fraud', 'other', 'virus'
                     pass
@@ -126,8 +150,7 @@ class SesProcessor(SesProcessorAbc):
         """
         assert ses_event.delivery is not None  # nosec
         for sent in ses_event.delivery.recipients:
-            email_address = self._email_address(sent)
-            email_address.mark_sent()
+            self._mark(sent, 'sent')
         statsd.incr(
             'email_address.event',
             count=ses_event.delivery.recipients,
@@ -142,8 +165,7 @@ class SesProcessor(SesProcessorAbc):
         only if the original email had a single recipient.
         """
         if len(ses_event.mail.destination) == 1:
-            email_address = self._email_address(ses_event.mail.destination[0])
-            email_address.mark_active()
+            self._mark(ses_event.mail.destination[0], 'active')
             statsd.incr(
                 'email_address.event',
                 tags={'engine': 'aws_ses', 'stage': 'processed', 'event': 'opened'},
@@ -162,8 +184,7 @@ class SesProcessor(SesProcessorAbc):
         only if the original email had a single recipient.
         """
         if len(ses_event.mail.destination) == 1:
-            email_address = self._email_address(ses_event.mail.destination[0])
-            email_address.mark_active()
+            self._mark(ses_event.mail.destination[0], 'active')
             statsd.incr(
                 'email_address.event',
                 count=len(ses_event.mail.destination),
@@ -177,9 +198,164 @@ class SesProcessor(SesProcessorAbc):
             )
 
 
+class SesBatchProcessor(SesProcessor):
+    """
+    SES message processor that applies events to email addresses in bulk.
+
+    Events are collected by :meth:`process` and applied by :meth:`apply`, with one
+    query to find all the email addresses and one update for each delivery state.
+    """
+
+    def __init__(self) -> None:
+        self.marks: List[Tuple[str, str]] = []
+
+    def _mark(self, address: str, action: str) -> None:
+        """Collect an event for an email address, to be applied later."""
+        self.marks.append((address, action))
+
+    @staticmethod
+    def _email_addresses(addresses: Iterable[str]) -> Dict[str, EmailAddress]:
+        """Get or add email addresses in bulk, skipping those that can't be parsed."""
+        parsed = {}
+        for address in addresses:
+            _name, emailaddr = parseaddr(address)
+            if emailaddr and EmailAddress.is_valid_email_address(emailaddr):
+                parsed[address] = emailaddr
+            else:
+                app.logger.warning("Unable to parse email address %r", address)
+        if not parsed:
+            return {}
+        existing = {
+            email_address.blake2b160: email_address
+            for email_address in EmailAddress.query.filter(
+                EmailAddress.blake2b160.in_(
+                    {email_blake2b160_hash(emailaddr) for emailaddr in parsed.values()}
+                )
+            )
+        }
+        email_addresses = {}
+        for address, emailaddr in parsed.items():
+            email_hash = email_blake2b160_hash(emailaddr)
+            if email_hash not in existing:
+                existing[email_hash] = EmailAddress.add(emailaddr)
+            email_addresses[address] = existing[email_hash]
+        return email_addresses
+
+    def apply(self) -> None:
+        """Apply collected events, with the last delivery event for an address winning."""
+        delivery_states: Dict[str, str] = {}
+        active: Set[str] = set()
+        for address, action in self.marks:
+            if action == 'blocked':
+                # Blocking is rare and affects all variants of the address
+                EmailAddress.mark_blocked(address)
+            elif action == 'active':
+                active.add(address)
+            else:
+                delivery_states[address] = action
+        self.marks = []
+        email_addresses = self._email_addresses(set(delivery_states) | active)
+        for action, delivery_state in (
+            ('sent', EMAIL_DELIVERY_STATE.SENT),
+            ('soft_fail', EMAIL_DELIVERY_STATE.SOFT_FAIL),
+            ('hard_fail', EMAIL_DELIVERY_STATE.HARD_FAIL),
+        ):
+            EmailAddress.mark_delivery_state_batch(
+                [
+                    email_addresses[address]
+                    for address, address_action in delivery_states.items()
+                    if address_action == action and address in email_addresses
+                ],
+                delivery_state,
+            )
+        EmailAddress.mark_active_batch(
+            [
+                email_addresses[address]
+                for address in active
+                if address in email_addresses
+            ]
+        )
+
+
+def _process_ses_events(messages: List[str]) -> List[str]:
+    """Apply SES event messages in one batch, returning messages that failed."""
+    batch = SesBatchProcessor()
+    failed = []
+    for message in messages:
+        try:
+            batch.process(SesEvent.from_json(message))
+        except Exception:  # noqa: B902
+            app.logger.exception("Unable to process SES event %r", message)
+            failed.append(message)
+    try:
+        batch.apply()
+        db.session.commit()
+    except Exception:  # noqa: B902
+        db.session.rollback()
+        if len(messages) == 1:
+            app.logger.exception("Unable to apply SES event %r", messages[0])
+            return messages
+        # Retry one at a time to find the events that can't be applied
+        failed = []
+        for message in messages:
+            failed.extend(_process_ses_events([message]))
+    return failed
+
+
+def queue_ses_event(message: str) -> None:
+    """Add an SES event message to the queue, dropping the oldest if it is full."""
+    pipe = redis_store.pipeline()
+    pipe.rpush(ses_event_queue_key, message)
+    pipe.ltrim(ses_event_queue_key, -SES_EVENT_QUEUE_MAXLEN, -1)
+    pipe.execute()
+
+
+def process_ses_event_queue(batch_size: int = 500) -> int:
+    """
+    Apply SES events queued by the event endpoint, in batches.
+
+    Events are removed from the queue only after their batch is committed. Events that
+    can't be applied are moved to a list of failed events, so they don't hold up the
+    queue. Only one run processes the queue at a time; overlapping runs return
+    immediately. Returns the number of events processed.
+    """
+    lock = redis_store.lock(
+        ses_event_lock_key, timeout=SES_EVENT_LOCK_TIMEOUT, blocking_timeout=0
+    )
+    if not lock.acquire():
+        return 0
+    count = 0
+    try:
+        while True:
+            messages = redis_store.lrange(ses_event_queue_key, 0, batch_size - 1)
+            if not messages:
+                return count
+            failed = _process_ses_events(messages)
+            pipe = redis_store.pipeline()
+            if failed:
+                pipe.rpush(ses_event_failed_key, *failed)
+                pipe.ltrim(ses_event_failed_key, -SES_EVENT_QUEUE_MAXLEN, -1)
+                statsd.incr(
+                    'email_address.event',
+                    count=len(failed),
+                    tags={'engine': 'aws_ses', 'stage': 'failed'},
+                )
+            # New events are only added to the end of the queue
+            pipe.ltrim(ses_event_queue_key, len(messages), -1)
+            pipe.execute()
+            count += len(messages)
+            lock.reacquire()
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # The lock expired and may now be held by another run
+            pass
+
+
 # Local Variable for Validator, as there is no need to instantiate it every time we get
 # a notification (It could be 10 a second at peak)
-validator: SnsValidator = SnsValidator()
+validator: SnsValidator = SnsValidator(cache=redis_store)
 
 # SES Message Processor
 processor: SesProcessor = SesProcessor()
@@ -229,6 +405,7 @@ def process_ses_event():
     # Validate the message
     try:
         validator.topics = app.config['SES_NOTIFICATION_TOPICS']
+        validator.cache_dir = app.config.get('SES_CERTIFICATE_CACHE_DIR')
         validator.check(message)
     except SnsValidatorError:
         app.logger.warning("SNS/SES event failed validation: %r", message)
@@ -286,6 +463,12 @@ def process_ses_event():
 
     # This is a Notification and we need to process it
     if m_type == SnsNotificationType.Notification.value:
+        if app.config.get('SES_EVENT_QUEUE'):
+            queue_ses_event(message.get('Message'))
+            statsd.incr(
+                'email_address.event', tags={'engine': 'aws_ses', 'stage': 'queued'}
+            )
+            return {'status': 'ok', 'message': 'notification_queued'}
         ses_event: SesEvent = SesEvent.from_json(message.get('Message'))
         processor.process(ses_event)
         db.session.commit()
@@ -97,6 +97,6 @@ def geo_autocomplete(
         'status': 'ok',
         'result': [
             g.as_dict(related=False, alternate_titles=False)
-            for g in GeoName.autocomplete(q, lang).limit(limit)
+            for g in GeoName.autocomplete(q, lang, limit)
         ],
     }
@@ -1,11 +1,17 @@
 from __future__ import annotations
 
-from collections import namedtuple
-from typing import Optional, Union
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from itertools import chain
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
-from flask import flash, jsonify, redirect, request, url_for
+from sqlalchemy import event
+from sqlalchemy.orm import Session as DatabaseSession
 
-from baseframe import _, forms, request_is_xhr
+from flask import abort, flash, json, jsonify, redirect, request, url_for
+from flask_babelhg import get_locale
+
+from baseframe import _, cache, forms, request_is_xhr
 from baseframe.forms import Form, render_form
 from coaster.auth import current_auth
 from coaster.views import (
@@ -18,7 +24,7 @@ from coaster.views import (
     route,
 )
 
-from .. import app
+from .. import app, redis_store
 from ..forms import CommentForm, CommentsetSubscribeForm
 from ..models import (
     Comment,
@@ -35,12 +41,65 @@ from ..models import (
 )
 from ..signals import project_role_change, proposal_role_change
 from ..typing import ReturnRenderWith, ReturnView
-from .decorators import etag_cache_for_user, xhr_only
+from .decorators import etag_cache_for_user, etag_cache_invalidate_for_users, xhr_only
+from .helpers import after_session_commit, decode_cursor, encode_cursor
 from .login_session import requires_login
 from .notification import dispatch_notification
 
 ProposalComment = namedtuple('ProposalComment', ['proposal', 'comment'])
 
+#: Seconds for which a comment tree is cached. Trees are invalidated when comments
+#: change, but not when a commenter's name or badges change
+COMMENT_TREE_CACHE_TIMEOUT = 900
+#: Comment URLs available to all readers
+comment_reader_actions = ('view', 'view_json', 'reply', 'report_spam')
+#: Comment URLs available only to the comment's author
+comment_author_actions = ('edit', 'delete')
+
+
+@event.listens_for(DatabaseSession, 'after_flush')
+def _comment_sidebar_invalidate_cache(session, flush_context):
+    """Invalidate the comment sidebar for subscribers of commentsets with changes."""
+    commentset_ids = set()
+    user_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Comment):
+            commentset_ids.add(obj.commentset_id)
+        elif isinstance(obj, CommentsetMembership):
+            user_ids.add(obj.user_id)
+    if commentset_ids:
+        # Use the connection directly as the session cannot autoflush mid-flush
+        user_ids.update(
+            session.connection()
+            .execute(
+                db.select(CommentsetMembership.user_id).where(
+                    CommentsetMembership.commentset_id.in_(commentset_ids),
+                    CommentsetMembership.is_active,
+                )
+            )
+            .scalars()
+        )
+    if user_ids:
+        etag_cache_invalidate_for_users(session, user_ids)
+
+
+@event.listens_for(DatabaseSession, 'after_flush')
+def _comment_tree_track_writes(session, flush_context):
+    """Record commentsets with comments changed in this transaction."""
+    commentset_ids: Set[int] = session.info.setdefault('comment_tree_written', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Comment):
+            commentset_ids.add(obj.commentset_id)
+
+
+@after_session_commit('comment_tree_written')
+def _comment_tree_bump_generations(commentset_ids: Set[int]) -> None:
+    """Increment the generation of comment trees changed in the transaction."""
+    pipe = redis_store.pipeline()
+    for commentset_id in commentset_ids:
+        pipe.incr(comment_tree_generation_key(commentset_id))
+    pipe.execute()
+
 
 @project_role_change.connect
 def update_project_commentset_membership(
@@ -71,14 +130,151 @@ def comment_url(obj):
     return url
 
 
-@Commentset.views('json_comments')
-def commentset_json(obj):
-    toplevel_comments = obj.toplevel_comments.order_by(Comment.created_at.desc())
-    return [
-        comment.current_access(datasets=('json', 'related'))
-        for comment in toplevel_comments
-        if comment.state.PUBLIC or comment.has_replies
+# --- Comment tree ---------------------------------------------------------------------
+
+
+def comment_tree_generation_key(commentset_id: int) -> str:
+    """Return the Redis key for the generation of a commentset's comment tree."""
+    return f'comment_tree/generation/{commentset_id}'
+
+
+def comment_tree_cache_key(commentset_id: int) -> str:
+    """Return the cache key for the current generation of a comment tree."""
+    generation = redis_store.get(comment_tree_generation_key(commentset_id)) or '0'
+    return f'comment_tree/v2/{commentset_id}/{generation}/{get_locale()}'
+
+
+def comment_tree_node(
+    comment: Comment, replies: Dict[Optional[int], List[Comment]]
+) -> Dict[str, Any]:
+    """
+    Return role-independent data for a comment and its public replies.
+
+    Keys starting with an underscore are used by :func:`comment_tree_for_viewer` and
+    are not sent to the viewer.
+    """
+    proxy = comment.access_for(roles={'all', 'reader'}, datasets=('json', 'related'))
+    data = {
+        key: proxy[key]
+        for key in proxy
+        if key not in ('urls', 'current_access_replies')
+    }
+    data['urls'] = {
+        action: comment.url_for(action, _external=True)
+        for action in comment_reader_actions
+    }
+    data['current_access_replies'] = [
+        comment_tree_node(reply, replies)
+        for reply in replies[comment.id]
+        if reply.state.PUBLIC
     ]
+    data['_created_at'] = comment.created_at.isoformat()
+    data['_author_id'] = comment.user_id
+    data['_author_urls'] = (
+        {
+            action: comment.url_for(action, _external=True)
+            for action in comment_author_actions
+        }
+        if comment.user_id is not None
+        else {}
+    )
+    return data
+
+
+def comment_tree(commentset: Commentset) -> List[Dict[str, Any]]:
+    """
+    Return the role-independent tree of a commentset's comments, from cache if possible.
+
+    All comments in the commentset are loaded in a single query. The tree is cached
+    until a comment in the commentset is posted, edited, deleted or marked as spam.
+    """
+    cache_key = comment_tree_cache_key(commentset.id)
+    tree = cache.get(cache_key)
+    if tree is None:
+        replies: Dict[Optional[int], List[Comment]] = defaultdict(list)
+        for comment in commentset.comments.order_by(Comment.id):
+            replies[comment.in_reply_to_id].append(comment)
+        toplevel_comments = sorted(
+            replies[None],
+            key=lambda comment: (comment.created_at, comment.uuid_b58),
+            reverse=True,
+        )
+        # Convert to JSON types, as the proxies can't be cached
+        tree = json.loads(
+            json.dumps(
+                [
+                    comment_tree_node(comment, replies)
+                    for comment in toplevel_comments
+                    if comment.state.PUBLIC or replies[comment.id]
+                ]
+            )
+        )
+        cache.set(cache_key, tree, timeout=COMMENT_TREE_CACHE_TIMEOUT)
+    return tree
+
+
+def comment_tree_for_viewer(
+    nodes: List[Dict[str, Any]], user_id: Optional[int]
+) -> List[Dict[str, Any]]:
+    """Add fields that depend on the viewer to nodes from :func:`comment_tree`."""
+    result = []
+    for node in nodes:
+        data = {key: value for key, value in node.items() if key[0] != '_'}
+        if user_id is not None and node['_author_id'] == user_id:
+            data['urls'] = {**node['urls'], **node['_author_urls']}
+        data['current_access_replies'] = comment_tree_for_viewer(
+            node['current_access_replies'], user_id
+        )
+        result.append(data)
+    return result
+
+
+def comment_thread_position(node: Dict[str, Any]) -> Tuple[datetime, str]:
+    """Return the sort position of a top-level node from :func:`comment_tree`."""
+    return datetime.fromisoformat(node['_created_at']), node['uuid_b58']
+
+
+def comment_tree_page(
+    nodes: List[Dict[str, Any]], cursor: Optional[str], limit: Optional[int]
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Return top-level nodes after a cursor, and a cursor for the next page if any.
+
+    Cursors encode the creation timestamp and `uuid_b58` of the last thread in a page,
+    so a page can be resumed even if that thread has since been removed.
+    """
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        if not (
+            len(position) == 2
+            and isinstance(position[0], datetime)
+            and isinstance(position[1], str)
+        ):
+            abort(400)
+        nodes = [
+            node for node in nodes if comment_thread_position(node) < tuple(position)
+        ]
+    next_cursor = None
+    if limit is not None and len(nodes) > limit:
+        nodes = nodes[:limit]
+        next_cursor = encode_cursor(comment_thread_position(nodes[-1]))
+    return nodes, next_cursor
+
+
+@Commentset.views('json_comments')
+def commentset_json(
+    obj: Commentset, cursor: Optional[str] = None, limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Return top-level comment threads and their replies for the current user.
+
+    :param cursor: Return threads after the position in this cursor, as returned by
+        :func:`comment_tree_page`
+    :param limit: Return at most this many threads
+    """
+    nodes, _next_cursor = comment_tree_page(comment_tree(obj), cursor, limit)
+    user = current_auth.user
+    return comment_tree_for_viewer(nodes, user.id if user else None)
 
 
 @Commentset.views('url')
@@ -158,11 +354,28 @@ class CommentsetView(UrlForView, ModelView):
         return Commentset.query.filter(Commentset.uuid_b58 == commentset).one_or_404()
 
     @route('', methods=['GET'])
-    def view(self):
+    @requestargs('cursor', ('limit', int))
+    def view(self, cursor: Optional[str] = None, limit: Optional[int] = None):
         subscribed = bool(self.obj.current_roles.document_subscriber)
         if request_is_xhr():
+            if limit is None:
+                return jsonify(
+                    {
+                        'subscribed': subscribed,
+                        'comments': self.obj.views.json_comments(cursor=cursor),
+                    }
+                )
+            nodes, next_cursor = comment_tree_page(
+                comment_tree(self.obj), cursor, min(max(limit, 1), 100)
+            )
+            user = current_auth.user
+            comments = comment_tree_for_viewer(nodes, user.id if user else None)
             return jsonify(
-                {'subscribed': subscribed, 'comments': self.obj.views.json_comments()}
+                {
+                    'subscribed': subscribed,
+                    'comments': comments,
+                    'next_cursor': next_cursor,
+                }
             )
         return redirect(self.obj.views.url(), code=303)
 
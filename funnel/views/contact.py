@@ -1,20 +1,11 @@
 from __future__ import annotations
 
 from datetime import datetime, timedelta
-from io import StringIO
 from typing import Dict, Optional
-import csv
 
 from sqlalchemy.exc import IntegrityError
 
-from flask import (
-    Response,
-    current_app,
-    jsonify,
-    make_response,
-    render_template,
-    request,
-)
+from flask import current_app, jsonify, make_response, render_template, request
 
 from baseframe import _
 from coaster.auth import current_auth
@@ -24,6 +15,7 @@ from coaster.views import ClassView, render_with, requestargs, route
 from .. import app
 from ..models import ContactExchange, Project, TicketParticipant, db
 from ..utils import abort_null, format_twitter_handle
+from .helpers import csv_response
 from .login_session import requires_login
 
 
@@ -62,25 +54,16 @@ class ContactView(ClassView):
 
     def contacts_to_csv(self, contacts, timezone, filename):
         """Return a CSV of given contacts."""
-        outfile = StringIO(newline='')
-        out = csv.writer(outfile)
-        out.writerow(
-            [
-                'scanned_at',
-                'fullname',
-                'email',
-                'phone',
-                'twitter',
-                'job_title',
-                'company',
-                'city',
-            ]
-        )
-        for contact in contacts:
-            proxy = contact.current_access()
-            ticket_participant = proxy.ticket_participant
-            out.writerow(
-                [
+
+        def rows():
+            for contact in contacts.options(
+                db.contains_eager(ContactExchange.ticket_participant).joinedload(
+                    TicketParticipant.email_address
+                )
+            ).yield_per(1000):
+                proxy = contact.current_access()
+                ticket_participant = proxy.ticket_participant
+                yield [
                     proxy.scanned_at.astimezone(timezone)
                     .replace(second=0, microsecond=0, tzinfo=None)
                     .isoformat(),  # Strip precision from timestamp
@@ -92,18 +75,20 @@ class ContactView(ClassView):
                     ticket_participant.company,
                     ticket_participant.city,
                 ]
-            )
 
-        outfile.seek(0)
-        return Response(
-            outfile.getvalue(),
-            content_type='text/csv',
-            headers=[
-                (
-                    'Content-Disposition',
-                    f'attachment;filename="{filename}.csv"',
-                )
+        return csv_response(
+            [
+                'scanned_at',
+                'fullname',
+                'email',
+                'phone',
+                'twitter',
+                'job_title',
+                'company',
+                'city',
             ],
+            rows(),
+            filename=filename,
         )
 
     @route('<uuid_b58>/<datestr>.csv', endpoint='contacts_project_date_csv')
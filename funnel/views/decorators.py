@@ -3,15 +3,18 @@ from __future__ import annotations
 from datetime import datetime, timedelta
 from functools import wraps
 from hashlib import blake2b
-from typing import Any, Callable, Optional, Set, TypeVar, Union, cast
+from typing import Any, Callable, Iterable, Optional, Set, TypeVar, Union, cast
+
+from sqlalchemy.orm import Session as DatabaseSession
 
 from flask import Response, make_response, redirect, request, url_for
 
-from baseframe import cache, request_is_xhr
+from baseframe import cache, request_is_xhr, statsd
 from coaster.auth import current_auth
 
+from .. import redis_store
 from ..typing import ReturnView
-from .helpers import compress_response
+from .helpers import after_session_commit, compress_response
 
 # https://mypy.readthedocs.io/en/stable/generics.html#declaring-decorators
 F = TypeVar('F', bound=Callable[..., Any])
@@ -48,24 +51,65 @@ def xhr_only(redirect_to: Union[str, Callable[[], str], None] = None):
     return decorator
 
 
+#: Seconds for which one request may revalidate a stale response while other requests
+#: continue to receive the stale response
+ETAG_CACHE_REVALIDATE_TIMEOUT = 30
+
+
+def etag_cache_generation_key(user_id: int) -> str:
+    """Return the Redis key for the generation of a user's cached responses."""
+    return f'etag_cache/generation/{user_id}'
+
+
+def etag_cache_invalidate_for_users(
+    session: DatabaseSession, user_ids: Iterable[int]
+) -> None:
+    """
+    Invalidate cached responses for users when the current transaction is committed.
+
+    This is meant to be called from SQLAlchemy session event listeners that track
+    changes to data rendered in views using :func:`etag_cache_for_user`.
+    """
+    session.info.setdefault('etag_cache_invalidate', set()).update(user_ids)
+
+
+@after_session_commit('etag_cache_invalidate')
+def _etag_cache_bump_generations(user_ids: Set[int]) -> None:
+    """Increment the cache generation for users whose data was changed."""
+    pipe = redis_store.pipeline()
+    for user_id in user_ids:
+        pipe.incr(etag_cache_generation_key(user_id))
+    pipe.execute()
+
+
 def etag_cache_for_user(
     identifier: str,
     view_version: int,
     timeout: int,
     max_age: Optional[int] = None,
     query_params: Optional[Set] = None,
+    stale_timeout: Optional[int] = None,
 ):
     """
     Cache and compress a response, and add an ETag header for browser cache.
 
+    Cached responses are discarded when the user's cache generation changes (see
+    :func:`etag_cache_invalidate_for_users`). A response older than `timeout` is stale.
+    The first request to find a stale response will render a new one, while other
+    requests receive the stale response in the meantime.
+
     :param identifier: Distinct name for this view (typically same as endpoint name)
     :param view_version: A version number for this view. Increment when templates change
     :param timeout: Maximum age for server cache in seconds
     :param max_age: Maximum age for client cache in seconds, defaults to same as timeout
     :param query_params: Request query parameters that influence response
+    :param stale_timeout: Seconds after `timeout` for which a stale response may be
+        served while it is revalidated, defaults to same as timeout
     """
     if max_age is None:
         max_age = timeout
+    if stale_timeout is None:
+        stale_timeout = timeout
 
     def decorator(f: F) -> F:
         @wraps(f)
@@ -74,7 +118,12 @@ def etag_cache_for_user(
             if request.method not in ('GET', 'HEAD'):
                 return f(*args, **kwargs)
 
-            cache_key = f'{identifier}/{view_version}/{current_auth.user.uuid_b64}'
+            generation = (
+                redis_store.get(etag_cache_generation_key(current_auth.user.id)) or '0'
+            )
+            cache_key = (
+                f'{identifier}/{view_version}/{current_auth.user.uuid_b64}/{generation}'
+            )
 
             # 1. Create a hash representing the state of the request, to ensure we're
             # sending a response appropriate for this request
@@ -120,12 +169,26 @@ def etag_cache_for_user(
                     last_modified = rhash_data['last_modified']
                     status_code = rhash_data['status_code']
                     content_type = rhash_data['content_type']
+                    fresh_until = rhash_data['fresh_until']
                 except KeyError:
                     # If any of the required cache keys are missing, discard the cache
                     response_data = None
             else:
                 cache_data = {}
 
+            revalidate_key = f'{cache_key}/{rhash}/revalidate'
+            if response_data is None:
+                cache_result = 'miss'
+            elif fresh_until > datetime.utcnow():
+                cache_result = 'hit'
+            elif cache.add(revalidate_key, True, timeout=ETAG_CACHE_REVALIDATE_TIMEOUT):
+                # The response is stale and no other request is revalidating it
+                cache_result = 'revalidate'
+                response_data = None
+            else:
+                cache_result = 'stale'
+            statsd.incr('etag_cache', tags={'view': identifier, 'result': cache_result})
+
             if response_data is not None:
                 # 3a. If the cache had valid data (not expired, not malformed), use it
                 # for a response.
@@ -154,17 +217,20 @@ def etag_cache_for_user(
                 cache_data[rhash] = {
                     'response_data': response_data,
                     'content_encoding': content_encoding,
-                    'cash': chash,
+                    'chash': chash,
                     'etag': etag,
                     'last_modified': last_modified,
                     'status_code': response.status_code,
                     'content_type': response.content_type,
+                    'fresh_until': last_modified + timedelta(seconds=timeout),
                 }
                 cache.set(
                     cache_key,
                     cache_data,
-                    timeout=timeout,
+                    timeout=timeout + stale_timeout,
                 )
+                if cache_result == 'revalidate':
+                    cache.delete(revalidate_key)
             response.set_etag(etag)
             response.last_modified = last_modified
             response.cache_control.max_age = max_age
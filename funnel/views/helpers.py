@@ -1,14 +1,23 @@
 from __future__ import annotations
 
-from base64 import urlsafe_b64encode
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timedelta
 from hashlib import blake2b
+from io import StringIO
 from os import urandom
-from typing import Any, Callable, Dict, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from urllib.parse import unquote, urljoin, urlsplit
+from uuid import UUID
+import binascii
+import csv
 import gzip
+import json
 import zlib
 
+from sqlalchemy import event
+from sqlalchemy.orm import Session as DatabaseSession
+from sqlalchemy.sql.elements import ColumnElement
+
 from flask import (
     Flask,
     Response,
@@ -19,6 +28,7 @@ from flask import (
     render_template,
     request,
     session,
+    stream_with_context,
     url_for,
 )
 from werkzeug.routing import BuildError
@@ -32,6 +42,7 @@ from pytz import utc
 import brotli
 
 from baseframe import cache, statsd
+from coaster.sqlalchemy import Query
 from coaster.utils import utcnow
 
 from .. import app, built_assets, shortlinkapp
@@ -389,6 +400,114 @@ def decompress(data: bytes, algorithm: str) -> bytes:
     raise ValueError("Unknown compression algorithm")
 
 
+def _cursor_default(value: Any) -> Dict[str, str]:
+    """Encode datetime and UUID values for JSON in :func:`encode_cursor`."""
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, UUID):
+        return {'$uuid': value.hex}
+    raise TypeError(f"Unsupported type in cursor: {type(value)!r}")
+
+
+def _cursor_object_hook(obj: Dict[str, str]) -> Any:
+    """Decode datetime and UUID values from JSON in :func:`decode_cursor`."""
+    if obj.keys() == {'$dt'}:
+        return datetime.fromisoformat(obj['$dt'])
+    if obj.keys() == {'$uuid'}:
+        return UUID(obj['$uuid'])
+    return obj
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode a sequence of keyset values into an opaque continuation token."""
+    return (
+        urlsafe_b64encode(
+            json.dumps(
+                list(values), default=_cursor_default, separators=(',', ':')
+            ).encode()
+        )
+        .decode()
+        .rstrip('=')
+    )
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Decode a continuation token made by :func:`encode_cursor`, or abort with 400."""
+    try:
+        values = json.loads(
+            urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)),
+            object_hook=_cursor_object_hook,
+        )
+    except (binascii.Error, ValueError):  # JSONDecodeError is a ValueError
+        abort(400)
+    if not isinstance(values, list):
+        abort(400)
+    return values
+
+
+def _cursor_value_matches(column: ColumnElement, value: Any) -> bool:
+    """Check if a value decoded from a cursor has the Python type of its column."""
+    python_type: Union[type, Tuple[type, ...]]
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        # Expressions of unknown type can only be compared with plain JSON values
+        python_type = (str, int, float)
+    else:
+        if python_type is float:
+            # JSON does not distinguish integral floats from integers
+            python_type = (int, float)
+    # JSON booleans are ints in Python, but no keyset column is boolean
+    return not isinstance(value, bool) and isinstance(value, python_type)
+
+
+def keyset_paginate(
+    query: Query,
+    columns: Sequence[ColumnElement],
+    key: Callable[[Any], Sequence[Any]],
+    cursor: str = '',
+    per_page: int = 20,
+    max_per_page: int = 100,
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Paginate a query by seeking past a cursor, without using offset or a total count.
+
+    The query is re-ordered in descending order of the given columns, which must
+    together be unique for every row. Returns a page of items and a cursor for the next
+    page, or `None` if this is the last page.
+
+    :param query: Query to paginate
+    :param columns: Columns to order and seek on
+    :param key: Callable that returns values for ``columns`` from a row in the query
+    :param cursor: Continuation token from a previous call, or blank for the first page
+    :param per_page: Number of items per page
+    :param max_per_page: Upper limit for ``per_page``
+    """
+    per_page = min(per_page, max_per_page)
+    if per_page < 1:
+        abort(404)
+    query = query.order_by(None).order_by(*(column.desc() for column in columns))
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(columns) or not all(
+            _cursor_value_matches(column, value)
+            for column, value in zip(columns, values)
+        ):
+            abort(400)
+        # Bind values with the column's type so that float4 ranks compare correctly
+        query = query.filter(
+            db.tuple_(*columns)
+            < db.tuple_(
+                *(db.cast(value, column.type) for column, value in zip(columns, values))
+            )
+        )
+    # Load an extra item to find out if there is a next page
+    items = query.limit(per_page + 1).all()
+    if len(items) > per_page:
+        return items[:per_page], encode_cursor(key(items[per_page - 1]))
+    return items, None
+
+
 def compress_response(response: ResponseBase) -> None:
     """
     Conditionally compress a response based on request parameters.
@@ -418,6 +537,75 @@ def compress_response(response: ResponseBase) -> None:
             response.vary.add('Accept-Encoding')  # type: ignore[union-attr]
 
 
+def csv_response(
+    header: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    filename: str,
+    chunk_size: int = 1000,
+) -> Response:
+    """
+    Return rows as a CSV file download, streamed as the rows are read.
+
+    `rows` should be a generator over a query using
+    :meth:`~sqlalchemy.orm.Query.yield_per`, so that neither the rows nor the CSV
+    are held in memory in full. The request context is kept for the generator.
+
+    :param header: Column names for the first row
+    :param rows: Iterable of rows
+    :param filename: Name of the file, without the `.csv` extension
+    :param chunk_size: Number of rows to send in each chunk of the response
+    """
+
+    def generate():
+        outfile = StringIO(newline='')
+        out = csv.writer(outfile)
+        out.writerow(header)
+        for count, row in enumerate(rows, 1):
+            out.writerow(row)
+            if count % chunk_size == 0:
+                yield outfile.getvalue()
+                outfile.seek(0)
+                outfile.truncate()
+        yield outfile.getvalue()
+
+    return Response(
+        stream_with_context(generate()),
+        content_type='text/csv',
+        headers=[('Content-Disposition', f'attachment;filename="{filename}.csv"')],
+    )
+
+
+def after_session_commit(key: str) -> Callable[[Callable[[Any], None]], Callable]:
+    """
+    Call the decorated function with ``session.info[key]`` once the session commits.
+
+    Session event listeners record changes in ``session.info[key]`` as they are
+    flushed, and the decorated function applies them (usually to Redis) only after
+    the outermost transaction is committed. The record is discarded if the transaction
+    is rolled back. Releasing a savepoint also fires ``after_commit``, and rolling one
+    back fires ``after_rollback``, so both are ignored for nested transactions: the
+    changes are not final until the outer transaction ends.
+    """
+
+    def decorator(func: Callable[[Any], None]) -> Callable[[Any], None]:
+        @event.listens_for(DatabaseSession, 'after_commit')
+        def apply(session: DatabaseSession) -> None:
+            if session.in_nested_transaction():
+                return
+            value = session.info.pop(key, None)
+            if value:
+                func(value)
+
+        @event.listens_for(DatabaseSession, 'after_rollback')
+        def discard(session: DatabaseSession) -> None:
+            if not session.in_nested_transaction():
+                session.info.pop(key, None)
+
+        return func
+
+    return decorator
+
+
 # --- Template helpers -----------------------------------------------------------------
 
 
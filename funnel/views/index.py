@@ -12,7 +12,12 @@ from coaster.views import ClassView, render_with, requestargs, route
 
 from .. import app, pages
 from ..forms import SavedProjectForm
-from ..models import Project, db
+from ..models import Project
+from .project_listing import (
+    cached_project_listing,
+    project_listing_cacheable,
+    site_project_listing,
+)
 
 
 class PolicyPage(NamedTuple):
@@ -39,76 +44,9 @@ class IndexView(ClassView):
     @render_with('index.html.jinja2')
     def home(self):
         g.profile = None
-        projects = Project.all_unsorted()
-        # TODO: Move these queries into the Project class
-        all_projects = (
-            projects.filter(
-                Project.state.PUBLISHED,
-                db.or_(
-                    Project.state.LIVE,
-                    Project.state.UPCOMING,
-                    db.and_(
-                        Project.start_at.is_(None),
-                        Project.published_at.isnot(None),
-                        Project.site_featured.is_(True),
-                    ),
-                ),
-            )
-            .order_by(Project.next_session_at.asc())
-            .all()
-        )
-        upcoming_projects = all_projects[:3]
-        all_projects = all_projects[3:]
-        featured_project = (
-            projects.filter(
-                Project.state.PUBLISHED,
-                db.or_(
-                    Project.state.LIVE,
-                    Project.state.UPCOMING,
-                    db.and_(
-                        Project.start_at.is_(None), Project.published_at.isnot(None)
-                    ),
-                ),
-                Project.site_featured.is_(True),
-            )
-            .order_by(Project.next_session_at.asc())
-            .limit(1)
-            .first()
-        )
-        if featured_project in upcoming_projects:
-            # if featured project is in upcoming projects, remove it from there and
-            # pick one upcoming project from from all projects, only if
-            # there are any projects left in it
-            upcoming_projects.remove(featured_project)
-            if all_projects:
-                upcoming_projects.append(all_projects.pop(0))
-        open_cfp_projects = (
-            projects.filter(Project.state.PUBLISHED, Project.cfp_state.OPEN)
-            .order_by(Project.next_session_at.asc())
-            .all()
-        )
-
-        return {
-            'all_projects': [
-                p.access_for(roles={'all'}, datasets=('primary', 'related'))
-                for p in all_projects
-            ],
-            'upcoming_projects': [
-                p.access_for(roles={'all'}, datasets=('primary', 'related'))
-                for p in upcoming_projects
-            ],
-            'open_cfp_projects': [
-                p.access_for(roles={'all'}, datasets=('primary', 'related'))
-                for p in open_cfp_projects
-            ],
-            'featured_project': (
-                featured_project.access_for(
-                    roles={'all'}, datasets=('primary', 'related')
-                )
-                if featured_project
-                else None
-            ),
-        }
+        if project_listing_cacheable():
+            return cached_project_listing(featured_heading=False)
+        return site_project_listing()
 
 
 IndexView.init_app(app)
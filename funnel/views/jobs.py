@@ -22,12 +22,12 @@ def import_tickets(ticket_client_id):
                 ticket_list = ExplaraAPI(
                     access_token=ticket_client.client_access_token
                 ).get_tickets(ticket_client.client_eventid)
-                ticket_client.import_from_list(ticket_list)
+                ticket_client.import_from_list(ticket_list, commit=True)
             elif ticket_client.name.lower() == 'boxoffice':
                 ticket_list = Boxoffice(
                     access_token=ticket_client.client_access_token
                 ).get_tickets(ticket_client.client_eventid)
-                ticket_client.import_from_list(ticket_list)
+                ticket_client.import_from_list(ticket_list, commit=True)
             db.session.commit()
 
 
@@ -10,7 +10,7 @@ from coaster.views import ModelView, UrlForView, render_with, requires_roles, ro
 
 from .. import app
 from ..forms import LabelForm, LabelOptionForm
-from ..models import Label, Profile, Project, db
+from ..models import Label, Profile, Project, ProjectLabelIndex, db
 from ..typing import ReturnView
 from ..utils import abort_null
 from .login_session import requires_login, requires_sudo
@@ -34,6 +34,8 @@ class ProjectLabelView(ProjectViewMixin, UrlForView, ModelView):
                     lbl.seq = idx
                     db.session.commit()
             flash(_("Your changes have been saved"), category='success')
+        # Load options for all labels at once
+        ProjectLabelIndex.for_project(self.obj)
         return {'project': self.obj, 'labels': self.obj.labels, 'form': form}
 
     @route('new', methods=['GET', 'POST'])
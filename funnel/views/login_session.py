@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 from functools import wraps
 from typing import Optional, Type
+import json
 
 from flask import (
     Response,
@@ -26,7 +27,7 @@ from coaster.auth import add_auth_attribute, current_auth, request_has_auth
 from coaster.utils import utcnow
 from coaster.views import get_current_url, get_next_url
 
-from .. import app
+from .. import app, redis_store
 from ..forms import PasswordForm
 from ..models import (
     AuthClient,
@@ -50,6 +51,12 @@ user_session_validity_period_total_seconds = int(
     user_session_validity_period.total_seconds()
 )
 
+#: Redis hash of user session accesses awaiting a write to the database, when
+#: ``USER_SESSION_WRITE_BEHIND`` is enabled. Field is the session id
+user_session_access_key = 'user_session/accessed'
+#: Redis hash that :func:`flush_user_session_access` is writing from
+user_session_access_flush_key = 'user_session/accessed/flushing'
+
 
 class LoginManager:
     """Compatibility login manager that resembles Flask-Lastuser."""
@@ -186,17 +193,19 @@ def session_mark_accessed(
     auth_client: Optional[AuthClient] = None,
     ipaddr: Optional[str] = None,
     user_agent: Optional[str] = None,
+    accessed_at: Optional[datetime] = None,
 ):
     """
     Mark a session as currently active.
 
     :param auth_client: For API calls from clients, save the client instead of IP
         address and User-Agent
+    :param accessed_at: Timestamp of access, if not now (for recorded accesses)
     """
     # `accessed_at` will be different from the automatic `updated_at` in one
     # crucial context: when the session was revoked from a different session.
     # `accessed_at` won't be updated at that time.
-    obj.accessed_at = db.func.utcnow()
+    obj.accessed_at = db.func.utcnow() if accessed_at is None else accessed_at
     with db.session.no_autoflush:
         if auth_client is not None:
             if (
@@ -254,6 +263,62 @@ def session_mark_accessed(
     statsd.set('users.active_users', obj.user.id, rate=1)
 
 
+def record_user_session_access(
+    user_session: UserSession, ipaddr: str, user_agent: str
+) -> None:
+    """
+    Record a user session access in Redis, for :func:`flush_user_session_access`.
+
+    Repeated accesses from the same session replace the previous record, so they are
+    written to the database as a single update.
+    """
+    redis_store.hset(
+        user_session_access_key,
+        str(user_session.id),
+        json.dumps(
+            {
+                'accessed_at': utcnow().isoformat(),
+                'ipaddr': ipaddr,
+                'user_agent': user_agent,
+            }
+        ),
+    )
+
+
+def flush_user_session_access(batch_size: int = 1000) -> int:
+    """
+    Write user session accesses recorded in Redis to the database.
+
+    Recorded accesses are moved to a separate key before they are written, so that
+    accesses recorded during the flush are left for the next flush. If a previous
+    flush did not complete, its remaining records are written first. Returns the number
+    of sessions updated.
+    """
+    if not redis_store.exists(user_session_access_flush_key):
+        if not redis_store.exists(user_session_access_key):
+            return 0
+        redis_store.rename(user_session_access_key, user_session_access_flush_key)
+    records = redis_store.hgetall(user_session_access_flush_key)
+    session_ids = list(records)
+    count = 0
+    for offset in range(0, len(session_ids), batch_size):
+        batch = session_ids[offset : offset + batch_size]
+        for user_session in UserSession.query.filter(
+            UserSession.id.in_([int(session_id) for session_id in batch])
+        ).options(db.joinedload(UserSession.user)):
+            record = json.loads(records[str(user_session.id)])
+            user_session.views.mark_accessed(
+                ipaddr=record['ipaddr'],
+                user_agent=record['user_agent'],
+                accessed_at=datetime.fromisoformat(record['accessed_at']),
+            )
+            count += 1
+        db.session.commit()
+        redis_store.hdel(user_session_access_flush_key, *batch)
+    redis_store.delete(user_session_access_flush_key)
+    return count
+
+
 # Also add future hasjob app here
 @app.after_request
 def clear_old_session(response):
@@ -322,6 +387,12 @@ def update_user_session_timestamp(response):
         ipaddr = request.remote_addr
         user_agent = str(request.user_agent.string[:250])
 
+        if app.config.get('USER_SESSION_WRITE_BEHIND'):
+            # Record in Redis instead of the database. This will be written by
+            # `flask periodic user_session_access`
+            record_user_session_access(user_session, ipaddr or '', user_agent)
+            return response
+
         @response.call_on_close
         def mark_session_accessed_after_response():
             # App context is needed for the call to statsd in mark_accessed()
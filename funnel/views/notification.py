@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 from collections import defaultdict
+from contextlib import nullcontext
 from datetime import datetime
 from email.utils import formataddr
 from functools import wraps
 from itertools import filterfalse, zip_longest
-from typing import Dict
+from typing import Callable, ContextManager, Dict
 from uuid import uuid4
 
 from flask import url_for
@@ -16,7 +17,7 @@ from baseframe import __, statsd
 from coaster.auth import current_auth
 
 from .. import app, rq
-from ..models import Notification, UserNotification, db
+from ..models import Notification, NotificationTransportResolver, UserNotification, db
 from ..serializers import token_serializer
 from ..transports import TransportError, email, platform_transports, sms
 from ..transports.sms import SmsTemplate
@@ -310,11 +311,11 @@ class RenderNotification:
 #    receives Notification instances that already have document and fragment set on
 #    them, and updates them to have a common eventid and user_id, then queues
 #    a background job, taking care to preserve the priority order.
-# 2. The first background worker loads these notifications in turn, extracts
-#    UserNotification instances into batches of DISPATCH_BATCH_SIZE, and then passes
-#    them into yet another background worker.
-# 3. Second background worker performs a roll-up on each UserNotification, then queues
-#    a background job for each eligible transport.
+# 2. The first background worker loads these notifications in turn, creates
+#    UserNotification rows in bulk, and then passes them in batches sized by
+#    :func:`dispatch_batch_size` into yet another background worker.
+# 3. Second background worker performs a roll-up on the batch of UserNotifications,
+#    then queues a background job for each eligible transport.
 # 4. Third set of per-transport background workers deliver one message each.
 
 
@@ -362,39 +363,65 @@ def dispatch_notification(*notifications):
 # --- Transports -----------------------------------------------------------------------
 
 
-def transport_worker_wrapper(func):
-    @wraps(func)
-    def inner(user_notification_ids):
-        with app.app_context():
-            queue = [
-                UserNotification.query.get(identity)
-                for identity in user_notification_ids
-            ]
+def transport_worker_wrapper(
+    batch_context: Callable[[], ContextManager] = nullcontext
+) -> Callable[[Callable], Callable]:
+    """
+    Wrap a transport worker to process a batch of user notifications.
+
+    The worker is called with the user notification, its render view, the batch
+    context returned by ``batch_context`` (None by default), which transports can use to
+    share resources like a connection across the batch, and a
+    :class:`NotificationTransportResolver` with preferences and addresses of all
+    recipients in the batch.
+    """
+
+    def decorator(func):
+        def process(queue, batch, resolver):
             for user_notification in queue:
-                # The notification may be revoked by the time this worker processes it.
-                # If so, skip it.
-                if not user_notification.is_revoked:
-                    with force_locale(user_notification.user.locale or 'en'):
+                # The notification may be revoked by the time this worker processes
+                # it. If so, skip it.
+                if user_notification.is_revoked:
+                    continue
+                try:
+                    # Each message gets a savepoint instead of a commit, as a commit
+                    # expires everything the resolver loaded for the batch. If the
+                    # message fails, only its changes are rolled back
+                    with db.session.begin_nested(), force_locale(
+                        user_notification.user.locale or 'en'
+                    ):
                         view = Notification.renderers[
                             user_notification.notification.type
                         ](user_notification)
-                        try:
-                            func(user_notification, view)
-                            db.session.commit()
-                        except TransportError:
-                            if user_notification.notification.ignore_transport_errors:
-                                pass
-                            else:
-                                # TODO: Implement transport error handling code here
-                                raise
-
-    return inner
+                        func(user_notification, view, batch, resolver)
+                except TransportError:
+                    notification = user_notification.notification
+                    if not notification.ignore_transport_errors:
+                        # TODO: Implement transport error handling code
+                        raise
+
+        @wraps(func)
+        def inner(user_notification_ids):
+            with app.app_context():
+                queue = UserNotification.get_batch(user_notification_ids)
+                resolver = NotificationTransportResolver.for_user_notifications(queue)
+                try:
+                    with batch_context() as batch:
+                        process(queue, batch, resolver)
+                finally:
+                    # Commit once for the batch, including delivery status recorded by
+                    # the batch when it is closed, even if a notification failed
+                    db.session.commit()
+
+        return inner
+
+    return decorator
 
 
 @rq.job('funnel')
-@transport_worker_wrapper
-def dispatch_transport_email(user_notification, view):
-    if not user_notification.user.main_notification_preferences.by_transport('email'):
+@transport_worker_wrapper(email.EmailBatch)
+def dispatch_transport_email(user_notification, view, batch, resolver):
+    if not resolver.main_preferences(user_notification.user).by_transport('email'):
         # Cancel delivery if user's main switch is off. This was already checked, but
         # the worker may be delayed and the user may have changed their preference.
         user_notification.messageid_email = 'cancelled'
@@ -403,7 +430,7 @@ def dispatch_transport_email(user_notification, view):
     subject = view.email_subject()
     content = view.email_content()
     attachments = view.email_attachments()
-    user_notification.messageid_email = email.send_email(
+    user_notification.messageid_email = batch.send(
         subject=subject,
         to=[(user_notification.user.fullname, str(address))],
         content=content,
@@ -424,6 +451,8 @@ def dispatch_transport_email(user_notification, view):
             'List-Unsubscribe-Post': 'One-Click',
             'List-Archive': f'<{url_for("notifications")}>',
         },
+        # Only the unsubscribe link varies between recipients of the same content
+        substitutions=[view.unsubscribe_url_email],
     )
     statsd.incr(
         'notification.transport',
@@ -435,14 +464,14 @@ def dispatch_transport_email(user_notification, view):
 
 
 @rq.job('funnel')
-@transport_worker_wrapper
-def dispatch_transport_sms(user_notification, view):
-    if not user_notification.user.main_notification_preferences.by_transport('sms'):
+@transport_worker_wrapper(sms.SmsBatch)
+def dispatch_transport_sms(user_notification, view, batch, resolver):
+    if not resolver.main_preferences(user_notification.user).by_transport('sms'):
         # Cancel delivery if user's main switch is off. This was already checked, but
         # the worker may be delayed and the user may have changed their preference.
         user_notification.messageid_sms = 'cancelled'
         return
-    user_notification.messageid_sms = sms.send(
+    user_notification.messageid_sms = batch.send(
         str(view.transport_for('sms')), view.sms_with_unsubscribe()
     )
     statsd.incr(
@@ -459,8 +488,23 @@ transport_workers = {'email': dispatch_transport_email, 'sms': dispatch_transpor
 
 # --- Notification background workers --------------------------------------------------
 
+#: Batch size for notification types that override :meth:`Notification.dispatch`
 DISPATCH_BATCH_SIZE = 10
 
+#: Approximate work budget for each :func:`dispatch_user_notifications_job`, counted
+#: in database round trips. Batch sizes are derived from the cost per recipient
+DISPATCH_BATCH_WORK = 200
+
+
+def dispatch_batch_size(notification: Notification) -> int:
+    """Return a recipient batch size based on the work needed per recipient."""
+    # One lookup for preferences and one check per transport, plus two queries for
+    # rollup in notifications that have fragments
+    cost = 1 + len(transport_workers)
+    if notification.fragment_model:
+        cost += 2
+    return max(1, DISPATCH_BATCH_WORK // cost)
+
 
 @rq.job('funnel')
 def dispatch_notification_job(eventid, notification_ids):
@@ -469,60 +513,81 @@ def dispatch_notification_job(eventid, notification_ids):
             Notification.query.get((eventid, nid)) for nid in notification_ids
         ]
 
-        # Dispatch, creating batches of DISPATCH_BATCH_SIZE each
         for notification in notifications:
-            for batch in (
-                filterfalse(lambda x: x is None, unfiltered_batch)
-                for unfiltered_batch in zip_longest(
-                    *[notification.dispatch()] * DISPATCH_BATCH_SIZE, fillvalue=None
-                )
-            ):
-                db.session.commit()
-                notification_ids = [
-                    user_notification.identity for user_notification in batch
+            if type(notification).dispatch is not Notification.dispatch:
+                # This notification type has custom dispatch logic, so we can't use
+                # the bulk dispatcher
+                dispatch_notification_iter(notification)
+                continue
+
+            # Insert all UserNotification rows, one SQL statement per role, then
+            # commit once and hand out the recipients in batches
+            recipient_ids = notification.dispatch_bulk()
+            db.session.commit()
+            batch_size = dispatch_batch_size(notification)
+            for offset in range(0, len(recipient_ids), batch_size):
+                batch = [
+                    (user_id, notification.eventid)
+                    for user_id in recipient_ids[offset : offset + batch_size]
                 ]
-                dispatch_user_notifications_job.queue(notification_ids)
+                dispatch_user_notifications_job.queue(batch)
                 statsd.incr(
                     'notification.recipient',
-                    count=len(notification_ids),
+                    count=len(batch),
                     tags={'notification_type': notification.type},
                 )
 
-        # How does this batching work? There is a confusing recipe in the itertools
-        # module documentation. Here is what happens:
-        #
-        # `notification.dispatch()` returns a generator. We make a list of the
-        # desired batch size containing repeated references to the same generator.
-        # This works because Python lists can contain the same item multiple times,
-        # and ``[item] * 2 == [item, item]`` (also: ``[1, 2] * 2 = [1, 2, 1, 2]``).
-        # These copies are fed as positional parameters to `zip_longest`, which
-        # returns a batch containing one item from each of its parameters. For each
-        # batch (size 10 from the constant defined above), we commit to database
-        # and then queue a background job to deliver to them. When `zip_longest`
-        # runs out of items, it returns a batch padded with the `fillvalue` None.
-        # We use `filterfalse` to discard these None values. This difference
-        # distinguishes `zip_longest` from `zip`, which truncates the source data
-        # when it is short of a full batch.
-        #
-        # Discussion of approaches at https://stackoverflow.com/q/8290397/78903
+
+def dispatch_notification_iter(notification: Notification) -> None:
+    """Dispatch a notification using its iterator, in batches of DISPATCH_BATCH_SIZE."""
+    for batch in (
+        filterfalse(lambda x: x is None, unfiltered_batch)
+        for unfiltered_batch in zip_longest(
+            *[notification.dispatch()] * DISPATCH_BATCH_SIZE, fillvalue=None
+        )
+    ):
+        db.session.commit()
+        notification_ids = [user_notification.identity for user_notification in batch]
+        dispatch_user_notifications_job.queue(notification_ids)
+        statsd.incr(
+            'notification.recipient',
+            count=len(notification_ids),
+            tags={'notification_type': notification.type},
+        )
+
+    # How does this batching work? There is a confusing recipe in the itertools
+    # module documentation. Here is what happens:
+    #
+    # `notification.dispatch()` returns a generator. We make a list of the
+    # desired batch size containing repeated references to the same generator.
+    # This works because Python lists can contain the same item multiple times,
+    # and ``[item] * 2 == [item, item]`` (also: ``[1, 2] * 2 = [1, 2, 1, 2]``).
+    # These copies are fed as positional parameters to `zip_longest`, which
+    # returns a batch containing one item from each of its parameters. For each
+    # batch (size 10 from the constant defined above), we commit to database
+    # and then queue a background job to deliver to them. When `zip_longest`
+    # runs out of items, it returns a batch padded with the `fillvalue` None.
+    # We use `filterfalse` to discard these None values. This difference
+    # distinguishes `zip_longest` from `zip`, which truncates the source data
+    # when it is short of a full batch.
+    #
+    # Discussion of approaches at https://stackoverflow.com/q/8290397/78903
 
 
 @rq.job('funnel')
 def dispatch_user_notifications_job(user_notification_ids):
     with app.app_context():
-        queue = [
-            UserNotification.query.get(identity) for identity in user_notification_ids
-        ]
+        queue = UserNotification.rollup_previous_batch(user_notification_ids)
+        resolver = NotificationTransportResolver.for_user_notifications(queue)
         transport_batch = defaultdict(list)
 
         for user_notification in queue:
-            user_notification.rollup_previous()
             for transport in transport_workers:
-                if platform_transports[transport] and user_notification.has_transport(
-                    transport
+                if platform_transports[transport] and resolver.has_transport(
+                    user_notification, transport
                 ):
                     transport_batch[transport].append(user_notification.identity)
-            db.session.commit()
+        db.session.commit()
         for transport, batch in transport_batch.items():
             # Based on user preferences, a transport may have no recipients at all.
             # Only queue a background job when there is work to do.
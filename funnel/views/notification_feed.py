@@ -1,17 +1,167 @@
 from __future__ import annotations
 
+from collections import Counter
+from itertools import chain
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as DatabaseSession
+
 from flask import abort
 
 from coaster.auth import current_auth
 from coaster.views import ClassView, render_with, requestargs, route
 import baseframe.forms as forms
 
-from .. import app
-from ..models import UserNotification, db
+from .. import app, redis_store
+from ..models import Notification, User, UserNotification, db, notification_web_types
 from ..typing import ReturnRenderWith
+from ..utils import abort_null
+from .decorators import etag_cache_invalidate_for_users
+from .helpers import after_session_commit, keyset_paginate
 from .login_session import requires_login
 
 
+@event.listens_for(DatabaseSession, 'after_flush')
+def _notification_read_invalidate_cache(session, flush_context):
+    """Invalidate cached views for users whose notifications were marked read."""
+    user_ids = {
+        obj.user_id for obj in session.dirty if isinstance(obj, UserNotification)
+    }
+    if user_ids:
+        etag_cache_invalidate_for_users(session, user_ids)
+
+
+# --- Unread counters ------------------------------------------------------------------
+
+#: Redis hash of unread notification counts, keyed by user id
+notification_unread_key = 'notification/unread'
+#: Increment a counter only if present, as a missing counter is counted when read
+_hincrby_if_exists = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+end
+return nil
+"""
+#: Replace a counter only if it has not changed since it was read
+_hset_if_unchanged = """
+if redis.call('HGET', KEYS[1], ARGV[1]) == ARGV[2] then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+def notification_unread_count(user: User) -> int:
+    """Return a user's unread notification count, counting it if not in Redis."""
+    value = redis_store.hget(notification_unread_key, user.id)
+    if value is None:
+        count = UserNotification.unread_count_for(user)
+        redis_store.hsetnx(notification_unread_key, user.id, count)
+        return count
+    return max(int(value), 0)
+
+
+def reconcile_notification_unread_counts(batch_size: int = 1000) -> int:
+    """
+    Correct unread counters in Redis that have drifted from the database.
+
+    Counters are replaced only if they are unchanged since they were read, so that a
+    change committed during the check is not lost. Returns the number of counters
+    corrected.
+    """
+    corrected = 0
+    cursor = 0
+    while True:
+        cursor, cached = redis_store.hscan(
+            notification_unread_key, cursor, count=batch_size
+        )
+        if cached:
+            counts = UserNotification.unread_counts_for_ids(
+                [int(user_id) for user_id in cached]
+            )
+            pipe = redis_store.pipeline()
+            for user_id, value in cached.items():
+                count = counts.get(int(user_id), 0)
+                if int(value) != count:
+                    pipe.eval(
+                        _hset_if_unchanged,
+                        1,
+                        notification_unread_key,
+                        user_id,
+                        value,
+                        count,
+                    )
+            corrected += sum(pipe.execute())
+        if not cursor:
+            return corrected
+
+
+def _user_notification_unread(
+    user_notification: UserNotification, before: bool
+) -> Optional[bool]:
+    """
+    Return whether a user notification was unread before or after a flush.
+
+    Returns None if this can't be determined without loading from the database.
+    """
+    state = db.inspect(user_notification)
+    unread = True
+    for key in ('read_at', 'revoked_at'):
+        history = state.attrs[key].history
+        if history.unchanged:
+            value = history.unchanged[0]
+        elif before and history.deleted:
+            value = history.deleted[0]
+        elif not before and history.added:
+            value = history.added[0]
+        else:
+            return None
+        unread = unread and value is None
+    return unread
+
+
+@event.listens_for(DatabaseSession, 'after_flush')
+def _notification_unread_track_changes(session, flush_context):
+    """Record changes to unread counts from user notifications in this flush."""
+    changes: Counter = Counter()
+    for obj in session.new:
+        if isinstance(obj, UserNotification):
+            state = db.inspect(obj)
+            if (
+                state.dict.get('read_at') is None
+                and state.dict.get('revoked_at') is None
+            ):
+                changes[obj] = 1
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, UserNotification):
+            before = _user_notification_unread(obj, True)
+            after = (
+                False
+                if obj in session.deleted
+                else _user_notification_unread(obj, False)
+            )
+            if before is not None and after is not None and before != after:
+                changes[obj] = 1 if after else -1
+    for obj, delta in changes.items():
+        # Only web notifications are counted as unread
+        if obj.notification_type in notification_web_types:
+            session.info.setdefault('user_notification_unread', Counter())[
+                obj.user_id
+            ] += delta
+
+
+@after_session_commit('user_notification_unread')
+def _notification_unread_apply_changes(changes: Counter) -> None:
+    """Apply changes to unread counts from the transaction to counters in Redis."""
+    pipe = redis_store.pipeline()
+    for user_id, delta in changes.items():
+        if delta:
+            pipe.eval(_hincrby_if_exists, 1, notification_unread_key, user_id, delta)
+    pipe.execute()
+
+
 @route('/updates')
 class AllNotificationsView(ClassView):
     current_section = 'notifications'  # needed for showing active tab
@@ -20,11 +170,40 @@ class AllNotificationsView(ClassView):
     @route('unread', endpoint='notifications_unread', defaults={'unread_only': True})
     @requires_login
     @render_with('notification_feed.html.jinja2', json=True)
-    @requestargs(('page', int), ('per_page', int))
-    def view(self, unread_only: bool, page=1, per_page=10) -> ReturnRenderWith:
-        pagination = UserNotification.web_notifications_for(
-            current_auth.user, unread_only
-        ).paginate(page=page, per_page=per_page, max_per_page=100)
+    @requestargs(('page', int), ('per_page', int), ('cursor', abort_null))
+    def view(
+        self, unread_only: bool, page=1, per_page=10, cursor=None
+    ) -> ReturnRenderWith:
+        query = UserNotification.web_notifications_for(current_auth.user, unread_only)
+        if cursor is not None:
+            # Infinite scroll: seek past the cursor (blank for the first page) instead
+            # of using page numbers, skipping the offset and count queries
+            items, next_cursor = keyset_paginate(
+                query,
+                (Notification.created_at, UserNotification.eventid),
+                lambda un: (un.notification.created_at, un.eventid),
+                cursor=cursor,
+                per_page=per_page,
+            )
+            pagination_info = {
+                'has_next': next_cursor is not None,
+                'per_page': min(per_page, 100),
+                'cursor': cursor,
+                'next_cursor': next_cursor,
+            }
+        else:
+            pagination = query.paginate(page=page, per_page=per_page, max_per_page=100)
+            items = pagination.items
+            pagination_info = {
+                'has_next': pagination.has_next,
+                'has_prev': pagination.has_prev,
+                'page': pagination.page,
+                'per_page': pagination.per_page,
+                'pages': pagination.pages,
+                'next_num': pagination.next_num,
+                'prev_num': pagination.prev_num,
+                'count': pagination.total,
+            }
         results = {
             'unread_only': unread_only,
             'show_transport_alert': not current_auth.user.has_transport_sms(),
@@ -45,23 +224,16 @@ class AllNotificationsView(ClassView):
                     if un.fragment
                     else None,
                 }
-                for un in pagination.items
+                for un in items
                 if un.is_not_deleted(revoke=True)
             ],
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev,
-            'page': pagination.page,
-            'per_page': pagination.per_page,
-            'pages': pagination.pages,
-            'next_num': pagination.next_num,
-            'prev_num': pagination.prev_num,
-            'count': pagination.total,
+            **pagination_info,
         }
         db.session.commit()
         return results
 
     def unread_count(self) -> int:
-        return UserNotification.unread_count_for(current_auth.user)
+        return notification_unread_count(current_auth.user)
 
     @route('count', endpoint='notifications_count')
     @render_with(json=True)
@@ -30,6 +30,11 @@ from ..forms import ProfileBannerForm, ProfileForm, ProfileLogoForm
 from ..models import Profile, Project, db
 from .login_session import requires_login
 from .mixins import ProfileViewMixin
+from .project_listing import (
+    cached_project_listing,
+    profile_project_listing,
+    project_listing_cacheable,
+)
 
 
 @Profile.features('new_project')
@@ -101,49 +106,6 @@ class ProfileView(ProfileViewMixin, UrlChangeCheck, UrlForView, ModelView):
             else:
                 template_name = 'profile.html.jinja2'
 
-            # `order_by(None)` clears any existing order defined in relationship.
-            # We're using it because we want to define our own order here.
-            # listed_projects already includes a filter on Project.state.PUBLISHED
-            projects = self.obj.listed_projects.order_by(None)
-            all_projects = (
-                projects.filter(
-                    db.or_(
-                        Project.state.LIVE,
-                        Project.state.UPCOMING,
-                        db.and_(
-                            Project.start_at.is_(None), Project.published_at.isnot(None)
-                        ),
-                    ),
-                )
-                .order_by(Project.order_by_date())
-                .all()
-            )
-
-            upcoming_projects = all_projects[:3]
-            all_projects = all_projects[3:]
-            featured_project = (
-                projects.filter(
-                    db.or_(
-                        Project.state.LIVE,
-                        Project.state.UPCOMING,
-                        db.and_(
-                            Project.start_at.is_(None), Project.published_at.isnot(None)
-                        ),
-                    ),
-                    Project.site_featured.is_(True),
-                )
-                .order_by(Project.order_by_date())
-                .limit(1)
-                .first()
-            )
-            if featured_project in upcoming_projects:
-                upcoming_projects.remove(featured_project)
-            open_cfp_projects = (
-                projects.filter(Project.cfp_state.OPEN)
-                .order_by(Project.order_by_date())
-                .all()
-            )
-
             # If the user is an admin of this profile, show all draft projects.
             # Else, only show the drafts they have a crew role in
             if self.obj.current_roles.admin:
@@ -163,33 +125,14 @@ class ProfileView(ProfileViewMixin, UrlChangeCheck, UrlForView, ModelView):
             ctx = {
                 'template': template_name,
                 'profile': self.obj.current_access(datasets=('primary', 'related')),
-                'all_projects': [
-                    p.current_access(datasets=('without_parent', 'related'))
-                    for p in all_projects
-                ],
                 'unscheduled_projects': [
                     p.current_access(datasets=('without_parent', 'related'))
                     for p in unscheduled_projects
                 ],
-                'upcoming_projects': [
-                    p.current_access(datasets=('without_parent', 'related'))
-                    for p in upcoming_projects
-                ],
-                'open_cfp_projects': [
-                    p.current_access(datasets=('without_parent', 'related'))
-                    for p in open_cfp_projects
-                ],
                 'draft_projects': [
                     p.current_access(datasets=('without_parent', 'related'))
                     for p in draft_projects
                 ],
-                'featured_project': (
-                    featured_project.current_access(
-                        datasets=('without_parent', 'related')
-                    )
-                    if featured_project
-                    else None
-                ),
                 'sponsored_projects': [
                     _p.current_access(datasets=('primary', 'related'))
                     for _p in sponsored_projects
@@ -199,6 +142,10 @@ class ProfileView(ProfileViewMixin, UrlChangeCheck, UrlForView, ModelView):
                     for _p in sponsored_submissions
                 ],
             }
+            if template_name == 'profile.html.jinja2' and project_listing_cacheable():
+                ctx.update(cached_project_listing(self.obj))
+            else:
+                ctx.update(profile_project_listing(self.obj))
         else:
             abort(404)  # Reserved profile
 
@@ -2,18 +2,8 @@ from __future__ import annotations
 
 from collections import namedtuple
 from types import SimpleNamespace
-import csv
-import io
-
-from flask import (
-    Response,
-    abort,
-    current_app,
-    flash,
-    redirect,
-    render_template,
-    request,
-)
+
+from flask import abort, current_app, flash, redirect, render_template, request
 
 from baseframe import _, __, forms
 from baseframe.forms import (
@@ -55,7 +45,7 @@ from ..models import (
     db,
 )
 from ..signals import project_role_change
-from .helpers import html_in_json
+from .helpers import csv_response, html_in_json
 from .jobs import import_tickets, tag_locations
 from .login_session import requires_login
 from .mixins import DraftViewMixin, ProfileViewMixin, ProjectViewMixin
@@ -622,40 +612,24 @@ class ProjectView(
         }
 
     def get_rsvp_state_csv(self, state):
-        outfile = io.StringIO(newline='')
-        out = csv.writer(outfile)
-        out.writerow(['fullname', 'email', 'created_at'])
-        for rsvp in self.obj.rsvps_with(state):
-            out.writerow(
+        timezone = self.obj.timezone
+        return csv_response(
+            ['fullname', 'email', 'created_at'],
+            (
                 [
-                    rsvp.user.fullname,
-                    (
-                        rsvp.user.email
-                        if rsvp.user.email
-                        else rsvp.user.emailclaims[0]
-                        if rsvp.user.emailclaims
-                        else ''
-                    ),
-                    rsvp.created_at.astimezone(self.obj.timezone)
+                    fullname,
+                    email,
+                    created_at.astimezone(timezone)
                     .replace(second=0, microsecond=0, tzinfo=None)
                     .isoformat(),  # Strip precision from timestamp
                 ]
-            )
-
-        outfile.seek(0)
-        return Response(
-            outfile.getvalue(),
-            content_type='text/csv',
-            headers=[
-                (
-                    'Content-Disposition',
-                    'attachment;filename="{filename}.csv"'.format(
-                        filename='ticket-participants-{project}-{state}'.format(
-                            project=make_name(self.obj.title), state=state
-                        )
-                    ),
-                )
-            ],
+                for fullname, email, created_at in self.obj.rsvps_export(
+                    state
+                ).yield_per(1000)
+            ),
+            filename='ticket-participants-{project}-{state}'.format(
+                project=make_name(self.obj.title), state=state
+            ),
         )
 
     @route('rsvp_list/yes.csv')
@@ -0,0 +1,374 @@
+"""Project listings for the home page and profiles, with a rendering cache."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session as DatabaseSession
+
+from flask import render_template, request
+from flask_babelhg import get_locale
+
+from markupsafe import Markup
+
+from baseframe import cache, statsd
+from coaster.auth import current_auth
+from coaster.sqlalchemy import Query
+from coaster.utils import utcnow
+
+from .. import redis_store
+from ..models import Profile, Project, Session, db
+from .helpers import after_session_commit
+
+#: Seconds for which a rendered listing is kept when it is not invalidated earlier
+PROJECT_LISTING_CACHE_TIMEOUT = 3600
+#: Seconds for which one request may render a stale listing while other requests
+#: continue to receive the stale listing
+PROJECT_LISTING_REVALIDATE_TIMEOUT = 30
+#: Sessions are listed as current from this long before they start, matching
+#: :meth:`Project.current_sessions`
+CURRENT_SESSIONS_LEAD = timedelta(minutes=30)
+
+
+# --- Listing queries ------------------------------------------------------------------
+
+
+def listing_filter():
+    """Filter for projects that are listed on the home page and profiles."""
+    return db.or_(
+        Project.state.LIVE,
+        Project.state.UPCOMING,
+        db.and_(Project.start_at.is_(None), Project.published_at.isnot(None)),
+    )
+
+
+def site_project_listing() -> Dict[str, Any]:
+    """Return projects for the home page, as the template expects them."""
+    projects = Project.all_unsorted()
+    all_projects = (
+        projects.filter(
+            Project.state.PUBLISHED,
+            db.or_(
+                Project.state.LIVE,
+                Project.state.UPCOMING,
+                db.and_(
+                    Project.start_at.is_(None),
+                    Project.published_at.isnot(None),
+                    Project.site_featured.is_(True),
+                ),
+            ),
+        )
+        .order_by(Project.next_session_at.asc())
+        .all()
+    )
+    upcoming_projects = all_projects[:3]
+    all_projects = all_projects[3:]
+    featured_project = (
+        projects.filter(
+            Project.state.PUBLISHED,
+            listing_filter(),
+            Project.site_featured.is_(True),
+        )
+        .order_by(Project.next_session_at.asc())
+        .limit(1)
+        .first()
+    )
+    if featured_project in upcoming_projects:
+        # if featured project is in upcoming projects, remove it from there and
+        # pick one upcoming project from from all projects, only if
+        # there are any projects left in it
+        upcoming_projects.remove(featured_project)
+        if all_projects:
+            upcoming_projects.append(all_projects.pop(0))
+    open_cfp_projects = (
+        projects.filter(Project.state.PUBLISHED, Project.cfp_state.OPEN)
+        .order_by(Project.next_session_at.asc())
+        .all()
+    )
+
+    return {
+        'all_projects': [
+            p.access_for(roles={'all'}, datasets=('primary', 'related'))
+            for p in all_projects
+        ],
+        'upcoming_projects': [
+            p.access_for(roles={'all'}, datasets=('primary', 'related'))
+            for p in upcoming_projects
+        ],
+        'open_cfp_projects': [
+            p.access_for(roles={'all'}, datasets=('primary', 'related'))
+            for p in open_cfp_projects
+        ],
+        'featured_project': (
+            featured_project.access_for(roles={'all'}, datasets=('primary', 'related'))
+            if featured_project
+            else None
+        ),
+    }
+
+
+def profile_project_listing(profile: Profile) -> Dict[str, Any]:
+    """Return a profile's listed projects, as the template expects them."""
+    # `order_by(None)` clears any existing order defined in relationship.
+    # We're using it because we want to define our own order here.
+    # listed_projects already includes a filter on Project.state.PUBLISHED
+    projects = profile.listed_projects.order_by(None)
+    all_projects = (
+        projects.filter(listing_filter()).order_by(Project.order_by_date()).all()
+    )
+
+    upcoming_projects = all_projects[:3]
+    all_projects = all_projects[3:]
+    featured_project = (
+        projects.filter(listing_filter(), Project.site_featured.is_(True))
+        .order_by(Project.order_by_date())
+        .limit(1)
+        .first()
+    )
+    if featured_project in upcoming_projects:
+        upcoming_projects.remove(featured_project)
+    open_cfp_projects = (
+        projects.filter(Project.cfp_state.OPEN).order_by(Project.order_by_date()).all()
+    )
+
+    return {
+        'all_projects': [
+            p.current_access(datasets=('without_parent', 'related'))
+            for p in all_projects
+        ],
+        'upcoming_projects': [
+            p.current_access(datasets=('without_parent', 'related'))
+            for p in upcoming_projects
+        ],
+        'open_cfp_projects': [
+            p.current_access(datasets=('without_parent', 'related'))
+            for p in open_cfp_projects
+        ],
+        'featured_project': (
+            featured_project.current_access(datasets=('without_parent', 'related'))
+            if featured_project
+            else None
+        ),
+    }
+
+
+def project_listing_valid_until(query: Query) -> Optional[datetime]:
+    """
+    Return the time at which a listing will change without any edits to the data.
+
+    Projects move between listings as they go live and end, and the featured project
+    shows sessions from shortly before they start until they end.
+    """
+    now = utcnow()
+    project_ids = query.order_by(None).with_entities(Project.id).subquery()
+    boundaries = chain(
+        query.order_by(None)
+        .with_entities(
+            *(
+                db.func.min(db.case([(column > now, column)]))
+                for column in (
+                    Project.start_at - CURRENT_SESSIONS_LEAD,
+                    Project.start_at,
+                    Project.end_at,
+                    Project.cfp_start_at,
+                    Project.cfp_end_at,
+                )
+            )
+        )
+        .one(),
+        db.session.query(
+            *(
+                db.func.min(db.case([(column > now, column)]))
+                for column in (Session.start_at - CURRENT_SESSIONS_LEAD, Session.end_at)
+            )
+        )
+        .filter(Session.project_id.in_(db.select([project_ids.c.id])))
+        .one(),
+    )
+    return min((b for b in boundaries if b is not None), default=None)
+
+
+# --- Listing cache --------------------------------------------------------------------
+
+
+def project_listing_scope(profile: Optional[Profile] = None) -> str:
+    """Return the cache scope for the home page or a profile's listing."""
+    return f'profile/{profile.id}' if profile is not None else 'site'
+
+
+def project_listing_generation_key(scope: str) -> str:
+    """Return the Redis key for the generation of a listing scope."""
+    return f'project_listing/generation/{scope}'
+
+
+def project_listing_cache_key(scope: str) -> str:
+    """Return the cache key for the current generation of a listing scope."""
+    generation = redis_store.get(project_listing_generation_key(scope)) or '0'
+    return f'project_listing/v1/{scope}/{generation}/{get_locale()}'
+
+
+def project_listing_cacheable() -> bool:
+    """Confirm if the current request may be served a cached listing."""
+    # Listings show controls for saving projects to logged in users
+    return current_auth.is_anonymous and request.accept_mimetypes.accept_html
+
+
+def render_project_listing(
+    profile: Optional[Profile], featured_heading: bool
+) -> Dict[str, Any]:
+    """Render a listing for the cache."""
+    if profile is None:
+        listing = site_project_listing()
+        query = Project.all_unsorted()
+    else:
+        listing = profile_project_listing(profile)
+        query = profile.listed_projects
+    featured_project = listing['featured_project']
+    return {
+        'html': render_template(
+            'project_listing.html.jinja2', featured_heading=featured_heading, **listing
+        ),
+        # The page description mentions the featured project
+        'featured_project': (
+            {
+                'title_inline': featured_project.title_inline,
+                'tagline': featured_project.tagline,
+            }
+            if featured_project is not None
+            else None
+        ),
+        'featured_heading': featured_heading,
+        'valid_until': project_listing_valid_until(query),
+    }
+
+
+def cached_project_listing(
+    profile: Optional[Profile] = None, featured_heading: bool = True
+) -> Dict[str, Any]:
+    """
+    Return a rendered listing for the home page or a profile, from cache if possible.
+
+    A listing is re-rendered when its projects or sessions change, or when it is past
+    the time when projects in it go live or end. The first request to find an expired
+    listing renders it again, while other requests continue to receive the expired
+    listing in the meantime.
+
+    :param profile: Profile to list projects from, or `None` for the home page
+    :param featured_heading: Show a heading for the featured project
+    """
+    scope = project_listing_scope(profile)
+    cache_key = project_listing_cache_key(scope)
+    revalidate_key = f'{cache_key}/revalidate'
+    listing = cache.get(cache_key)
+    if listing is None:
+        result = 'miss'
+    elif listing['valid_until'] is None or listing['valid_until'] > utcnow():
+        result = 'hit'
+    elif cache.add(revalidate_key, True, timeout=PROJECT_LISTING_REVALIDATE_TIMEOUT):
+        result = 'revalidate'
+    else:
+        result = 'stale'
+    statsd.incr(
+        'project_listing.cache',
+        tags={'scope': scope.split('/', 1)[0], 'result': result},
+    )
+    if result in ('miss', 'revalidate'):
+        listing = render_project_listing(profile, featured_heading)
+        cache.set(cache_key, listing, timeout=PROJECT_LISTING_CACHE_TIMEOUT)
+        if result == 'revalidate':
+            cache.delete(revalidate_key)
+    return {
+        'project_listing': Markup(listing['html']),
+        'featured_project': listing['featured_project'],
+    }
+
+
+def warm_project_listings(window: timedelta) -> int:
+    """
+    Render listings that have expired, before requests ask for them.
+
+    This covers the home page, and cached listings of profiles with projects that
+    went live or ended in the past `window`. Call within a request context. Returns the
+    number of listings rendered.
+    """
+    now = utcnow()
+    profiles: Dict[str, Optional[Profile]] = {'site': None}
+    for profile in Profile.query.filter(
+        Profile.id.in_(
+            Project.all_unsorted()
+            .filter(
+                db.or_(
+                    *(
+                        column.between(now - window, now)
+                        for column in (
+                            Project.start_at - CURRENT_SESSIONS_LEAD,
+                            Project.start_at,
+                            Project.end_at,
+                            Project.cfp_start_at,
+                            Project.cfp_end_at,
+                        )
+                    )
+                )
+            )
+            .with_entities(Project.profile_id)
+        )
+    ):
+        profiles[project_listing_scope(profile)] = profile
+    count = 0
+    for scope, profile in profiles.items():
+        cache_key = project_listing_cache_key(scope)
+        listing = cache.get(cache_key)
+        if listing is None:
+            if profile is not None:
+                # Not in demand, so leave it for a request to render
+                continue
+            featured_heading = False
+        elif listing['valid_until'] is None or listing['valid_until'] > now:
+            continue
+        else:
+            featured_heading = listing['featured_heading']
+        cache.set(
+            cache_key,
+            render_project_listing(profile, featured_heading),
+            timeout=PROJECT_LISTING_CACHE_TIMEOUT,
+        )
+        count += 1
+    return count
+
+
+# --- Listing invalidation -------------------------------------------------------------
+
+
+@event.listens_for(DatabaseSession, 'after_flush')
+def _project_listing_track_writes(session, flush_context):
+    """Record which listings are affected by changes in this transaction."""
+    scopes: Set[str] = session.info.setdefault('project_listing_written', set())
+    project_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Project):
+            scopes.update(('site', f'profile/{obj.profile_id}'))
+        elif isinstance(obj, Profile):
+            scopes.update(('site', f'profile/{obj.id}'))
+        elif isinstance(obj, Session):
+            project_ids.add(obj.project_id)
+    if project_ids:
+        scopes.add('site')
+        # Use the connection directly as the session cannot autoflush mid-flush
+        scopes.update(
+            f'profile/{profile_id}'
+            for profile_id in session.connection()
+            .execute(db.select([Project.profile_id]).where(Project.id.in_(project_ids)))
+            .scalars()
+        )
+
+
+@after_session_commit('project_listing_written')
+def _project_listing_bump_generations(scopes: Set[str]) -> None:
+    """Increment the generation of listings affected by the transaction."""
+    pipe = redis_store.pipeline()
+    for scope in scopes:
+        pipe.incr(project_listing_generation_key(scope))
+    pipe.execute()
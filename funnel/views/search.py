@@ -1,18 +1,29 @@
 from __future__ import annotations
 
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from hashlib import blake2b
 from html import unescape as html_unescape
-from typing import Any, List, Optional
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set
 from urllib.parse import quote as urlquote
 import re
 
+from flask_sqlalchemy import Pagination
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.postgresql.dml import Insert
+from sqlalchemy.orm import Session as DatabaseSession
 from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.sql.selectable import Select, SelectBase
 import sqlalchemy.sql.expression as expression
 
-from flask import Markup, redirect, request, url_for
+from flask import Markup, abort, redirect, request, url_for
 
 from typing_extensions import TypedDict
 
-from baseframe import __
+from baseframe import __, cache, statsd
 from coaster.sqlalchemy import Query
 from coaster.views import (
     ClassView,
@@ -24,7 +35,7 @@ from coaster.views import (
     route,
 )
 
-from .. import app, executor
+from .. import app, executor, redis_store, rq
 from ..models import (
     Comment,
     Commentset,
@@ -33,6 +44,7 @@ from ..models import (
     Project,
     Proposal,
     ProposalMembership,
+    SearchDocument,
     Session,
     Update,
     User,
@@ -40,6 +52,7 @@ from ..models import (
     visual_field_delimiter,
 )
 from ..utils import abort_null
+from .helpers import after_session_commit, keyset_paginate
 from .mixins import ProfileViewMixin, ProjectViewMixin
 
 # --- Definitions ----------------------------------------------------------------------
@@ -61,10 +74,91 @@ match_text_breakpoint_re = re.compile('[¦\r\n].*')
 # regex here.
 html_whitespace_re = re.compile(r'\s+', re.ASCII)
 
+# --- Search expressions ---------------------------------------------------------------
+
+
+def headline_title(regconfig: str, column: ColumnElement, squery: str) -> ColumnElement:
+    """Return a column expression for title with search terms highlighted."""
+    return db.func.ts_headline(
+        regconfig,
+        column,
+        db.func.to_tsquery(squery),
+        'HighlightAll=TRUE, StartSel="%s", StopSel="%s"' % (pg_startsel, pg_stopsel),
+        type_=db.UnicodeText,
+    )
+
+
+def headline_snippet(
+    regconfig: str, column: ColumnElement, squery: str
+) -> ColumnElement:
+    """Return a column expression for a snippet of text with highlights."""
+    return db.func.ts_headline(
+        regconfig,
+        column,
+        db.func.to_tsquery(squery),
+        'MaxFragments=2, FragmentDelimiter="%s",'
+        ' MinWords=5, MaxWords=20,'
+        ' StartSel="%s", StopSel="%s"' % (pg_delimiter, pg_startsel, pg_stopsel),
+        type_=db.UnicodeText,
+    )
+
+
+def headline_matched_text(
+    regconfig: str, column: ColumnElement, squery: str
+) -> ColumnElement:
+    """Return a column expression for matching text, without highlighting."""
+    return db.func.ts_headline(
+        regconfig,
+        column,
+        db.func.to_tsquery(squery),
+        'MaxFragments=0, MaxWords=100, StartSel="", StopSel=""',
+        type_=db.UnicodeText,
+    )
+
+
+def tsvector_concat(vector: ColumnElement, *others: ColumnElement) -> ColumnElement:
+    """Concatenate tsvectors, treating nulls in all but the first as empty."""
+    for other in others:
+        vector = vector.op('||', return_type=TSVECTOR)(
+            db.func.coalesce(other, db.cast('', TSVECTOR))
+        )
+    return vector
+
+
+def search_document_select(
+    stype: str,
+    model: db.Model,
+    profile_id: ColumnElement,
+    project_id: ColumnElement,
+    visible_site: ColumnElement,
+    visible_profile: ColumnElement,
+    visible_project: ColumnElement,
+    search_vector: ColumnElement,
+    title: ColumnElement,
+    hltext: ColumnElement,
+) -> Select:
+    """Return a select with columns for :class:`SearchDocument` rows."""
+    return db.select(
+        [
+            db.literal(stype, db.Unicode).label('type'),
+            model.id.label('object_id'),
+            profile_id.label('profile_id'),
+            project_id.label('project_id'),
+            db.and_(visible_site).label('visible_site'),
+            db.and_(visible_profile).label('visible_profile'),
+            db.and_(visible_project).label('visible_project'),
+            search_vector.label('search_vector'),
+            title.label('title'),
+            hltext.label('hltext'),
+            model.created_at.label('created_at'),
+        ]
+    )
+
+
 # --- Search provider types ------------------------------------------------------------
 
 
-class SearchProvider:
+class SearchProvider(ABC):
     """Base class for search providers."""
 
     #: Label to use in UI
@@ -73,6 +167,12 @@ class SearchProvider:
     model: db.Model
     #: Does this model have a title column?
     has_title: bool = True
+    #: How to count results: ``exact`` runs a full count; ``capped`` stops counting
+    #: at :attr:`count_cap`; ``estimate`` uses the query planner's estimate if it is
+    #: over :attr:`count_cap`, and a capped count otherwise
+    count_strategy: str = 'exact'
+    #: Counts at or over this number are not exact, unless using the ``exact`` strategy
+    count_cap: int = 1000
 
     @property
     def regconfig(self) -> str:
@@ -99,39 +199,35 @@ class SearchProvider:
 
     def hltitle_column(self, squery: str) -> ColumnElement:
         """Return a column expression for title with search terms highlighted."""
-        return db.func.ts_headline(
-            self.regconfig,
-            self.title_column,
-            db.func.to_tsquery(squery),
-            'HighlightAll=TRUE, StartSel="%s", StopSel="%s"'
-            % (pg_startsel, pg_stopsel),
-            type_=db.UnicodeText,
-        )
+        return headline_title(self.regconfig, self.title_column, squery)
 
     def hlsnippet_column(self, squery: str) -> ColumnElement:
         """Return a column expression for a snippet of text with highlights."""
-        return db.func.ts_headline(
-            self.regconfig,
-            self.hltext,
-            db.func.to_tsquery(squery),
-            'MaxFragments=2, FragmentDelimiter="%s",'
-            ' MinWords=5, MaxWords=20,'
-            ' StartSel="%s", StopSel="%s"' % (pg_delimiter, pg_startsel, pg_stopsel),
-            type_=db.UnicodeText,
-        )
+        return headline_snippet(self.regconfig, self.hltext, squery)
 
     def matched_text_column(self, squery: str) -> ColumnElement:
         """Return a column expression for matching text, without highlighting."""
-        return db.func.ts_headline(
-            self.regconfig,
-            self.hltext,
-            db.func.to_tsquery(squery),
-            'MaxFragments=0, MaxWords=100, StartSel="", StopSel=""',
-            type_=db.UnicodeText,
-        )
+        return headline_matched_text(self.regconfig, self.hltext, squery)
 
     # --- Query methods
 
+    def count(self, query: Query) -> int:
+        """Count results in the query using :attr:`count_strategy`."""
+        query = query.options(db.load_only(self.model.id))
+        if self.count_strategy == 'exact':
+            return query.count()
+        if self.count_strategy == 'estimate':
+            estimate = estimated_count(query)
+            if estimate >= self.count_cap:
+                # Rounding may take the estimate below the cap, which would make it
+                # appear exact, so don't go lower than the cap
+                return max(round_magnitude(estimate), self.count_cap)
+        return capped_count(query, self.count_cap)
+
+    def count_is_exact(self, count: int) -> bool:
+        """Confirm if a count returned by :meth:`count` is exact."""
+        return self.count_strategy == 'exact' or count < self.count_cap
+
     def add_order_by(self, squery: str, query: Query) -> Query:
         """Add an order_by condition to the query."""
         return query.order_by(
@@ -139,13 +235,21 @@ class SearchProvider:
             self.model.created_at.desc(),
         )
 
+    def rank_column(self, squery: str) -> ColumnElement:
+        """Return a column expression for search rank, used for keyset pagination."""
+        return db.func.ts_rank_cd(self.model.search_vector, squery, type_=db.REAL)
+
     def all_query(self, squery: str) -> Query:
         """Search entire site."""
         ...
 
     def all_count(self, squery: str) -> int:
         """Return count of results for :meth:`all_query`."""
-        return self.all_query(squery).options(db.load_only(self.model.id)).count()
+        return self.count(self.all_query(squery))
+
+    @abstractmethod
+    def document_select(self, stype: str) -> SelectBase:
+        """Return a select of :class:`SearchDocument` rows for all objects."""
 
 
 class SearchInProfileProvider(SearchProvider):
@@ -157,11 +261,7 @@ class SearchInProfileProvider(SearchProvider):
 
     def profile_count(self, squery: str, profile: Profile) -> int:
         """Return count of results for :meth:`profile_query`."""
-        return (
-            self.profile_query(squery, profile)
-            .options(db.load_only(self.model.id))
-            .count()
-        )
+        return self.count(self.profile_query(squery, profile))
 
 
 class SearchInProjectProvider(SearchInProfileProvider):
@@ -173,11 +273,7 @@ class SearchInProjectProvider(SearchInProfileProvider):
 
     def project_count(self, squery: str, project: Project) -> int:
         """Return count of results for :meth:`project_query`."""
-        return (
-            self.project_query(squery, project)
-            .options(db.load_only(self.model.id))
-            .count()
-        )
+        return self.count(self.project_query(squery, project))
 
 
 # --- Search providers -----------------------------------------------------------------
@@ -302,6 +398,29 @@ class ProjectSearch(SearchInProfileProvider):
             )
         )
 
+    def document_select(self, stype: str) -> Select:
+        """Return a select of :class:`SearchDocument` rows for projects."""
+        return search_document_select(
+            stype,
+            Project,
+            profile_id=Project.profile_id,
+            project_id=Project.id,
+            visible_site=db.and_(
+                Profile.state.ACTIVE_AND_PUBLIC, Project.state.PUBLISHED
+            ),
+            visible_profile=Project.state.PUBLISHED,
+            visible_project=db.false(),
+            search_vector=tsvector_concat(
+                Project.search_vector, Organization.search_vector, User.search_vector
+            ),
+            title=self.title_column,
+            hltext=self.hltext,
+        ).select_from(
+            db.join(Project, Profile, Project.profile_id == Profile.id)
+            .outerjoin(User, Profile.user_id == User.id)
+            .outerjoin(Organization, Profile.organization_id == Organization.id)
+        )
+
 
 class ProfileSearch(SearchProvider):
     """Search for profiles."""
@@ -343,6 +462,27 @@ class ProfileSearch(SearchProvider):
             ),
         )
 
+    def document_select(self, stype: str) -> Select:
+        """Return a select of :class:`SearchDocument` rows for profiles."""
+        return search_document_select(
+            stype,
+            Profile,
+            profile_id=Profile.id,
+            project_id=db.null(),
+            visible_site=Profile.state.ACTIVE_AND_PUBLIC,
+            visible_profile=db.false(),
+            visible_project=db.false(),
+            search_vector=tsvector_concat(
+                Profile.search_vector, User.search_vector, Organization.search_vector
+            ),
+            title=self.title_column,
+            hltext=self.hltext,
+        ).select_from(
+            db.outerjoin(Profile, User, Profile.user_id == User.id).outerjoin(
+                Organization, Profile.organization_id == Organization.id
+            )
+        )
+
 
 class SessionSearch(SearchInProjectProvider):
     """Search for sessions."""
@@ -400,12 +540,36 @@ class SessionSearch(SearchInProjectProvider):
             ),
         )
 
+    def document_select(self, stype: str) -> Select:
+        """Return a select of :class:`SearchDocument` rows for sessions."""
+        return search_document_select(
+            stype,
+            Session,
+            profile_id=Project.profile_id,
+            project_id=Session.project_id,
+            visible_site=db.and_(
+                Profile.state.ACTIVE_AND_PUBLIC,
+                Project.state.PUBLISHED,
+                Session.scheduled,
+            ),
+            visible_profile=db.and_(Project.state.PUBLISHED, Session.scheduled),
+            visible_project=Session.scheduled,
+            search_vector=Session.search_vector,
+            title=self.title_column,
+            hltext=self.hltext,
+        ).select_from(
+            db.join(Session, Project, Session.project_id == Project.id).join(
+                Profile, Project.profile_id == Profile.id
+            )
+        )
+
 
 class ProposalSearch(SearchInProjectProvider):
     """Search for proposals."""
 
     label = __("Submissions")
     model = Proposal
+    count_strategy = 'capped'
 
     def add_order_by(self, squery: str, query: Query) -> Query:
         """Add an order_by condition to the query."""
@@ -487,6 +651,51 @@ class ProposalSearch(SearchInProjectProvider):
             ),
         )
 
+    def document_select(self, stype: str) -> Select:
+        """Return a select of :class:`SearchDocument` rows for proposals."""
+        # Include names of credited collaborators. There is no aggregate function for
+        # tsvectors, so they are aggregated as text and converted back
+        collaborators = (
+            db.select(
+                [
+                    db.cast(
+                        db.func.string_agg(
+                            db.cast(User.search_vector, db.UnicodeText), ' '
+                        ),
+                        TSVECTOR,
+                    )
+                ]
+            )
+            .where(
+                ProposalMembership.proposal_id == Proposal.id,
+                ProposalMembership.user_id == User.id,
+                ProposalMembership.is_uncredited.is_(False),
+                ProposalMembership.is_active,
+            )
+            .correlate(Proposal)
+            .scalar_subquery()
+        )
+        return search_document_select(
+            stype,
+            Proposal,
+            profile_id=Project.profile_id,
+            project_id=Proposal.project_id,
+            visible_site=db.and_(
+                Profile.state.ACTIVE_AND_PUBLIC,
+                Project.state.PUBLISHED,
+                Proposal.state.PUBLIC,
+            ),
+            visible_profile=db.and_(Project.state.PUBLISHED, Proposal.state.PUBLIC),
+            visible_project=Proposal.state.PUBLIC,
+            search_vector=tsvector_concat(Proposal.search_vector, collaborators),
+            title=self.title_column,
+            hltext=self.hltext,
+        ).select_from(
+            db.join(Proposal, Project, Proposal.project_id == Project.id).join(
+                Profile, Project.profile_id == Profile.id
+            )
+        )
+
 
 class UpdateSearch(SearchInProjectProvider):
     """Search for project updates."""
@@ -542,6 +751,30 @@ class UpdateSearch(SearchInProjectProvider):
             ),
         )
 
+    def document_select(self, stype: str) -> Select:
+        """Return a select of :class:`SearchDocument` rows for updates."""
+        return search_document_select(
+            stype,
+            Update,
+            profile_id=Project.profile_id,
+            project_id=Update.project_id,
+            visible_site=db.and_(
+                Profile.state.ACTIVE_AND_PUBLIC,
+                Project.state.PUBLISHED,
+                Update.state.PUBLISHED,
+                Update.visibility_state.PUBLIC,
+            ),
+            visible_profile=db.and_(Project.state.PUBLISHED, Update.state.PUBLISHED),
+            visible_project=Update.state.PUBLISHED,
+            search_vector=Update.search_vector,
+            title=self.title_column,
+            hltext=self.hltext,
+        ).select_from(
+            db.join(Update, Project, Update.project_id == Project.id).join(
+                Profile, Project.profile_id == Profile.id
+            )
+        )
+
 
 class CommentSearch(SearchInProjectProvider):
     """Search for comments."""
@@ -549,6 +782,7 @@ class CommentSearch(SearchInProjectProvider):
     label = __("Comments")
     model = Comment
     has_title = False  # Comments don't have titles
+    count_strategy = 'estimate'
 
     def hltitle_column(self, squery: str):
         """Comments don't have titles, so return a null expression here."""
@@ -675,6 +909,49 @@ class CommentSearch(SearchInProjectProvider):
             )
         )
 
+    def document_select(self, stype: str) -> SelectBase:
+        """Return a select of :class:`SearchDocument` rows for comments."""
+
+        def comment_select(project_id: ColumnElement, joined) -> Select:
+            return search_document_select(
+                stype,
+                Comment,
+                profile_id=Project.profile_id,
+                project_id=project_id,
+                visible_site=db.and_(
+                    Profile.state.ACTIVE_AND_PUBLIC,
+                    Project.state.PUBLISHED,
+                    Comment.state.PUBLIC,
+                ),
+                visible_profile=db.and_(Project.state.PUBLISHED, Comment.state.PUBLIC),
+                visible_project=Comment.state.PUBLIC,
+                search_vector=tsvector_concat(
+                    Comment.search_vector, User.search_vector
+                ),
+                title=db.null(),
+                hltext=self.hltext,
+            ).select_from(
+                joined.join(Profile, Project.profile_id == Profile.id).outerjoin(
+                    User, Comment.user_id == User.id
+                )
+            )
+
+        return db.union_all(
+            comment_select(
+                Project.id,
+                db.join(
+                    Comment, Project, Project.commentset_id == Comment.commentset_id
+                ),
+            ),
+            comment_select(
+                Proposal.project_id,
+                db.join(
+                    Comment, Proposal, Proposal.commentset_id == Comment.commentset_id
+                ).join(Project, Proposal.project_id == Project.id),
+            ),
+            # Add select on future comment-supporting models here
+        )
+
 
 #: Ordered dictionary of search providers
 search_providers = {
@@ -721,6 +998,301 @@ def clean_matched_text(text: str) -> str:
     )
 
 
+def capped_count(query: Query, cap: int) -> int:
+    """Count rows in a query, stopping at ``cap`` rows."""
+    return (
+        db.session.query(db.func.count('*'))
+        .select_from(query.order_by(None).limit(cap).subquery())
+        .scalar()
+    )
+
+
+def estimated_count(query: Query) -> int:
+    """Return PostgreSQL's query planner estimate of rows in a query, from EXPLAIN."""
+    connection = db.session.connection()
+    compiled = query.order_by(None).statement.compile(
+        dialect=connection.dialect, compile_kwargs={'render_postcompile': True}
+    )
+    plan = connection.exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params
+    ).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def round_magnitude(count: int) -> int:
+    """Round a count down to its most significant digit (52,341 becomes 50,000)."""
+    magnitude = 10 ** (len(str(count)) - 1)
+    return count - count % magnitude
+
+
+# --- Search cache ------------------------------------------------------------
+
+#: Search counts are cached for this many seconds, unless invalidated sooner
+SEARCH_CACHE_TIMEOUT = 300
+
+#: Models whose writes invalidate cached search counts. Each has a generation counter
+#: in Redis that is incremented when a transaction writing to the model is committed.
+#: Changes made without the ORM (bulk updates) or to related models (user and
+#: organization names) are not tracked and will expire with the timeout.
+search_cache_models = (Project, Proposal, Session, Update, Comment, Profile)
+
+
+def search_generation_key(model: db.Model) -> str:
+    """Return the Redis key for a model's search cache generation counter."""
+    return f'search/generation/{model.__tablename__}'
+
+
+def search_scope(
+    profile: Optional[Profile] = None, project: Optional[Project] = None
+) -> str:
+    """Return a cache key fragment for the scope of a search."""
+    if project is not None:
+        return f'project/{project.uuid_b58}'
+    if profile is not None:
+        return f'profile/{profile.uuid_b58}'
+    return 'site'
+
+
+def search_cache_key(squery: str, scope: str) -> str:
+    """
+    Return a cache key for search counts with the given query and scope.
+
+    The key includes the current generation of every model in
+    :attr:`search_cache_models`, so a write to any of them makes all prior keys
+    unreachable. The query is hashed as it is user-supplied and of arbitrary length.
+    """
+    generations = redis_store.mget(
+        [search_generation_key(model) for model in search_cache_models]
+    )
+    digest = blake2b(squery.encode(), digest_size=16).hexdigest()
+    return 'search/counts/v1/{source}/{generations}/{scope}/{digest}'.format(
+        source='documents' if search_documents_enabled() else 'providers',
+        generations='-'.join(g or '0' for g in generations),
+        scope=scope,
+        digest=digest,
+    )
+
+
+@event.listens_for(DatabaseSession, 'after_flush')
+def _search_cache_track_writes(session, flush_context):
+    """Record which search models were written in this transaction."""
+    written = session.info.setdefault('search_cache_written', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        for model in search_cache_models:
+            if isinstance(obj, model):
+                written.add(model)
+
+
+@after_session_commit('search_cache_written')
+def _search_cache_bump_generations(written: Set[type]) -> None:
+    """Increment generation counters for search models written in the transaction."""
+    pipe = redis_store.pipeline()
+    for model in written:
+        pipe.incr(search_generation_key(model))
+    pipe.execute()
+
+
+# --- Search documents --------------------------------------------------------
+
+
+def search_documents_enabled() -> bool:
+    """Confirm if search uses :class:`SearchDocument` instead of provider queries."""
+    return bool(app.config.get('SEARCH_DOCUMENTS'))
+
+
+def search_document_upsert(
+    stype: str,
+    object_ids: Optional[Iterable[int]] = None,
+    profile_ids: Optional[Iterable[int]] = None,
+    project_ids: Optional[Iterable[int]] = None,
+) -> Insert:
+    """
+    Return a statement that inserts or updates search documents of the given type.
+
+    If ids are specified, only documents for those objects, or objects in those
+    profiles or projects, are included. All documents of the type are included
+    otherwise.
+    """
+    documents = search_providers[stype].document_select(stype).subquery()
+    select = db.select(list(documents.c))
+    if object_ids is not None:
+        select = select.where(documents.c.object_id.in_(object_ids))
+    if profile_ids is not None:
+        select = select.where(documents.c.profile_id.in_(profile_ids))
+    if project_ids is not None:
+        select = select.where(documents.c.project_id.in_(project_ids))
+    statement = pg_insert(SearchDocument.__table__).from_select(
+        [column.name for column in documents.c], select
+    )
+    return statement.on_conflict_do_update(
+        index_elements=['type', 'object_id'],
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in documents.c
+            if column.name not in ('type', 'object_id')
+        },
+    )
+
+
+#: Columns of a profile or project that its own search document is built from, in
+#: addition to the columns of its search vector
+search_document_columns = {
+    Profile: ('_state', 'description_html'),
+    Project: ('_state', 'profile_id', 'description_html', 'instructions_html'),
+}
+#: Columns of a profile or project that determine the visibility of every search
+#: document within it
+search_document_scope_columns = {
+    Profile: ('_state',),
+    Project: ('_state', 'profile_id'),
+}
+
+
+def _search_document_attrs_changed(obj: db.Model, keys: Iterable[str]) -> bool:
+    """Confirm if any of the given attributes were changed in this flush."""
+    attrs = db.inspect(obj).attrs
+    return any(attrs[key].history.has_changes() for key in keys)
+
+
+@rq.job('funnel')
+def refresh_search_documents(profile_ids: List[int], project_ids: List[int]) -> None:
+    """Refresh all search documents within the given profiles and projects."""
+    with app.app_context():
+        for stype in search_providers:
+            if profile_ids:
+                db.session.execute(
+                    search_document_upsert(stype, profile_ids=profile_ids)
+                )
+            if project_ids:
+                db.session.execute(
+                    search_document_upsert(stype, project_ids=project_ids)
+                )
+        db.session.commit()
+
+
+@event.listens_for(DatabaseSession, 'after_flush')
+def _search_documents_refresh(session, flush_context):
+    """
+    Refresh search documents for searchable objects written in this flush.
+
+    A profile or project's own document is refreshed only if a column it is built
+    from has changed. If its visibility changed, all documents within it are
+    refreshed in a background job after commit. If it is deleted, all documents
+    within it are deleted. Changes to user and organization names are not tracked and
+    will only be reflected after ``flask reindex_search``.
+    """
+    if not search_documents_enabled():
+        return
+
+    object_ids: Dict[str, Set[int]] = defaultdict(set)
+    deleted_ids: Dict[str, Set[int]] = defaultdict(set)
+    deleted_scope: Dict[type, Set[int]] = {Profile: set(), Project: set()}
+
+    for obj in session.new:
+        if isinstance(obj, ProposalMembership):
+            # Collaborator names are part of a submission's search document
+            object_ids['submission'].add(obj.proposal_id)
+            continue
+        for stype, sp in search_providers.items():
+            if isinstance(obj, sp.model):
+                object_ids[stype].add(obj.id)
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, ProposalMembership):
+            object_ids['submission'].add(obj.proposal_id)
+            continue
+        model = type(obj) if type(obj) in search_document_columns else None
+        for stype, sp in search_providers.items():
+            if not isinstance(obj, sp.model):
+                continue
+            if model is None or _search_document_attrs_changed(
+                obj,
+                chain(
+                    search_document_columns[model], sp.model.search_vector.type.columns
+                ),
+            ):
+                object_ids[stype].add(obj.id)
+        if model is not None and _search_document_attrs_changed(
+            obj, search_document_scope_columns[model]
+        ):
+            scope = session.info.setdefault(
+                'search_documents_scope', {Profile: set(), Project: set()}
+            )
+            scope[model].add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, ProposalMembership):
+            object_ids['submission'].add(obj.proposal_id)
+            continue
+        for stype, sp in search_providers.items():
+            if isinstance(obj, sp.model):
+                deleted_ids[stype].add(obj.id)
+        if type(obj) in deleted_scope:
+            deleted_scope[type(obj)].add(obj.id)
+
+    if not (object_ids or deleted_ids):
+        return
+    connection = session.connection()
+    for stype, ids in deleted_ids.items():
+        connection.execute(
+            SearchDocument.__table__.delete().where(
+                SearchDocument.type == stype, SearchDocument.object_id.in_(ids)
+            )
+        )
+    # Objects within a deleted profile or project may not be loaded in the session,
+    # so their documents are deleted by scope
+    for column, ids in (
+        (SearchDocument.profile_id, deleted_scope[Profile]),
+        (SearchDocument.project_id, deleted_scope[Project]),
+    ):
+        if ids:
+            connection.execute(SearchDocument.__table__.delete().where(column.in_(ids)))
+    for stype in search_providers:
+        ids = object_ids[stype] - deleted_ids[stype]
+        if ids:
+            connection.execute(search_document_upsert(stype, object_ids=ids))
+
+
+@after_session_commit('search_documents_scope')
+def _search_documents_queue_scope_refresh(scope: Dict[type, Set[int]]) -> None:
+    """Queue a refresh of documents in profiles and projects whose visibility changed."""
+    refresh_search_documents.queue(sorted(scope[Profile]), sorted(scope[Project]))
+
+
+def search_document_query(
+    squery: str, profile: Optional[Profile] = None, project: Optional[Project] = None
+) -> Query:
+    """Return a query for search documents matching the query within a scope."""
+    query = SearchDocument.query.filter(SearchDocument.search_vector.match(squery))
+    if project is not None:
+        return query.filter(
+            SearchDocument.project_id == project.id,
+            SearchDocument.visible_project.is_(True),
+        )
+    if profile is not None:
+        return query.filter(
+            SearchDocument.profile_id == profile.id,
+            SearchDocument.visible_profile.is_(True),
+        )
+    return query.filter(SearchDocument.visible_site.is_(True))
+
+
+def search_document_counts(
+    squery: str, profile: Optional[Profile] = None, project: Optional[Project] = None
+) -> Dict[str, int]:
+    """Return counts of matching search documents for each type, in one query."""
+    counts = dict(
+        search_document_query(squery, profile, project)
+        .with_entities(SearchDocument.type, db.func.count('*'))
+        .group_by(SearchDocument.type)
+        .all()
+    )
+    return {
+        stype: counts.get(stype, 0)
+        for stype in search_providers_in_scope(profile, project)
+    }
+
+
 # --- Search functions --------------------------------------------------------
 
 
@@ -730,58 +1302,228 @@ class SearchCountType(TypedDict, total=False):
     type: str  # noqa: A003
     label: str
     count: int
-    job: Any
+    exact: bool
+
+
+def search_providers_in_scope(
+    profile: Optional[Profile] = None, project: Optional[Project] = None
+) -> Dict[str, SearchProvider]:
+    """Return search providers that support searching in the given scope."""
+    if project is not None:
+        return {
+            stype: sp
+            for stype, sp in search_providers.items()
+            if isinstance(sp, SearchInProjectProvider)
+        }
+    if profile is not None:
+        return {
+            stype: sp
+            for stype, sp in search_providers.items()
+            if isinstance(sp, SearchInProfileProvider)
+        }
+    return search_providers
+
+
+def search_count_is_exact(stype: str, count: int) -> bool:
+    """Confirm if a search count is exact (always so for search documents)."""
+    return search_documents_enabled() or search_providers[stype].count_is_exact(count)
 
 
-# @cache.memoize(timeout=300)
 def search_counts(
     squery: str, profile: Optional[Profile] = None, project: Optional[Project] = None
 ) -> List[SearchCountType]:
     """
     Return counts of search results.
 
-    This function requires an active request as it uses Flask-Executor to perform
-    queries in parallel.
+    Counts are cached against the query, scope and generation of searchable models
+    (see :func:`search_cache_key`). On a cache miss, this function requires an active
+    request as it uses Flask-Executor to perform queries in parallel, unless search
+    documents are enabled, in which case all counts come from a single query.
     """
-    results: List[SearchCountType]
-    if project is not None:
-        results = [
-            {
-                'type': stype,
-                'label': sp.label,
-                'job': executor.submit(sp.project_count, squery, project),
-            }
-            for stype, sp in search_providers.items()
-            if isinstance(sp, SearchInProjectProvider)
-        ]
-    elif profile is not None:
-        results = [
-            {
-                'type': stype,
-                'label': sp.label,
-                'job': executor.submit(sp.profile_count, squery, profile),
-            }
-            for stype, sp in search_providers.items()
-            if isinstance(sp, SearchInProfileProvider)
-        ]
+    cache_key = search_cache_key(squery, search_scope(profile, project))
+    counts: Optional[Dict[str, int]] = cache.get(cache_key)
+    if counts is not None:
+        statsd.incr('search.counts.cache', tags={'result': 'hit'})
     else:
-        # Not scoped to profile or project:
-        results = [
-            {
-                'type': stype,
-                'label': sp.label,
-                'job': executor.submit(sp.all_count, squery),
-            }
-            for stype, sp in search_providers.items()
+        statsd.incr('search.counts.cache', tags={'result': 'miss'})
+        if search_documents_enabled():
+            counts = search_document_counts(squery, profile, project)
+        else:
+            if project is not None:
+                jobs = {
+                    stype: executor.submit(sp.project_count, squery, project)
+                    for stype, sp in search_providers_in_scope(profile, project).items()
+                }
+            elif profile is not None:
+                jobs = {
+                    stype: executor.submit(sp.profile_count, squery, profile)
+                    for stype, sp in search_providers_in_scope(profile, project).items()
+                }
+            else:
+                # Not scoped to profile or project:
+                jobs = {
+                    stype: executor.submit(sp.all_count, squery)
+                    for stype, sp in search_providers.items()
+                }
+            # Collect results from all the background jobs
+            counts = {stype: job.result() for stype, job in jobs.items()}
+        # Cache only the counts, as labels are lazy strings rendered per request
+        cache.set(cache_key, counts, timeout=SEARCH_CACHE_TIMEOUT)
+
+    return [
+        {
+            'type': stype,
+            'label': search_providers[stype].label,
+            'count': count,
+            'exact': search_count_is_exact(stype, count),
+        }
+        for stype, count in counts.items()
+    ]
+
+
+class InexactPagination(Pagination):
+    """
+    Pagination with an inexact total.
+
+    The total is only indicative. Whether there is a next page is determined by
+    fetching an extra item, and pages beyond the next are not linked.
+    """
+
+    def __init__(self, query, page, per_page, total, items, has_next):
+        super().__init__(query, page, per_page, total, items)
+        self._has_next = has_next
+
+    @property
+    def pages(self) -> int:
+        """Return number of pages known to exist."""
+        return self.page + 1 if self._has_next else self.page
+
+    @property
+    def has_next(self) -> bool:
+        """Confirm if there is a next page."""
+        return self._has_next
+
+
+def paginate_with_total(
+    query: Query, page: int, per_page: int, total: int, exact: bool = True
+) -> Pagination:
+    """
+    Paginate a query using a known total, instead of running a count query.
+
+    If the total is not exact, it is only used for display. The next page is confirmed
+    by fetching an extra item, and the total is corrected on the last page.
+    """
+    # Replicate the checks in :meth:`~flask_sqlalchemy.BaseQuery.paginate`
+    per_page = min(per_page, 100)
+    if page < 1 or per_page < 0:
+        abort(404)
+    # Get an extra item to confirm there is a next page when the total is inexact
+    items = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+    if not items and page != 1:
+        abort(404)
+    if exact:
+        return Pagination(query, page, per_page, total, items[:per_page])
+    has_next = len(items) > per_page
+    seen = (page - 1) * per_page + min(len(items), per_page)
+    total = max(total, seen + 1) if has_next else seen
+    return InexactPagination(query, page, per_page, total, items[:per_page], has_next)
+
+
+def search_result_item(sp: SearchProvider, item, title, snippet, matched_text):
+    """Return a search result for JSON or template rendering."""
+    return {
+        'title': item.title if sp.has_title else None,
+        'title_html': escape_quotes(title) if title is not None else None,
+        'url': item.absolute_url + '#:~:text=' + clean_matched_text(matched_text),
+        'snippet_html': escape_quotes(snippet),
+        'obj': item.current_access(datasets=('primary', 'related')),
+    }
+
+
+def search_document_results(
+    squery: str,
+    stype: str,
+    page=1,
+    per_page=20,
+    profile: Optional[Profile] = None,
+    project: Optional[Project] = None,
+    cursor: Optional[str] = None,
+):
+    """Return search results using search documents. See :func:`search_results`."""
+    sp = search_providers[stype]
+    query = search_document_query(squery, profile, project).filter(
+        SearchDocument.type == stype
+    )
+    rank = db.func.ts_rank_cd(SearchDocument.search_vector, squery, type_=db.REAL)
+    regconfig = SearchDocument.search_vector.type.options.get('regconfig', 'english')
+    result_query = query.with_entities(
+        SearchDocument.object_id,
+        SearchDocument.created_at,
+        headline_title(regconfig, SearchDocument.title, squery),
+        headline_snippet(regconfig, SearchDocument.hltext, squery),
+        headline_matched_text(regconfig, SearchDocument.hltext, squery),
+        rank,
+    )
+
+    def result_items(rows):
+        objects = {
+            obj.id: obj
+            for obj in sp.model.query.filter(sp.model.id.in_([row[0] for row in rows]))
+        }
+        # Skip documents for objects that were removed after the query
+        return [
+            search_result_item(sp, objects[object_id], title, snippet, matched_text)
+            for object_id, _created_at, title, snippet, matched_text, _rank in rows
+            if object_id in objects
         ]
-    # Collect results from all the background jobs
-    for resultset in results:
-        resultset['count'] = resultset.pop('job').result()
-    # Return collected counts
-    return results
+
+    if cursor is not None:
+        rows, next_cursor = keyset_paginate(
+            result_query,
+            (rank, SearchDocument.created_at, SearchDocument.object_id),
+            lambda row: (row[-1], row[1], row[0]),
+            cursor=cursor,
+            per_page=per_page,
+        )
+        return {
+            'items': result_items(rows),
+            'has_next': next_cursor is not None,
+            'per_page': min(per_page, 100),
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+        }
+
+    counts: Optional[Dict[str, int]] = cache.get(
+        search_cache_key(squery, search_scope(profile, project))
+    )
+    if counts is not None and stype in counts:
+        total = counts[stype]
+    else:
+        total = query.order_by(None).count()
+    pagination = paginate_with_total(
+        result_query.order_by(
+            rank.desc(),
+            SearchDocument.created_at.desc(),
+            SearchDocument.object_id.desc(),
+        ),
+        page,
+        per_page,
+        total,
+    )
+    return {
+        'items': result_items(pagination.items),
+        'has_next': pagination.has_next,
+        'has_prev': pagination.has_prev,
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'pages': pagination.pages,
+        'next_num': pagination.next_num,
+        'prev_num': pagination.prev_num,
+        'count': pagination.total,
+        'exact': True,
+    }
 
 
-# @cache.memoize(timeout=300)
 def search_results(
     squery: str,
     stype: str,
@@ -789,44 +1531,92 @@ def search_results(
     per_page=20,
     profile: Optional[Profile] = None,
     project: Optional[Project] = None,
+    cursor: Optional[str] = None,
 ):
-    """Return search results."""
+    """
+    Return search results.
+
+    If a cursor is specified (blank for the first page), results are paginated by
+    seeking on rank, creation timestamp and id (see :func:`keyset_paginate`), with a
+    continuation token for the next page in ``next_cursor``, and without page numbers
+    or a count. Otherwise results are paginated with page numbers.
+
+    If counts for this query are in cache (as populated by :func:`search_counts`), the
+    total is taken from there instead of running another count query. If the count is
+    not exact (see :attr:`SearchProvider.count_strategy`), it is treated as a lower
+    bound and pagination continues for as long as there are more results.
+    """
     # Pick up model data for the given type string
     sp = search_providers[stype]
 
     if project is not None:
         if not isinstance(sp, SearchInProjectProvider):
             raise TypeError(f"No project search for {sp.label}")
-        query = sp.project_query(squery, project)
     elif profile is not None:
         if not isinstance(sp, SearchInProfileProvider):
             raise TypeError(f"No profile search for {sp.label}")
+
+    if search_documents_enabled():
+        return search_document_results(
+            squery, stype, page, per_page, profile, project, cursor
+        )
+
+    if project is not None:
+        query = sp.project_query(squery, project)
+    elif profile is not None:
         query = sp.profile_query(squery, profile)
     else:
         query = sp.all_query(squery)
 
+    if cursor is not None:
+        rank = sp.rank_column(squery)
+        items, next_cursor = keyset_paginate(
+            query.add_columns(
+                sp.hltitle_column(squery),
+                sp.hlsnippet_column(squery),
+                sp.matched_text_column(squery),
+                rank,
+            ),
+            (rank, sp.model.created_at, sp.model.id),
+            lambda row: (row[-1], row[0].created_at, row[0].id),
+            cursor=cursor,
+            per_page=per_page,
+        )
+        return {
+            'items': [search_result_item(sp, *row[:-1]) for row in items],
+            'has_next': next_cursor is not None,
+            'per_page': min(per_page, 100),
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+        }
+
+    counts: Optional[Dict[str, int]] = cache.get(
+        search_cache_key(squery, search_scope(profile, project))
+    )
+    total: Optional[int]
+    if counts is not None and stype in counts:
+        total = counts[stype]
+    elif sp.count_strategy != 'exact':
+        total = sp.count(query)
+    else:
+        total = None
+
     # Add the three additional columns to the query and paginate results
     query = query.add_columns(
         sp.hltitle_column(squery),
         sp.hlsnippet_column(squery),
         sp.matched_text_column(squery),
     )
-    pagination = query.paginate(page=page, per_page=per_page, max_per_page=100)
+    if total is not None:
+        pagination = paginate_with_total(
+            query, page, per_page, total, exact=sp.count_is_exact(total)
+        )
+    else:
+        pagination = query.paginate(page=page, per_page=per_page, max_per_page=100)
 
     # Return a page of results
     return {
-        'items': [
-            {
-                'title': item.title if sp.has_title else None,
-                'title_html': escape_quotes(title) if title is not None else None,
-                'url': item.absolute_url
-                + '#:~:text='
-                + clean_matched_text(matched_text),
-                'snippet_html': escape_quotes(snippet),
-                'obj': item.current_access(datasets=('primary', 'related')),
-            }
-            for item, title, snippet, matched_text in pagination.items
-        ],
+        'items': [search_result_item(sp, *row) for row in pagination.items],
         'has_next': pagination.has_next,
         'has_prev': pagination.has_prev,
         'page': pagination.page,
@@ -835,6 +1625,7 @@ def search_results(
         'next_num': pagination.next_num,
         'prev_num': pagination.prev_num,
         'count': pagination.total,
+        'exact': sp.count_is_exact(pagination.total),
     }
 
 
@@ -844,8 +1635,10 @@ class SearchView(ClassView):
 
     @route('/search')
     @render_with('search.html.jinja2', json=True)
-    @requestargs(('q', abort_null), ('page', int), ('per_page', int))
-    def search(self, q=None, page=1, per_page=20):
+    @requestargs(
+        ('q', abort_null), ('page', int), ('per_page', int), ('cursor', abort_null)
+    )
+    def search(self, q=None, page=1, per_page=20, cursor=None):
         """Perform site-level search."""
         squery = get_squery(q)
         # Can't use @requestargs for stype as it doesn't support name changes
@@ -857,7 +1650,9 @@ class SearchView(ClassView):
         return {
             'type': stype,
             'counts': search_counts(squery),
-            'results': search_results(squery, stype, page=page, per_page=per_page),
+            'results': search_results(
+                squery, stype, page=page, per_page=per_page, cursor=cursor
+            ),
         }
 
 
@@ -870,8 +1665,10 @@ class ProfileSearchView(ProfileViewMixin, UrlForView, ModelView):
     @route('search')
     @render_with('search.html.jinja2', json=True)
     @requires_roles({'reader', 'admin'})
-    @requestargs(('q', abort_null), ('page', int), ('per_page', int))
-    def search(self, q=None, page=1, per_page=20):
+    @requestargs(
+        ('q', abort_null), ('page', int), ('per_page', int), ('cursor', abort_null)
+    )
+    def search(self, q=None, page=1, per_page=20, cursor=None):
         """Perform search within a profile."""
         squery = get_squery(q)
         stype = abort_null(
@@ -890,7 +1687,12 @@ class ProfileSearchView(ProfileViewMixin, UrlForView, ModelView):
             'type': stype,
             'counts': search_counts(squery, profile=self.obj),
             'results': search_results(
-                squery, stype, page=page, per_page=per_page, profile=self.obj
+                squery,
+                stype,
+                page=page,
+                per_page=per_page,
+                profile=self.obj,
+                cursor=cursor,
             ),
         }
 
@@ -904,8 +1706,10 @@ class ProjectSearchView(ProjectViewMixin, UrlForView, ModelView):
     @route('search')
     @render_with('search.html.jinja2', json=True)
     @requires_roles({'reader', 'crew', 'participant'})
-    @requestargs(('q', abort_null), ('page', int), ('per_page', int))
-    def search(self, q=None, page=1, per_page=20):
+    @requestargs(
+        ('q', abort_null), ('page', int), ('per_page', int), ('cursor', abort_null)
+    )
+    def search(self, q=None, page=1, per_page=20, cursor=None):
         """Perform search within a project."""
         squery = get_squery(q)
         stype = abort_null(
@@ -928,7 +1732,12 @@ class ProjectSearchView(ProjectViewMixin, UrlForView, ModelView):
             'type': stype,
             'counts': search_counts(squery, project=self.obj),
             'results': search_results(
-                squery, stype, page=page, per_page=per_page, project=self.obj
+                squery,
+                stype,
+                page=page,
+                per_page=per_page,
+                project=self.obj,
+                cursor=cursor,
             ),
         }
 
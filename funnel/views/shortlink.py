@@ -1,12 +1,149 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from threading import Lock
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+import json
+import time
 
-from flask import abort, redirect
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session as DatabaseSession
 
-from .. import app, shortlinkapp
-from ..models import Shortlink
-from .helpers import app_url_for
+from flask import abort, redirect, request
+
+from redis.exceptions import LockError, RedisError
+import geoip2.errors
+import user_agents
+
+from .. import app, redis_store, shortlinkapp
+from ..models import Shortlink, ShortlinkClickCount, db
+from ..models.shortlink import name_to_bigint
+from .helpers import after_session_commit, app_url_for
+
+#: Seconds for which a shortlink is kept in Redis
+SHORTLINK_CACHE_TIMEOUT = 86400
+#: Seconds for which a missing shortlink is remembered in Redis
+SHORTLINK_MISSING_TIMEOUT = 60
+#: Seconds for which a shortlink is kept in process memory. This is not invalidated
+#: across processes, so a disabled shortlink may redirect for this long
+SHORTLINK_LOCAL_TIMEOUT = 60
+#: Number of shortlinks kept in process memory
+SHORTLINK_LOCAL_SIZE = 4096
+#: Redis stream of clicks waiting to be counted
+shortlink_click_stream = 'shortlink/clicks'
+#: Approximate limit on the length of the click stream, in case it is not processed
+SHORTLINK_CLICK_STREAM_MAXLEN = 1000000
+#: Redis lock held while counting clicks, so that overlapping runs don't count the same
+#: clicks
+shortlink_click_lock_key = 'shortlink/clicks/lock'
+#: Seconds a run may hold the lock for each batch, after which it is released
+SHORTLINK_CLICK_LOCK_TIMEOUT = 300
+
+
+class CachedShortlink(NamedTuple):
+    """Cached details of a shortlink, sufficient to serve a redirect."""
+
+    id: int  # noqa: A003
+    url: str
+    enabled: bool
+
+
+class LocalShortlinkCache:
+    """Small in-process LRU cache of shortlinks, with expiry."""
+
+    def __init__(self, size: int, timeout: int) -> None:
+        self.size = size
+        self.timeout = timeout
+        self.lock = Lock()
+        self.data: OrderedDict[int, tuple] = OrderedDict()
+
+    def get(self, idv: int) -> Optional[CachedShortlink]:
+        with self.lock:
+            entry = self.data.get(idv)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.data[idv]
+                return None
+            self.data.move_to_end(idv)
+            return entry[1]
+
+    def set(self, idv: int, value: CachedShortlink) -> None:  # noqa: A003
+        with self.lock:
+            self.data[idv] = (time.monotonic() + self.timeout, value)
+            self.data.move_to_end(idv)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def discard(self, idv: int) -> None:
+        with self.lock:
+            self.data.pop(idv, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+
+
+local_shortlink_cache = LocalShortlinkCache(
+    SHORTLINK_LOCAL_SIZE, SHORTLINK_LOCAL_TIMEOUT
+)
+
+
+def shortlink_cache_key(idv: int) -> str:
+    """Return the Redis key for a shortlink's id."""
+    return f'shortlink/{idv}'
+
+
+def shortlink_cache_value(shortlink: Shortlink) -> str:
+    """Return the Redis value for a shortlink."""
+    return json.dumps([str(shortlink.url), shortlink.enabled])
+
+
+def get_cached_shortlink(name: str) -> Optional[CachedShortlink]:
+    """
+    Return the URL and enabled flag of a shortlink, from cache if possible.
+
+    Looks in process memory, then Redis, and finally the database, filling the caches
+    as it goes. If Redis is unavailable, the database is used. Returns `None` if there
+    is no such shortlink.
+    """
+    try:
+        idv = name_to_bigint(name)
+    except (ValueError, TypeError):
+        return None
+    cached = local_shortlink_cache.get(idv)
+    if cached is not None:
+        return cached
+    cache_key = shortlink_cache_key(idv)
+    try:
+        value = redis_store.get(cache_key)
+    except RedisError:
+        app.logger.warning("Redis unavailable, loading shortlink from database")
+        sl = Shortlink.get(name, True)
+        if sl is None:
+            return None
+        return CachedShortlink(idv, str(sl.url), sl.enabled)
+    if value is None:
+        sl = Shortlink.get(name, True)
+        if sl is None:
+            value, timeout = 'null', SHORTLINK_MISSING_TIMEOUT
+        else:
+            value, timeout = shortlink_cache_value(sl), SHORTLINK_CACHE_TIMEOUT
+        try:
+            redis_store.set(cache_key, value, ex=timeout)
+        except RedisError:
+            # The database has answered, so the redirect need not fail with Redis
+            app.logger.warning("Redis unavailable, not caching shortlink")
+    data = json.loads(value)
+    if data is None:
+        return None
+    cached = CachedShortlink(idv, *data)
+    local_shortlink_cache.set(idv, cached)
+    return cached
 
 
 @shortlinkapp.route('/')
@@ -16,12 +153,12 @@ def index():
 
 @shortlinkapp.route('/<name>')
 def link(name):
-    sl = Shortlink.get(name, True)
+    sl = get_cached_shortlink(name)
     if sl is None:
         abort(404)
     if not sl.enabled:
         abort(410)
-    response = redirect(str(sl.url), 301)
+    response = redirect(sl.url, 301)
     response.cache_control.private = True
     response.cache_control.max_age = 90
     response.expires = datetime.utcnow() + timedelta(seconds=90)
@@ -30,5 +167,193 @@ def link(name):
     # send it again to the destination URL
     response.content_security_policy['referrer'] = 'always'  # Needs Werkzeug >= 2.0.2
     response.headers['Referrer-Policy'] = 'unsafe-url'
-    # TODO: Perform analytics here: log client, set session cookie, etc
+    # Record the click after the response is sent, so as to not delay the redirect
+    click = (
+        sl.id,
+        time.time(),
+        request.referrer or '',
+        request.user_agent.string or '',
+        request.remote_addr or '',
+    )
+    response.call_on_close(lambda: record_shortlink_click(*click))
     return response
+
+
+# --- Click analytics ------------------------------------------------------------------
+
+
+def record_shortlink_click(
+    shortlink_id: int, timestamp: float, referrer: str, user_agent: str, ipaddr: str
+) -> None:
+    """Add a click to the Redis stream, to be counted by :func:`count_shortlink_clicks`."""
+    try:
+        redis_store.xadd(
+            shortlink_click_stream,
+            {
+                'id': shortlink_id,
+                'ts': timestamp,
+                'referrer': referrer[:1000],
+                'ua': user_agent[:250],
+                'ip': ipaddr,
+            },
+            maxlen=SHORTLINK_CLICK_STREAM_MAXLEN,
+            approximate=True,
+        )
+    except RedisError:
+        # Clicks are analytics, not worth failing on
+        app.logger.warning("Redis unavailable, shortlink click not recorded")
+
+
+def user_agent_class(user_agent: str) -> str:
+    """Classify a user agent string as a type of client."""
+    ua = user_agents.parse(user_agent)
+    if ua.is_bot:
+        return 'bot'
+    if ua.is_mobile:
+        return 'mobile'
+    if ua.is_tablet:
+        return 'tablet'
+    if ua.is_pc:
+        return 'desktop'
+    return 'other'
+
+
+def ipaddr_country(ipaddr: str) -> str:
+    """Return the ISO country code for an IP address, or blank if unknown."""
+    if not ipaddr or app.geoip_city is None:
+        return ''
+    try:
+        return app.geoip_city.city(ipaddr).country.iso_code or ''
+    except (ValueError, geoip2.errors.GeoIP2Error):
+        return ''
+
+
+def referrer_host(referrer: str) -> str:
+    """Return the host name in a referrer URL, or blank if it can't be parsed."""
+    try:
+        return (urlsplit(referrer).hostname or '')[:253]
+    except ValueError:
+        # The Referer header is client-supplied and may be malformed
+        return ''
+
+
+#: Columns that identify a row in :class:`ShortlinkClickCount`
+click_count_keys = ('shortlink_id', 'hour', 'referrer', 'ua_class', 'country')
+
+
+def _count_shortlink_click_batch(entries: List[Tuple[str, Dict[str, str]]]) -> None:
+    """Add a batch of clicks from the Redis stream to hourly counts and commit."""
+    counts: Counter = Counter()
+    for entry_id, fields in entries:
+        try:
+            key = (
+                int(fields['id']),
+                datetime.fromtimestamp(float(fields['ts']), timezone.utc).replace(
+                    minute=0, second=0, microsecond=0
+                ),
+                referrer_host(fields['referrer']),
+                user_agent_class(fields['ua']),
+                ipaddr_country(fields['ip']),
+            )
+        except (KeyError, ValueError, TypeError, OverflowError):
+            # Skip a malformed entry instead of holding up the stream
+            app.logger.warning("Skipping malformed shortlink click %s", entry_id)
+            continue
+        counts[key] += 1
+    # Skip shortlinks that have been deleted since the click
+    shortlink_ids = {
+        shortlink_id
+        for shortlink_id, in db.session.query(Shortlink.id).filter(
+            Shortlink.id.in_({key[0] for key in counts})
+        )
+    }
+    rows = [
+        dict(zip(click_count_keys, key), count=count)
+        for key, count in counts.items()
+        if key[0] in shortlink_ids
+    ]
+    if rows:
+        statement = pg_insert(ShortlinkClickCount.__table__).values(rows)
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=click_count_keys,
+                set_={
+                    'count': ShortlinkClickCount.__table__.c.count
+                    + statement.excluded.count
+                },
+            )
+        )
+        db.session.commit()
+
+
+def count_shortlink_clicks(batch_size: int = 1000) -> int:
+    """
+    Add clicks recorded in the Redis stream to hourly counts in the database.
+
+    Clicks are removed from the stream once counted. Malformed clicks are skipped and
+    removed. Only one run counts clicks at a time; overlapping runs return immediately.
+    Returns the number of clicks.
+    """
+    lock = redis_store.lock(
+        shortlink_click_lock_key,
+        timeout=SHORTLINK_CLICK_LOCK_TIMEOUT,
+        blocking_timeout=0,
+    )
+    if not lock.acquire():
+        return 0
+    total = 0
+    try:
+        while True:
+            entries = redis_store.xrange(shortlink_click_stream, count=batch_size)
+            if not entries:
+                return total
+            _count_shortlink_click_batch(entries)
+            redis_store.xdel(
+                shortlink_click_stream, *(entry_id for entry_id, _fields in entries)
+            )
+            total += len(entries)
+            lock.reacquire()
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            # The lock expired and may now be held by another run
+            pass
+
+
+# --- Cache maintenance ----------------------------------------------------------------
+
+
+@event.listens_for(DatabaseSession, 'after_flush')
+def _shortlink_track_writes(session, flush_context):
+    """Record new, changed and deleted shortlinks in this transaction."""
+    written: Dict[int, Optional[str]] = session.info.setdefault('shortlink_written', {})
+    for obj in chain(session.new, session.dirty):
+        if isinstance(obj, Shortlink):
+            written[obj.id] = shortlink_cache_value(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Shortlink):
+            written[obj.id] = None
+
+
+@after_session_commit('shortlink_written')
+def _shortlink_update_cache(written: Dict[int, Optional[str]]) -> None:
+    """
+    Update the cache with shortlinks written in the transaction.
+
+    New shortlinks are added to the cache right away, as shortlinks are usually made
+    for a notification that is about to be sent.
+    """
+    pipe = redis_store.pipeline()
+    for idv, value in written.items():
+        local_shortlink_cache.discard(idv)
+        if value is None:
+            pipe.delete(shortlink_cache_key(idv))
+        else:
+            pipe.set(shortlink_cache_key(idv), value, ex=SHORTLINK_CACHE_TIMEOUT)
+    try:
+        pipe.execute()
+    except RedisError:
+        # The transaction is already committed and must not fail now. Redis will
+        # have stale entries for these shortlinks until they expire
+        app.logger.exception("Unable to update shortlinks in Redis")
@@ -8,7 +8,7 @@ from flask import abort, flash, jsonify, redirect, request, url_for
 
 from baseframe import _, forms, request_is_xhr
 from baseframe.forms import render_form
-from coaster.utils import getbool, uuid_to_base58
+from coaster.utils import getbool, make_name, uuid_to_base58
 from coaster.views import (
     ClassView,
     ModelView,
@@ -31,7 +31,7 @@ from ..models import (
 )
 from ..typing import ReturnView
 from ..utils import abort_null, format_twitter_handle, make_qrcode, split_name
-from .helpers import mask_email
+from .helpers import csv_response, mask_email
 from .login_session import requires_login
 from .mixins import ProfileCheckMixin, ProjectViewMixin, TicketEventViewMixin
 
@@ -265,6 +265,39 @@ class TicketEventParticipantView(TicketEventViewMixin, UrlForView, ModelView):
             'total_checkedin': checkin_count,
         }
 
+    @route('ticket_participants.csv')
+    @requires_roles({'project_promoter'})
+    def participants_csv(self):
+        """Return a CSV of ticket participants and their check-in status."""
+        return csv_response(
+            [
+                'fullname',
+                'email',
+                'company',
+                'twitter',
+                'ticket_types',
+                'checked_in',
+                'badge_printed',
+            ],
+            (
+                [
+                    ticket_participant.fullname,
+                    ticket_participant.email,
+                    ticket_participant.company,
+                    ticket_participant.twitter,
+                    ticket_participant.ticket_type_titles,
+                    ticket_participant.checked_in,
+                    ticket_participant.badge_printed,
+                ]
+                for ticket_participant in TicketParticipant.checkin_list(
+                    self.obj
+                ).yield_per(1000)
+            ),
+            filename='ticket-participants-{project}-{ticket_event}'.format(
+                project=make_name(self.obj.project.title), ticket_event=self.obj.name
+            ),
+        )
+
     @route('badges')
     @render_with('badge.html.jinja2')
     @requires_roles({'project_promoter', 'project_usher'})
@@ -11,6 +11,9 @@ SQLALCHEMY_DATABASE_URI = 'postgresql://host/database'
 SQLALCHEMY_BINDS = {
     'geoname': 'postgresql://host/geoname',
 }
+#: Gazetteer file made by `flask geoname gazetteer`, for location lookups without
+#: loading names from the geoname database in each worker
+GEONAME_GAZETTEER = 'geoname_data/gazetteer.pickle'
 #: Shortlink domain for SMS links (must be served via wsgi:shortlinkapp)
 SHORTLINK_DOMAIN = 'domain.tld'
 #: Secret keys
@@ -48,6 +51,21 @@ RQ_REDIS_URL = 'redis://localhost:6379/0'
 RQ_SCHEDULER_INTERVAL = 1
 DEBUG = True
 
+#: Search using the precomputed search document table. Run `flask reindex_search`
+#: after migrating, before enabling this
+SEARCH_DOCUMENTS = False
+
+#: Record user session access in Redis instead of the database on every request.
+#: Requires `flask periodic user_session_access` to be run every minute
+USER_SESSION_WRITE_BEHIND = False
+
+#: Queue SES delivery events in Redis instead of processing them in the request.
+#: Requires `flask periodic ses_events` to be run every minute. Events that can't be
+#: processed are set aside in the Redis list `email_address/ses_events/failed`
+SES_EVENT_QUEUE = False
+#: Folder to keep SNS signing certificates in, for when they are not in Redis
+SES_CERTIFICATE_CACHE_DIR = None
+
 #: Twitter integration
 OAUTH_TWITTER_KEY = ''  # nosec
 OAUTH_TWITTER_SECRET = ''  # nosec  # noqa: S105
@@ -0,0 +1,86 @@
+"""Add search document table.
+
+Revision ID: 53ce024e2691
+Revises: 0fae06340346
+Create Date: 2026-10-18 09:12:40.218375
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+# revision identifiers, used by Alembic.
+revision = '53ce024e2691'
+down_revision = '0fae06340346'
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name=''):
+    # Do not modify. Edit `upgrade_` instead
+    globals().get('upgrade_%s' % engine_name, lambda: None)()
+
+
+def downgrade(engine_name=''):
+    # Do not modify. Edit `downgrade_` instead
+    globals().get('downgrade_%s' % engine_name, lambda: None)()
+
+
+def upgrade_():
+    op.create_table(
+        'search_document',
+        sa.Column('type', sa.Unicode(), nullable=False),
+        sa.Column('object_id', sa.Integer(), nullable=False),
+        sa.Column('profile_id', sa.Integer(), nullable=True),
+        sa.Column('project_id', sa.Integer(), nullable=True),
+        sa.Column('visible_site', sa.Boolean(), nullable=False),
+        sa.Column('visible_profile', sa.Boolean(), nullable=False),
+        sa.Column('visible_project', sa.Boolean(), nullable=False),
+        sa.Column(
+            'search_vector',
+            sqlalchemy_utils.types.ts_vector.TSVectorType(),
+            nullable=False,
+        ),
+        sa.Column('title', sa.UnicodeText(), nullable=True),
+        sa.Column('hltext', sa.UnicodeText(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['profile_id'], ['profile.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['project_id'], ['project.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('type', 'object_id'),
+    )
+    op.create_index(
+        op.f('ix_search_document_profile_id'),
+        'search_document',
+        ['profile_id'],
+        unique=False,
+    )
+    op.create_index(
+        op.f('ix_search_document_project_id'),
+        'search_document',
+        ['project_id'],
+        unique=False,
+    )
+    op.create_index(
+        'ix_search_document_search_vector',
+        'search_document',
+        ['search_vector'],
+        unique=False,
+        postgresql_using='gin',
+    )
+    # Documents are populated with `flask reindex_search`
+
+
+def downgrade_():
+    op.drop_index('ix_search_document_search_vector', table_name='search_document')
+    op.drop_index(op.f('ix_search_document_project_id'), table_name='search_document')
+    op.drop_index(op.f('ix_search_document_profile_id'), table_name='search_document')
+    op.drop_table('search_document')
+
+
+def upgrade_geoname():
+    pass
+
+
+def downgrade_geoname():
+    pass
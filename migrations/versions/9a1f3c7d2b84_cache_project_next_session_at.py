@@ -0,0 +1,65 @@
+"""Cache project next session timestamp.
+
+Revision ID: 9a1f3c7d2b84
+Revises: 53ce024e2691
+Create Date: 2026-10-18 11:04:27.531094
+
+"""
+
+from textwrap import dedent
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '9a1f3c7d2b84'
+down_revision = '53ce024e2691'
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name=''):
+    # Do not modify. Edit `upgrade_` instead
+    globals().get('upgrade_%s' % engine_name, lambda: None)()
+
+
+def downgrade(engine_name=''):
+    # Do not modify. Edit `downgrade_` instead
+    globals().get('downgrade_%s' % engine_name, lambda: None)()
+
+
+def upgrade_():
+    op.add_column(
+        'project',
+        sa.Column('next_session_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.create_index(
+        op.f('ix_project_next_session_at'), 'project', ['next_session_at'], unique=False
+    )
+    op.execute(
+        sa.DDL(
+            dedent(
+                '''
+            UPDATE project SET next_session_at = (
+                SELECT MIN(session.start_at) FROM session
+                WHERE session.project_id = project.id
+                AND session.start_at IS NOT NULL
+                AND session.start_at >= utcnow()
+            );
+            '''
+            )
+        )
+    )
+
+
+def downgrade_():
+    op.drop_index(op.f('ix_project_next_session_at'), table_name='project')
+    op.drop_column('project', 'next_session_at')
+
+
+def upgrade_geoname():
+    pass
+
+
+def downgrade_geoname():
+    pass
@@ -0,0 +1,42 @@
+"""Add digest to sync ticket.
+
+Revision ID: c4e2a8f61d37
+Revises: 9a1f3c7d2b84
+Create Date: 2026-10-18 13:42:10.218734
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'c4e2a8f61d37'
+down_revision = '9a1f3c7d2b84'
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name=''):
+    # Do not modify. Edit `upgrade_` instead
+    globals().get('upgrade_%s' % engine_name, lambda: None)()
+
+
+def downgrade(engine_name=''):
+    # Do not modify. Edit `downgrade_` instead
+    globals().get('downgrade_%s' % engine_name, lambda: None)()
+
+
+def upgrade_():
+    op.add_column('sync_ticket', sa.Column('digest', sa.LargeBinary(), nullable=True))
+
+
+def downgrade_():
+    op.drop_column('sync_ticket', 'digest')
+
+
+def upgrade_geoname():
+    pass
+
+
+def downgrade_geoname():
+    pass
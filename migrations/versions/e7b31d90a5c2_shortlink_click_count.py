@@ -0,0 +1,54 @@
+"""Add shortlink click count.
+
+Revision ID: e7b31d90a5c2
+Revises: c4e2a8f61d37
+Create Date: 2026-10-18 15:06:51.842913
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e7b31d90a5c2'
+down_revision = 'c4e2a8f61d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade(engine_name=''):
+    # Do not modify. Edit `upgrade_` instead
+    globals().get('upgrade_%s' % engine_name, lambda: None)()
+
+
+def downgrade(engine_name=''):
+    # Do not modify. Edit `downgrade_` instead
+    globals().get('downgrade_%s' % engine_name, lambda: None)()
+
+
+def upgrade_():
+    op.create_table(
+        'shortlink_click_count',
+        sa.Column('shortlink_id', sa.BigInteger(), nullable=False),
+        sa.Column('hour', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('referrer', sa.Unicode(length=253), nullable=False),
+        sa.Column('ua_class', sa.Unicode(length=7), nullable=False),
+        sa.Column('country', sa.Unicode(length=2), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['shortlink_id'], ['shortlink.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(
+            'shortlink_id', 'hour', 'referrer', 'ua_class', 'country'
+        ),
+    )
+
+
+def downgrade_():
+    op.drop_table('shortlink_click_count')
+
+
+def upgrade_geoname():
+    pass
+
+
+def downgrade_geoname():
+    pass
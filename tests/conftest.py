@@ -147,15 +147,18 @@ def db_session(database, db_connection):
     database.session = database.create_scoped_session(
         options={'bind': db_connection, 'binds': {}}
     )
-    database.session.begin_nested()
+    # The savepoint is on the connection and not in the session, so that a commit in
+    # the session is an outermost commit and runs listeners that skip savepoints
+    nested = db_connection.begin_nested()
 
     # for handling tests that actually call `session.rollback()`
-    # https://docs.sqlalchemy.org/en/13/orm/session_transaction.html#joining-a-session-into-an-external-transaction-such-as-for-test-suites
+    # https://docs.sqlalchemy.org/en/14/orm/session_transaction.html#joining-a-session-into-an-external-transaction-such-as-for-test-suites
     @event.listens_for(database.session, 'after_transaction_end')
     def restart_savepoint(session, transaction_in):
-        if transaction_in.nested and not transaction_in._parent.nested:
+        nonlocal nested
+        if not nested.is_active:
             session.expire_all()
-            session.begin_nested()
+            nested = db_connection.begin_nested()
 
     yield database.session
 
@@ -6,6 +6,7 @@ import pytest
 
 from funnel.models import BaseMixin, db
 from funnel.models.email_address import (
+    EMAIL_DELIVERY_STATE,
     EmailAddress,
     EmailAddressBlockedError,
     EmailAddressInUseError,
@@ -379,6 +380,37 @@ def test_email_address_delivery_state(db_session):
     assert str(ea.delivery_state_at) == str(db.func.utcnow())
 
 
+def test_email_address_mark_sent_batch(db_session):
+    """Sent status can be recorded for many email addresses at once."""
+    ea1 = EmailAddress.add('example1@example.com')
+    ea2 = EmailAddress.add('example2@example.com')
+    ea2.mark_hard_fail()
+    db_session.commit()
+    assert ea1.delivery_state.UNKNOWN
+    assert ea2.delivery_state.HARD_FAIL
+
+    ea3 = EmailAddress.add('example3@example.com')
+    db_session.flush()
+    EmailAddress.mark_sent_batch({ea1.id, ea2.id, ea3.id})
+    db_session.commit()
+    assert ea1.delivery_state.SENT
+    assert ea2.delivery_state.SENT
+    assert ea3.delivery_state.SENT
+
+
+def test_email_address_mark_delivery_state_batch(db_session):
+    """Batch updates of expired addresses don't reload them, and new ones are flushed."""
+    ea1 = EmailAddress.add('example1@example.com')
+    db_session.commit()
+    db_session.expire(ea1)  # As a commit would with expire_on_commit
+    ea2 = EmailAddress.add('example2@example.com')
+    EmailAddress.mark_delivery_state_batch([ea1, ea2], EMAIL_DELIVERY_STATE.SENT)
+    assert 'id' not in db.inspect(ea1).dict  # Not reloaded for its id
+    db_session.commit()
+    assert ea1.delivery_state.SENT
+    assert ea2.delivery_state.SENT
+
+
 # This fixture must be session scope as it cannot be called twice in the same process.
 # SQLAlchemy models must only be defined once.
 @pytest.fixture(scope='session')
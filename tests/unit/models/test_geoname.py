@@ -0,0 +1,51 @@
+"""Tests for the geoname gazetteer."""
+
+from funnel.models import GeoGazetteer
+
+gazetteer = GeoGazetteer.from_rows(
+    [
+        (1, 'IN', 'P', 12_000_000),  # Bangalore
+        (2, 'IN', 'A', 64_000_000),  # Karnataka
+        (3, 'US', 'P', 8_000_000),  # New York City
+        (4, 'US', 'A', 19_000_000),  # New York State
+        (5, 'US', 'P', 100),  # A small Bangalore
+    ],
+    [
+        (1, None, 'Bangalore'),
+        (1, 'kn', 'Bengaluru'),
+        (2, None, 'Karnataka'),
+        (3, None, 'New York'),
+        (4, None, 'New York'),
+        (5, None, 'Bangalore'),
+        (9, None, 'Unknown'),  # Not a loaded geoname
+    ],
+)
+
+
+def test_gazetteer_lookup():
+    """Lookups ignore case and rank cities over states and then by population."""
+    assert gazetteer.lookup('BANGALORE') == ((1, None), (5, None))
+    assert gazetteer.lookup('new york') == ((3, None), (4, None))
+    assert gazetteer.lookup('unknown') == ()
+
+
+def test_gazetteer_match_tokens():
+    """The longest title is matched from a sequence of tokens."""
+    assert gazetteer.match_tokens(['new', ' ', 'york', ', ', 'usa']) == (
+        3,
+        [(3, None), (4, None)],
+    )
+    assert gazetteer.match_tokens(['bengaluru', ' ', 'karnataka']) == (
+        1,
+        [(1, 'kn')],
+    )
+    assert gazetteer.match_tokens(['new', ' ', 'delhi']) == (0, [])
+
+
+def test_gazetteer_complete():
+    """Prefix completion returns the largest geonames first."""
+    assert gazetteer.complete('ban') == [1, 5]
+    assert gazetteer.complete('b') == [1, 5]
+    assert gazetteer.complete('b', lang='en') == [1, 5]
+    assert gazetteer.complete('ka', limit=1) == [2]
+    assert gazetteer.complete('') == []
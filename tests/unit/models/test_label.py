@@ -1,6 +1,6 @@
 import pytest
 
-from funnel.models import Label
+from funnel.models import Label, ProjectLabelIndex
 
 
 def test_main_label_from_fixture(new_main_label):
@@ -71,3 +71,32 @@ def test_label_archived(new_label):
     new_label.archived = True
     assert new_label._archived is True
     assert new_label.archived is True  # type: ignore[unreachable]
+
+
+def test_label_index(db_session, new_main_label, new_label, new_proposal):
+    """Proposal labels are read and set using a per-project index."""
+    project = new_proposal.project
+    index = ProjectLabelIndex.for_project(project)
+    assert ProjectLabelIndex.for_project(project) is index
+    assert index.get(new_label.name) is new_label
+    assert index.get('no-such-label') is None
+
+    label_a1, label_a2 = new_main_label.options
+    setattr(new_proposal.formlabels, new_main_label.name, label_a1.name)
+    setattr(new_proposal.formlabels, new_label.name, True)
+    assert getattr(new_proposal.formlabels, new_main_label.name) == label_a1.name
+    assert getattr(new_proposal.formlabels, new_label.name) is True
+    setattr(new_proposal.formlabels, new_main_label.name, label_a2.name)
+    assert label_a1 not in new_proposal.labels
+    with pytest.raises(ValueError):
+        setattr(new_proposal.formlabels, new_main_label.name, new_label.name)
+    with pytest.raises(AttributeError):
+        getattr(new_proposal.formlabels, 'no-such-label')
+
+    # Applying labels to a proposal does not discard the index
+    db_session.flush()
+    assert ProjectLabelIndex.for_project(project) is index
+    # Editing a label does
+    new_label.title = "Renamed Label"
+    db_session.flush()
+    assert ProjectLabelIndex.for_project(project) is not index
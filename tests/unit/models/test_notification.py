@@ -5,8 +5,10 @@ from sqlalchemy.exc import IntegrityError
 import pytest
 
 from funnel.models import (
+    NewUpdateNotification,
     Notification,
     NotificationPreferences,
+    NotificationTransportResolver,
     Organization,
     Profile,
     Project,
@@ -15,6 +17,7 @@ from funnel.models import (
     Rsvp,
     Update,
     User,
+    UserNotification,
     UserPhone,
     db,
     notification_categories,
@@ -258,6 +261,64 @@ def test_update_notification_structure(
     assert project_fixtures.user_bystander not in all_recipients
 
 
+@pytest.mark.parametrize('sql_roles', [False, True])
+def test_update_notification_dispatch_bulk(
+    notification_types, project_fixtures, update, db_session, sql_roles
+):
+    """Test that bulk dispatch assigns roles the same way as the iterator."""
+    project_fixtures.refresh()
+    if sql_roles:
+        # NewUpdateNotification resolves project roles in SQL
+        notification = NewUpdateNotification(update)
+    else:
+        # The test edition falls back to `actors_with`
+        notification = notification_types.TestNewUpdateNotification(update)
+    db_session.add(notification)
+    db_session.commit()
+
+    recipient_ids = notification.dispatch_bulk()
+    assert recipient_ids != []
+    # A second call to dispatch_bulk() will insert nothing
+    assert notification.dispatch_bulk() == []
+
+    role_users = {}
+    for un in UserNotification.query.filter_by(eventid=notification.eventid):
+        role_users.setdefault(un.role, set()).add(un.user)
+    assert role_users == {
+        'project_crew': {project_fixtures.user_owner, project_fixtures.user_editor},
+        'project_participant': {project_fixtures.user_participant},
+    }
+    assert set(recipient_ids) == {
+        project_fixtures.user_owner.id,
+        project_fixtures.user_editor.id,
+        project_fixtures.user_participant.id,
+    }
+
+
+def test_notification_transport_resolver(project_fixtures, update, db_session):
+    """Test that the batch resolver agrees with per-recipient transport checks."""
+    project_fixtures.refresh()
+    notification = NewUpdateNotification(update)
+    db_session.add(notification)
+    db_session.commit()
+    notification.dispatch_bulk()
+    db_session.commit()
+    user_notifications = UserNotification.query.filter_by(
+        eventid=notification.eventid
+    ).all()
+
+    resolver = NotificationTransportResolver.for_user_notifications(user_notifications)
+    db_session.commit()
+    # Main and per-type preferences were created for all recipients
+    for un in user_notifications:
+        assert set(un.user.notification_preferences) == {'', notification.type}
+
+    for un in user_notifications:
+        for transport in ('email', 'sms'):
+            assert resolver.has_transport(un, transport) == un.has_transport(transport)
+            assert resolver.transport_for(un, transport) == un.transport_for(transport)
+
+
 def test_user_notification_preferences(notification_types, db_session):
     """Test that users have a notification_preferences dict."""
     user = User(fullname="User")
@@ -318,3 +379,57 @@ def test_notification_preferences(
 
     # No user has any preferences saved at this point, so enquiries will result in
     # defaults
+
+
+def test_rollup_previous_batch(notification_types, project_fixtures, db_session):
+    """Test that batch rollup revokes earlier notifications in the same chain."""
+    project_fixtures.refresh()
+    proposals = [
+        Proposal(
+            user=project_fixtures.user_participant,
+            project=project_fixtures.project,
+            title=f"Proposal {number}",
+            body="Proposal body",
+        )
+        for number in range(3)
+    ]
+    notifications = [
+        notification_types.TestProposalReceivedNotification(
+            document=project_fixtures.project, fragment=proposal
+        )
+        for proposal in proposals
+    ]
+    db_session.add_all(proposals + notifications)
+    db_session.commit()
+    for notification in notifications:
+        notification.dispatch_bulk()
+    db_session.commit()
+
+    def editor_notification(notification):
+        return UserNotification.query.get(
+            (project_fixtures.user_editor.id, notification.eventid)
+        )
+
+    # The first notification starts a new rollup chain
+    UserNotification.rollup_previous_batch(
+        [editor_notification(notifications[0]).identity]
+    )
+    db_session.commit()
+    first = editor_notification(notifications[0])
+    assert first.rollupid is not None
+    assert not first.is_revoked
+
+    # The next two, processed in one batch, join the chain and revoke their
+    # predecessors in turn
+    UserNotification.rollup_previous_batch(
+        [
+            editor_notification(notifications[1]).identity,
+            editor_notification(notifications[2]).identity,
+        ]
+    )
+    db_session.commit()
+    first, second, third = (editor_notification(n) for n in notifications)
+    assert first.rollupid == second.rollupid == third.rollupid
+    assert first.is_revoked
+    assert second.is_revoked
+    assert not third.is_revoked
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 import pytest
 
 from coaster.utils import utcnow
-from funnel.models import Organization, ProjectRedirect, Proposal, Session
+from funnel.models import Organization, Project, ProjectRedirect, Proposal, Session
 
 
 def invalidate_cache(project):
@@ -297,3 +297,36 @@ def test_project_featured_proposal(db_session, user_twoflower, project_expo2010)
     db_session.commit()
 
     assert project_expo2010.has_featured_proposals is True
+
+
+def test_project_next_session_at(db_session, new_project):
+    """The next session timestamp is cached and refreshed as sessions pass."""
+    assert new_project.next_session_at is None
+    start_time_a = utcnow() + timedelta(hours=1)
+    start_time_b = start_time_a + timedelta(days=1)
+    for name, start_at in (('a', start_time_a), ('b', start_time_b)):
+        db_session.add(
+            Session(
+                name=f'test-session-{name}',
+                title=f"Test Session {name.upper()}",
+                project=new_project,
+                description="Test description",
+                is_break=False,
+                featured=False,
+                start_at=start_at,
+                end_at=start_at + timedelta(hours=1),
+            )
+        )
+    db_session.commit()
+    new_project.update_schedule_timestamps()
+    db_session.commit()
+    assert new_project.next_session_at == start_time_a
+
+    # Not refreshed until the next session has started
+    Project.refresh_next_session_at(start_time_a - timedelta(minutes=1))
+    db_session.commit()
+    assert new_project.next_session_at == start_time_a
+
+    Project.refresh_next_session_at(start_time_a + timedelta(minutes=1))
+    db_session.commit()
+    assert new_project.next_session_at == start_time_b
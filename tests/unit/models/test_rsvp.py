@@ -0,0 +1,22 @@
+from funnel.models import RSVP_STATUS, Rsvp, UserEmail, UserEmailClaim
+
+
+def test_rsvps_export(db_session, new_project, user_twoflower, user_rincewind):
+    """RSVP exports include an email address selected in the same query."""
+    db_session.add(UserEmailClaim(user=user_twoflower, email='twoflower@example.org'))
+    db_session.add(UserEmail(user=user_rincewind, email='rincewind@example.org'))
+    for user in (user_twoflower, user_rincewind):
+        rsvp = Rsvp(project=new_project, user=user)
+        rsvp.rsvp_yes()
+        db_session.add(rsvp)
+    db_session.commit()
+
+    rows = {
+        fullname: email
+        for fullname, email, created_at in new_project.rsvps_export(RSVP_STATUS.YES)
+    }
+    assert rows == {
+        "Twoflower": 'twoflower@example.org',
+        "Rincewind": 'rincewind@example.org',
+    }
+    assert new_project.rsvps_export(RSVP_STATUS.MAYBE).all() == []
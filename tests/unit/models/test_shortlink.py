@@ -374,3 +374,39 @@ def test_shortlink_lookup_multiple():
     assert shortlink.Shortlink.query.filter(
         shortlink.Shortlink.name.in_(['example', 'example_com', 'unknown'])
     ).all() == [sl1, sl2]
+
+
+def test_shortlink_new_many(db_session):
+    """Shortlinks can be made in bulk, in the order of the URLs."""
+    sl1 = shortlink.Shortlink.new('example.org')
+    links = shortlink.Shortlink.new_many(['example.com', 'example.org', 'example.com'])
+    assert [str(sl.url) for sl in links] == [
+        'https://example.com/',
+        'https://example.org/',
+        'https://example.com/',
+    ]
+    assert len({sl.id for sl in links}) == 3
+    assert sl1 not in links
+
+    reused = shortlink.Shortlink.new_many(
+        ['example.com', 'example.org', 'example.net', 'example.net'], reuse=True
+    )
+    assert reused[0] in links
+    assert reused[1] in (sl1, links[1])
+    assert reused[2] == reused[3]
+    assert str(reused[2].url) == 'https://example.net/'
+
+
+@pytest.mark.filterwarnings('ignore:New instance')
+def test_shortlink_new_many_handle_collisions(db_session):
+    """Bulk shortlinks retry only the ids that collided or were profane."""
+    prngids = MockRandomBigint(
+        [42, 128, shortlink.name_to_bigint('sexy'), 42, 384, 42, 512]
+    )
+    with patch('funnel.models.shortlink.random_bigint', wraps=prngids):
+        sl1 = shortlink.Shortlink.new('example.org')
+        assert sl1.id == 42
+        db_session.flush()
+        links = shortlink.Shortlink.new_many(['example.com', 'example.net'])
+    # 128 is used; 'sexy' is profane; 42 collides in the database; 384 is used
+    assert [sl.id for sl in links] == [128, 384]
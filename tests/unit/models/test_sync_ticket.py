@@ -136,3 +136,11 @@ class TestEventModels(unittest.TestCase):
         assert len(p2.ticket_events) == 0
         assert len(p3.ticket_events) == 0
         assert len(p4.ticket_events) == 1
+
+    def test_import_from_list_skips_unchanged(self):
+        assert self.ticket_client.import_from_list(ticket_list) == len(ticket_list)
+        # Unchanged tickets are not processed again
+        assert self.ticket_client.import_from_list(ticket_list) == 0
+        # Only the cancelled ticket has changed
+        assert self.ticket_client.import_from_list(ticket_list2) == 1
+        assert SyncTicket.query.count() == 3
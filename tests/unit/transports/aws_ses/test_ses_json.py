@@ -1,6 +1,17 @@
+from datetime import datetime, timedelta
+import base64
+import hashlib
 import json
 import os
 
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+from cryptography.hazmat.primitives.hashes import SHA1, SHA256
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509.oid import NameOID
+from redis.exceptions import ConnectionError as RedisConnectionError
 import pytest
 
 from funnel.transports.email.aws_ses import (
@@ -119,3 +130,83 @@ class TestSesEventJson:
         validator.check(message, SnsValidatorChecks.TOPIC)
         with pytest.raises(SnsValidatorError):
             validator.check(message, SnsValidatorChecks.SIGNATURE)
+
+
+class DictCache(dict):
+    """Stand-in for a Redis client, recording expiry."""
+
+    def set(self, key, value, ex=None):  # noqa: A003
+        self[key] = (value, ex)
+
+    def get(self, key):
+        return super().get(key, (None, None))[0]
+
+
+class UnavailableCache:
+    """Stand-in for a Redis client that can't connect."""
+
+    def set(self, key, value, ex=None):  # noqa: A003
+        raise RedisConnectionError("Redis is down")
+
+    def get(self, key):
+        raise RedisConnectionError("Redis is down")
+
+
+def make_certificate():
+    """Make a self-signed certificate valid for a day, returning the key and cert."""
+    key = rsa.generate_private_key(65537, 2048, default_backend())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'sns.amazonaws.com')])
+    now = datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(days=1))
+        .not_valid_after(now + timedelta(days=1))
+        .sign(key, SHA256(), default_backend())
+    )
+    return key, cert
+
+
+def test_signing_certificate_cache(tmp_path) -> None:
+    """Signing certificates are read from the cache folder and shared via cache."""
+    key, cert = make_certificate()
+    url = 'https://sns.ap-south-1.amazonaws.com/SimpleNotificationService-test.pem'
+    (tmp_path / (hashlib.sha256(url.encode()).hexdigest() + '.pem')).write_bytes(
+        cert.public_bytes(Encoding.PEM)
+    )
+    with open(os.path.join(TestSesEventJson.data_dir, 'full-message.json')) as file:
+        message = json.load(file)
+    message['SigningCertURL'] = url
+    message['Signature'] = base64.b64encode(
+        key.sign(
+            SnsValidator._get_text_to_sign(message).encode(),
+            PKCS1v15(),
+            SHA1(),  # noqa: S303
+        )
+    ).decode()
+
+    cache = DictCache()
+    validator = SnsValidator(cache=cache, cache_dir=str(tmp_path))
+    # The certificate is not fetched, so the signing URL need not exist
+    validator.check(message, SnsValidatorChecks.SIGNATURE)
+    value, ex = cache[f'sns/certificate/{url}']
+    assert value == cert.public_bytes(Encoding.PEM).decode()
+    assert 0 < ex <= 86400
+
+    # If the shared cache is unavailable, the cache folder is still used
+    validator = SnsValidator(cache=UnavailableCache(), cache_dir=str(tmp_path))
+    validator.check(message, SnsValidatorChecks.SIGNATURE)
+
+
+def test_signing_certificate_cache_dir_unwritable(tmp_path) -> None:
+    """A cache folder that can't be written to is skipped."""
+    _key, cert = make_certificate()
+    cache_dir = tmp_path / 'not-a-folder'
+    cache_dir.write_bytes(b'')
+    validator = SnsValidator(cache=DictCache(), cache_dir=str(cache_dir / 'certs'))
+    url = 'https://sns.ap-south-1.amazonaws.com/SimpleNotificationService-test.pem'
+    validator._save_certificate(url, cert.public_bytes(Encoding.PEM), cert)
+    assert list(tmp_path.iterdir()) == [cache_dir]
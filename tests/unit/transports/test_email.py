@@ -1,6 +1,11 @@
+from unittest.mock import patch
+
 from flask_mailman.message import sanitize_address
 
-from funnel.transports.email import process_recipient
+import pytest
+
+from funnel.transports.email import process_recipient, send
+from funnel.transports.email.send import render_alternatives
 
 
 def test_process_recipient():
@@ -42,3 +47,26 @@ def test_process_recipient():
         )
     )
     assert process_recipient(("", "example@example.com")) == 'example@example.com'
+
+
+def test_render_alternatives_cached():
+    """Identical content is only rendered once."""
+    render_alternatives.cache_clear()
+    content = '<html><body><p><a href="/page">Link</a></p></body></html>'
+    text, html = render_alternatives(content, 'https://example.com/')
+    assert 'https://example.com/page' in html
+    assert 'Link' in text
+    assert render_alternatives(content, 'https://example.com/') == (text, html)
+    assert render_alternatives.cache_info().hits == 1
+
+
+def test_email_batch_marks_sent_on_error():
+    """Addresses of messages sent before an error are still marked as sent."""
+    delivered = {1, 2}
+    with patch.object(send.EmailAddress, 'mark_sent_batch') as mark_sent_batch:
+        with pytest.raises(RuntimeError):
+            with patch.object(send.mail, 'get_connection'):
+                with send.EmailBatch() as batch:
+                    batch.email_address_ids.update(delivered)
+                    raise RuntimeError("Second message failed")
+    mark_sent_batch.assert_called_once_with(delivered)
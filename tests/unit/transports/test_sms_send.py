@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from flask import Response
 
@@ -8,6 +8,7 @@ import requests
 from funnel.transports import TransportConnectionError, TransportRecipientError
 from funnel.transports.sms import (
     OneLineTemplate,
+    SmsBatch,
     make_exotel_token,
     send,
     validate_exotel_token,
@@ -85,6 +86,20 @@ def test_exotel_send_error(client):
     """Only tests if url_for works and usually fails otherwise, which is OK."""
     # Check False Path via monkey patching the requests object
     with pytest.raises(TransportConnectionError):
-        with patch.object(requests, 'post') as mock_method:
+        with patch.object(requests.Session, 'post') as mock_method:
             mock_method.side_effect = requests.ConnectionError
             send(EXOTEL_TO, MESSAGE, callback=True)
+
+
+def test_sms_batch_results():
+    """A batch reports a result per message, continuing past failures."""
+    response = MagicMock(status_code=200)
+    response.json.return_value = {'SMSMessage': {'Sid': 'exotel-sid'}}
+    with patch.object(requests.Session, 'post', return_value=response) as mock_method:
+        with SmsBatch(callback=False) as batch:
+            results = batch.send_many(
+                [(EXOTEL_TO, MESSAGE), ('12345', MESSAGE), (EXOTEL_TO, MESSAGE)]
+            )
+    assert [r.transactionid for r in results] == ['exotel-sid', None, 'exotel-sid']
+    assert isinstance(results[1].error, TransportRecipientError)
+    assert mock_method.call_count == 2
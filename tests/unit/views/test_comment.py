@@ -0,0 +1,82 @@
+"""Tests for the cached comment tree."""
+
+from funnel import app, redis_store
+from funnel.views.comment import (
+    comment_tree,
+    comment_tree_for_viewer,
+    comment_tree_generation_key,
+    comment_tree_page,
+)
+
+
+def get_generation(commentset):
+    return int(redis_store.get(comment_tree_generation_key(commentset.id)) or 0)
+
+
+def test_comment_tree(db_session, new_project, new_user, new_user2):
+    """Comment trees are shared across viewers, with URLs for the comment's author."""
+    commentset = new_project.commentset
+    generation = get_generation(commentset)
+    first = commentset.post_comment(new_user, "First comment")
+    db_session.commit()
+    second = commentset.post_comment(new_user2, "Second comment")
+    db_session.commit()
+    assert get_generation(commentset) == generation + 2
+
+    with app.test_request_context():
+        tree = comment_tree(commentset)
+        assert [node['uuid_b58'] for node in tree] == [
+            second.uuid_b58,
+            first.uuid_b58,
+        ]
+        anonymous = comment_tree_for_viewer(tree, None)
+        author = comment_tree_for_viewer(tree, new_user.id)
+    assert 'edit' not in anonymous[1]['urls']
+    assert 'edit' in author[1]['urls']
+    assert 'edit' not in author[0]['urls']
+    assert '_author_id' not in author[1]
+
+    first.mark_spam()
+    db_session.rollback()
+    assert get_generation(commentset) == generation + 2
+    first.mark_spam()
+    db_session.commit()
+    assert get_generation(commentset) == generation + 3
+
+
+def test_commentset_json_pages(client, db_session, new_project, new_user):
+    """Top-level threads can be fetched in pages."""
+    commentset = new_project.commentset
+    for index in range(3):
+        commentset.post_comment(new_user, f"Comment {index}")
+        db_session.commit()
+    url = f'/comments/{commentset.uuid_b58}'
+    headers = {'X-Requested-With': 'XMLHttpRequest'}
+    page1 = client.get(url + '?limit=2', headers=headers).get_json()
+    assert len(page1['comments']) == 2
+    assert page1['next_cursor'] is not None
+    page2 = client.get(
+        url + '?limit=2&cursor=' + page1['next_cursor'], headers=headers
+    ).get_json()
+    assert len(page2['comments']) == 1
+    assert page2['next_cursor'] is None
+    everything = client.get(url, headers=headers).get_json()
+    assert everything['comments'] == page1['comments'] + page2['comments']
+
+
+def test_comment_tree_page_resumes(db_session, new_project, new_user):
+    """A page resumes at its position even if the last thread was removed."""
+    commentset = new_project.commentset
+    for index in range(3):
+        commentset.post_comment(new_user, f"Comment {index}")
+        db_session.commit()
+    with app.test_request_context():
+        tree = comment_tree(commentset)
+    page1, cursor = comment_tree_page(tree, None, 2)
+    assert [node['uuid_b58'] for node in page1] == [
+        node['uuid_b58'] for node in tree[:2]
+    ]
+    # The last thread in the first page is gone from the next version of the tree
+    page2, next_cursor = comment_tree_page([tree[0], tree[2]], cursor, 2)
+    assert [node['uuid_b58'] for node in page2] == [tree[2]['uuid_b58']]
+    assert next_cursor is None
@@ -0,0 +1,35 @@
+"""Tests for view decorators."""
+
+from funnel import redis_store
+from funnel.views.decorators import (
+    etag_cache_generation_key,
+    etag_cache_invalidate_for_users,
+)
+
+
+def test_etag_cache_invalidate_on_commit(db_session, user_twoflower):
+    """Cache generation changes only when the transaction is committed."""
+    key = etag_cache_generation_key(user_twoflower.id)
+    generation = int(redis_store.get(key) or 0)
+
+    etag_cache_invalidate_for_users(db_session, [user_twoflower.id])
+    db_session.rollback()
+    assert int(redis_store.get(key) or 0) == generation
+
+    etag_cache_invalidate_for_users(db_session, [user_twoflower.id])
+    db_session.commit()
+    assert int(redis_store.get(key) or 0) == generation + 1
+
+
+def test_etag_cache_invalidate_skips_savepoint(db_session, user_twoflower):
+    """Releasing a savepoint does not invalidate the cache before the real commit."""
+    key = etag_cache_generation_key(user_twoflower.id)
+    generation = int(redis_store.get(key) or 0)
+
+    db_session.begin_nested()
+    etag_cache_invalidate_for_users(db_session, [user_twoflower.id])
+    db_session.commit()
+    assert int(redis_store.get(key) or 0) == generation
+
+    db_session.commit()
+    assert int(redis_store.get(key) or 0) == generation + 1
@@ -0,0 +1,68 @@
+"""Tests for queued processing of SES events."""
+
+import os
+
+from funnel import redis_store
+from funnel.models import EmailAddress
+from funnel.views.api.email_events import (
+    process_ses_event_queue,
+    queue_ses_event,
+    ses_event_failed_key,
+    ses_event_lock_key,
+    ses_event_queue_key,
+)
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), 'transports', 'aws_ses', 'data'
+)
+
+
+def read_event(filename):
+    with open(os.path.join(DATA_DIR, filename)) as file:
+        return file.read()
+
+
+def test_ses_event_queue(db_session):
+    """Queued events are applied to email addresses in bulk."""
+    redis_store.delete(ses_event_queue_key)
+    redis_store.rpush(
+        ses_event_queue_key, read_event('delivery.json'), read_event('bounce.json')
+    )
+    assert process_ses_event_queue() == 2
+    assert not redis_store.exists(ses_event_queue_key)
+
+    delivered = EmailAddress.get('test@example.com')
+    assert delivered is not None
+    assert delivered.delivery_state.SENT
+    bounced = EmailAddress.get('bounce@simulator.amazonses.com')
+    assert bounced is not None
+    assert bounced.delivery_state.HARD_FAIL
+
+    # Nothing left to process
+    assert process_ses_event_queue() == 0
+
+
+def test_ses_event_queue_failed(db_session):
+    """Events that can't be processed are set aside without holding up the queue."""
+    redis_store.delete(ses_event_queue_key, ses_event_failed_key)
+    queue_ses_event('{"invalid": ')
+    queue_ses_event(read_event('delivery.json'))
+    assert process_ses_event_queue() == 2
+    assert not redis_store.exists(ses_event_queue_key)
+    assert redis_store.lrange(ses_event_failed_key, 0, -1) == ['{"invalid": ']
+    assert EmailAddress.get('test@example.com').delivery_state.SENT
+    redis_store.delete(ses_event_failed_key)
+
+
+def test_ses_event_queue_locked(db_session):
+    """Overlapping runs don't process the queue."""
+    redis_store.delete(ses_event_queue_key)
+    queue_ses_event(read_event('delivery.json'))
+    lock = redis_store.lock(ses_event_lock_key, timeout=10)
+    assert lock.acquire()
+    try:
+        assert process_ses_event_queue() == 0
+        assert redis_store.llen(ses_event_queue_key) == 1
+    finally:
+        lock.release()
+    assert process_ses_event_queue() == 1
@@ -1,9 +1,11 @@
-from base64 import urlsafe_b64decode
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
 from unittest.mock import patch
 from urllib.parse import urlsplit
+from uuid import uuid4
 
 from flask import Flask
+from werkzeug.exceptions import BadRequest
 from werkzeug.routing import BuildError
 
 from furl import furl
@@ -15,8 +17,11 @@ from funnel.views.helpers import (
     app_url_for,
     cleanurl_filter,
     compress,
+    csv_response,
+    decode_cursor,
     decompress,
     delete_cached_token,
+    encode_cursor,
     make_cached_token,
     retrieve_cached_token,
 )
@@ -168,3 +173,42 @@ def test_compress_decompress():
     sample = b"This is a sample string to be compressed."
     for algorithm in ('gzip', 'deflate', 'br'):
         assert decompress(compress(sample, algorithm), algorithm) == sample
+
+
+def test_encode_decode_cursor():
+    """Keyset cursors survive a round trip through an opaque token."""
+    values = [0.1, datetime(2020, 1, 2, 3, 4, 5, 678901), utc.localize(datetime.now())]
+    values.extend([uuid4(), 42, 'text'])
+    cursor = encode_cursor(values)
+    assert isinstance(cursor, str)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == values
+
+
+@pytest.mark.parametrize(
+    'cursor', ['not-a-cursor', urlsafe_b64encode(b'{"a":1}').decode()]
+)
+def test_decode_cursor_invalid(cursor):
+    """Malformed keyset cursors are rejected with a 400 error."""
+    with app.test_request_context(), pytest.raises(BadRequest):
+        decode_cursor(cursor)
+
+
+def test_csv_response():
+    """CSV responses are streamed in chunks of rows."""
+    with app.test_request_context():
+        response = csv_response(
+            ['name', 'count'],
+            ([f'row{i}', i] for i in range(5)),
+            filename='test',
+            chunk_size=2,
+        )
+        assert response.is_streamed
+        assert response.headers['Content-Disposition'] == (
+            'attachment;filename="test.csv"'
+        )
+        chunks = list(response.response)
+    assert len(chunks) == 3
+    assert ''.join(chunks) == (
+        'name,count\r\nrow0,0\r\nrow1,1\r\nrow2,2\r\nrow3,3\r\nrow4,4\r\n'
+    )
@@ -0,0 +1,43 @@
+"""Tests for user session access recording."""
+
+from datetime import timedelta
+
+from coaster.utils import utcnow
+from funnel import redis_store
+from funnel.models import UserSession
+from funnel.views.login_session import (
+    flush_user_session_access,
+    record_user_session_access,
+    user_session_access_flush_key,
+    user_session_access_key,
+)
+
+
+def test_user_session_access_write_behind(db_session, user_twoflower):
+    """Repeated accesses are recorded in Redis and flushed as a single update."""
+    redis_store.delete(user_session_access_key, user_session_access_flush_key)
+    accessed_at = utcnow() - timedelta(days=1)
+    user_session = UserSession(
+        user=user_twoflower,
+        ipaddr='192.168.1.1',
+        user_agent='test-agent/1',
+        accessed_at=accessed_at,
+    )
+    db_session.add(user_session)
+    db_session.commit()
+
+    record_user_session_access(user_session, '192.168.1.2', 'test-agent/2')
+    record_user_session_access(user_session, '192.168.1.3', 'test-agent/3')
+    assert redis_store.hlen(user_session_access_key) == 1
+    # Not written to the database until flushed
+    assert user_session.accessed_at == accessed_at
+
+    assert flush_user_session_access() == 1
+    assert user_session.accessed_at > accessed_at
+    assert user_session.ipaddr == '192.168.1.3'
+    assert user_session.user_agent == 'test-agent/3'
+    assert not redis_store.exists(user_session_access_key)
+    assert not redis_store.exists(user_session_access_flush_key)
+
+    # Nothing left to flush
+    assert flush_user_session_access() == 0
@@ -0,0 +1,47 @@
+"""Tests for unread notification counters."""
+
+from funnel import redis_store
+from funnel.models import NewUpdateNotification, Update, UserNotification
+from funnel.views.notification_feed import (
+    notification_unread_count,
+    notification_unread_key,
+    reconcile_notification_unread_counts,
+)
+
+
+def test_notification_unread_counter(db_session, user_vetinari, project_expo2010):
+    """Unread counters follow dispatch and reads, and are corrected when they drift."""
+    redis_store.hdel(notification_unread_key, user_vetinari.id)
+    assert notification_unread_count(user_vetinari) == 0
+    assert redis_store.hget(notification_unread_key, user_vetinari.id) == '0'
+
+    update = Update(
+        project=project_expo2010,
+        user=user_vetinari,
+        title="New update",
+        body="New update body",
+    )
+    db_session.add(update)
+    db_session.commit()
+    update.publish(user_vetinari)
+    notification = NewUpdateNotification(update)
+    db_session.add(notification)
+    db_session.commit()
+    recipient_ids = notification.dispatch_bulk()
+    db_session.commit()
+    assert user_vetinari.id in recipient_ids
+    assert notification_unread_count(user_vetinari) == 1
+
+    user_notification = UserNotification.query.get(
+        (user_vetinari.id, notification.eventid)
+    )
+    user_notification.is_read = True
+    db_session.rollback()
+    assert notification_unread_count(user_vetinari) == 1
+    user_notification.is_read = True
+    db_session.commit()
+    assert notification_unread_count(user_vetinari) == 0
+
+    redis_store.hset(notification_unread_key, user_vetinari.id, 5)
+    assert reconcile_notification_unread_counts() >= 1
+    assert notification_unread_count(user_vetinari) == 0
@@ -0,0 +1,47 @@
+"""Tests for cached project listings."""
+
+from funnel import redis_store
+from funnel.views.project_listing import (
+    project_listing_generation_key,
+    project_listing_scope,
+)
+
+
+def get_generation(scope):
+    return int(redis_store.get(project_listing_generation_key(scope)) or 0)
+
+
+def test_project_listing_scope(db_session, new_organization):
+    assert project_listing_scope() == 'site'
+    assert (
+        project_listing_scope(new_organization.profile)
+        == f'profile/{new_organization.profile.id}'
+    )
+
+
+def test_project_listing_invalidated(db_session, new_project):
+    """Changes to a project invalidate the home page and profile listings."""
+    profile_scope = project_listing_scope(new_project.profile)
+    site_generation = get_generation('site')
+    profile_generation = get_generation(profile_scope)
+
+    new_project.title = "Renamed Project"
+    db_session.rollback()
+    assert get_generation('site') == site_generation
+    assert get_generation(profile_scope) == profile_generation
+
+    new_project.title = "Renamed Project"
+    db_session.commit()
+    assert get_generation('site') == site_generation + 1
+    assert get_generation(profile_scope) == profile_generation + 1
+
+
+def test_index_anonymous(client, db_session, new_project):
+    """The home page renders from cache for anonymous users."""
+    new_project.publish()
+    db_session.commit()
+    first = client.get('/')
+    assert first.status_code == 200
+    second = client.get('/')
+    assert second.status_code == 200
+    assert second.data == first.data
@@ -11,12 +11,21 @@ from flask import url_for
 import pytest
 
 from funnel import app
+from funnel.models import SearchDocument
+from funnel.views import search
+from funnel.views.helpers import encode_cursor
 from funnel.views.search import (
     Query,
     SearchInProfileProvider,
     SearchInProjectProvider,
+    paginate_with_total,
+    refresh_search_documents,
+    round_magnitude,
+    search_cache_key,
     search_counts,
+    search_document_counts,
     search_providers,
+    search_scope,
 )
 
 search_all_types = list(search_providers.keys())
@@ -76,6 +85,46 @@ def test_search_project_returns_query(stype, project_expo2010, all_fixtures):
     )
 
 
+@pytest.mark.parametrize(
+    ('count', 'rounded'),
+    [(0, 0), (7, 7), (10, 10), (1000, 1000), (1999, 1000), (52341, 50000)],
+)
+def test_round_magnitude(count, rounded):
+    """Estimated counts are rounded down to their most significant digit."""
+    assert round_magnitude(count) == rounded
+
+
+@pytest.mark.parametrize('stype', search_all_types)
+def test_search_count_is_exact(stype):
+    """Counts under the cap are always exact; counts at the cap depend on strategy."""
+    sp = search_providers[stype]
+    assert sp.count_is_exact(sp.count_cap - 1) is True
+    assert sp.count_is_exact(sp.count_cap) is (sp.count_strategy == 'exact')
+
+
+def test_estimated_count_under_cap(monkeypatch, db_session, project_expo2010):
+    """Estimates over the cap are not rounded below it."""
+    sp = search_providers['comment']
+    monkeypatch.setattr(sp, 'count_strategy', 'estimate')
+    monkeypatch.setattr(sp, 'count_cap', 1500)
+    monkeypatch.setattr(search, 'estimated_count', lambda query: 1800)
+    count = sp.count(sp.project_query("test", project_expo2010))
+    assert count == 1500
+    assert sp.count_is_exact(count) is False
+
+
+def test_paginate_with_inexact_total(db_session, project_expo2010, all_fixtures):
+    """An inexact total does not advertise pages that don't exist."""
+    query = search_providers['project'].all_query("test")
+    actual = query.order_by(None).count()
+    with app.test_request_context():
+        pagination = paginate_with_total(query, 1, 1, actual + 100, exact=False)
+    assert pagination.has_next is (actual > 1)
+    assert pagination.pages == (2 if actual > 1 else 1)
+    if actual <= 1:
+        assert pagination.total == actual
+
+
 # --- Test search functions ------------------------------------------------------------
 
 
@@ -92,6 +141,65 @@ def test_search_counts(org_ankhmorpork, project_expo2010, all_fixtures):
                 assert 'type' in typeset
                 assert 'label' in typeset
                 assert 'count' in typeset
+                assert 'exact' in typeset
+
+
+def test_search_cache_key_generation(db_session, project_expo2010, all_fixtures):
+    """Search cache keys change when a searchable model is committed."""
+    scope = search_scope(project=project_expo2010)
+    assert scope != search_scope(profile=project_expo2010.profile)
+    assert scope != search_scope()
+    key1 = search_cache_key("test", scope)
+    assert search_cache_key("test", scope) == key1
+    assert search_cache_key("other", scope) != key1
+    project_expo2010.title = "Expo 2010 (renamed)"
+    db_session.commit()
+    assert search_cache_key("test", scope) != key1
+
+
+def test_search_document_refresh(
+    monkeypatch, db_session, project_expo2010, all_fixtures
+):
+    """Search documents are refreshed when a searchable object is written."""
+    project_expo2010.title = "Expo 2010 (renamed)"
+    db_session.commit()
+    assert SearchDocument.query.get(('project', project_expo2010.id)) is None
+
+    queued = []
+    monkeypatch.setitem(app.config, 'SEARCH_DOCUMENTS', True)
+    monkeypatch.setattr(
+        refresh_search_documents, 'queue', lambda *args: queued.append(args)
+    )
+    project_expo2010.title = "Expo 2010 (renamed again)"
+    db_session.commit()
+    document = SearchDocument.query.get(('project', project_expo2010.id))
+    assert document is not None
+    assert document.profile_id == project_expo2010.profile_id
+    assert document.project_id == project_expo2010.id
+    assert document.title == "Expo 2010 (renamed again)"
+    assert queued == []
+
+    # Documents within the project are refreshed in the background when its
+    # visibility changes
+    project_expo2010.publish()
+    db_session.commit()
+    assert queued == [([], [project_expo2010.id])]
+
+
+def test_search_document_counts(
+    monkeypatch, org_ankhmorpork, project_expo2010, all_fixtures
+):
+    """Search counts can be sourced from search documents."""
+    r1 = search_document_counts("test")
+    r2 = search_document_counts("test", profile=org_ankhmorpork.profile)
+    r3 = search_document_counts("test", project=project_expo2010)
+    assert list(r1) == search_all_types
+    assert list(r2) == search_profile_types
+    assert list(r3) == search_project_types
+    monkeypatch.setitem(app.config, 'SEARCH_DOCUMENTS', True)
+    with app.test_request_context():
+        for typeset in search_counts("test", project=project_expo2010):
+            assert typeset['exact'] is True
 
 
 # --- Test views -----------------------------------------------------------------------
@@ -175,3 +283,30 @@ def test_view_search_results_project(client, project_expo2010, stype, all_fixtur
         assert 'label' in countset
         assert 'count' in countset
     assert 'results' in resultset
+
+
+@pytest.mark.parametrize('stype', search_all_types)
+def test_view_search_results_cursor(client, stype, all_fixtures):
+    """Global search view returns keyset-paginated results when given a cursor."""
+    resultset = client.get(
+        url_for('SearchView_search'),
+        query_string={'q': "test", 'type': stype, 'cursor': ''},
+        headers={'Accept': 'application/json'},
+    ).get_json()
+    assert 'results' in resultset
+    assert 'items' in resultset['results']
+    assert 'next_cursor' in resultset['results']
+    assert 'count' not in resultset['results']
+
+
+@pytest.mark.parametrize(
+    'values', [["rank", "2021-01-01", 1], [0.5, {'$dt': '2021-01-01T00:00:00'}, "1"]]
+)
+def test_view_search_results_cursor_mistyped(client, values):
+    """A cursor with values of the wrong type is rejected with a 400 error."""
+    rv = client.get(
+        url_for('SearchView_search'),
+        query_string={'q': "test", 'type': 'project', 'cursor': encode_cursor(values)},
+        headers={'Accept': 'application/json'},
+    )
+    assert rv.status_code == 400
@@ -1,11 +1,37 @@
 """Test shortlink views."""
 
 from urllib.parse import urlsplit
+import time
 
+from redis.exceptions import ConnectionError as RedisConnectionError
 import pytest
 
-from funnel import shortlinkapp
-from funnel.models import Shortlink
+from funnel import redis_store, shortlinkapp
+from funnel.models import Shortlink, ShortlinkClickCount
+from funnel.views.shortlink import (
+    count_shortlink_clicks,
+    local_shortlink_cache,
+    record_shortlink_click,
+    shortlink_cache_key,
+    shortlink_cache_value,
+    shortlink_click_lock_key,
+    shortlink_click_stream,
+)
+
+
+def clear_shortlink_cache():
+    keys = list(redis_store.scan_iter('shortlink/*'))
+    if keys:
+        redis_store.delete(*keys)
+    local_shortlink_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def _shortlink_cache():
+    """Remove shortlinks cached by other tests, as Redis is not rolled back."""
+    clear_shortlink_cache()
+    yield
+    clear_shortlink_cache()
 
 
 @pytest.fixture
@@ -36,6 +62,39 @@ def test_shortlink_301(db_session, shortlink_client):
     assert rv.headers['Referrer-Policy'] == 'unsafe-url'
 
 
+def test_shortlink_redis_unavailable(monkeypatch, db_session, shortlink_client):
+    """Shortlinks are served from the database if Redis is unavailable."""
+
+    def unavailable(*args, **kwargs):
+        raise RedisConnectionError("Redis is down")
+
+    db_session.add(Shortlink.new('https://example.com/', name='example'))
+    db_session.commit()
+    local_shortlink_cache.clear()
+    monkeypatch.setattr(redis_store, 'get', unavailable)
+    monkeypatch.setattr(redis_store, 'xadd', unavailable)
+    rv = shortlink_client.get('/example')
+    assert rv.status_code == 301
+    assert rv.location == 'https://example.com/'
+    assert shortlink_client.get('/missing').status_code == 404
+
+
+def test_shortlink_redis_read_only(monkeypatch, db_session, shortlink_client):
+    """Shortlinks are served if Redis fails when caching a database read."""
+
+    def unavailable(*args, **kwargs):
+        raise RedisConnectionError("Redis is down")
+
+    db_session.add(Shortlink.new('https://example.com/', name='example'))
+    db_session.commit()
+    clear_shortlink_cache()
+    monkeypatch.setattr(redis_store, 'set', unavailable)
+    rv = shortlink_client.get('/example')
+    assert rv.status_code == 301
+    assert rv.location == 'https://example.com/'
+    assert shortlink_client.get('/missing').status_code == 404
+
+
 def test_shortlink_410(db_session, shortlink_client):
     sl = Shortlink.new('https://example.com/', name='example')
     sl.enabled = False
@@ -43,3 +102,82 @@ def test_shortlink_410(db_session, shortlink_client):
     db_session.commit()
     rv = shortlink_client.get('/example')
     assert rv.status_code == 410
+
+
+def test_shortlink_cache_invalidated(db_session, shortlink_client):
+    """Disabling a cached shortlink takes effect immediately in this process."""
+    sl = Shortlink.new('https://example.com/', name='example')
+    db_session.add(sl)
+    db_session.commit()
+    assert shortlink_client.get('/example').status_code == 301
+    assert shortlink_client.get('/example').status_code == 301
+    sl.enabled = False
+    db_session.commit()
+    assert shortlink_client.get('/example').status_code == 410
+
+
+def test_shortlink_new_many_cached(db_session):
+    """Shortlinks made in bulk are cached after commit."""
+    links = Shortlink.new_many(['https://example.com/', 'https://example.org/'])
+    db_session.commit()
+    for sl in links:
+        assert redis_store.get(shortlink_cache_key(sl.id)) == shortlink_cache_value(sl)
+
+
+def test_shortlink_cached_after_outer_commit(db_session):
+    """A shortlink is not cached when its savepoint is released, only on commit."""
+    sl = Shortlink.new('https://example.com/', name='example')
+    assert redis_store.get(shortlink_cache_key(sl.id)) is None
+    db_session.commit()
+    assert redis_store.get(shortlink_cache_key(sl.id)) == shortlink_cache_value(sl)
+
+
+def test_shortlink_clicks_counted(db_session):
+    """Recorded clicks are added to hourly counts."""
+    redis_store.delete(shortlink_click_stream)
+    sl = Shortlink.new('https://example.com/', name='example')
+    db_session.add(sl)
+    db_session.commit()
+    for _i in range(3):
+        record_shortlink_click(
+            sl.id, time.time(), 'https://example.org/page', 'test-agent', ''
+        )
+    assert count_shortlink_clicks() == 3
+    click_count = ShortlinkClickCount.query.filter_by(shortlink=sl).one()
+    assert click_count.count == 3
+    assert click_count.referrer == 'example.org'
+    assert click_count.country == ''
+    assert not redis_store.xlen(shortlink_click_stream)
+
+
+def test_shortlink_clicks_locked(db_session):
+    """Overlapping runs don't count the same clicks."""
+    redis_store.delete(shortlink_click_stream)
+    sl = Shortlink.new('https://example.com/', name='example')
+    db_session.commit()
+    record_shortlink_click(sl.id, time.time(), '', 'test-agent', '')
+    lock = redis_store.lock(shortlink_click_lock_key, timeout=10)
+    assert lock.acquire()
+    try:
+        assert count_shortlink_clicks() == 0
+        assert redis_store.xlen(shortlink_click_stream) == 1
+    finally:
+        lock.release()
+    assert count_shortlink_clicks() == 1
+
+
+def test_shortlink_clicks_malformed_referrer(db_session):
+    """A malformed referrer doesn't hold up counting."""
+    redis_store.delete(shortlink_click_stream)
+    sl = Shortlink.new('https://example.com/', name='example')
+    db_session.add(sl)
+    db_session.commit()
+    record_shortlink_click(sl.id, time.time(), 'http://[', 'test-agent', '')
+    redis_store.xadd(shortlink_click_stream, {'id': 'invalid'})
+    record_shortlink_click(sl.id, time.time(), 'https://example.org/', 'test-agent', '')
+    assert count_shortlink_clicks() == 3
+    assert {
+        click_count.referrer: click_count.count
+        for click_count in ShortlinkClickCount.query.filter_by(shortlink=sl)
+    } == {'': 1, 'example.org': 1}
+    assert not redis_store.xlen(shortlink_click_stream)